@@ -8,4 +8,7 @@ set -e
 python manage.py migrate
 python manage.py collectstatic --noinput
 
-gunicorn --bind 0.0.0.0:8000 -w 4 --limit-request-line 6094 --access-logfile - src.wsgi:application
+# share the metrics of all gunicorn workers
+export PROMETHEUS_MULTIPROC_DIR=$(mktemp -d)
+
+gunicorn --bind 0.0.0.0:8000 -w 4 -k gthread --threads 8 --limit-request-line 6094 --access-logfile - src.wsgi:application
@@ -5,10 +5,16 @@ from datetime import datetime
 import collections, functools, itertools, operator
 import re
 
-from django.db.models import Q
+from django.db.models import Min, Q
 
+from rest_framework.exceptions import ValidationError
 from rest_framework.response import Response
 
+from src.api.models import Node
+
+# Value of the 'percentile' filter that selects the entries of all stored percentiles
+ALL_PERCENTILES = 'all'
+
 def map_groups(groups):
     return map(
         # Searches for group names in a list separated by commas
@@ -17,6 +23,42 @@ def map_groups(groups):
     )
 
 
+class DataVersionMixin:
+    """
+    Delta sync of the RKI data. With 'since' (a data version or a day, YYYY-MM-DD) only the entries added or revised
+    after that version, or the days after that day, are returned. The X-Data-Version header holds the data version of
+    the response, which clients pass as 'since' on their next sync.
+    """
+    cached_headers = ('X-Data-Version',)
+
+    def filter_since(self, queryset, rki_nodes):
+        """Filters the queryset by 'since', the data version of the response is the lowest one of the rki_nodes."""
+        # the version and the entries are read from the same database, a lagging replica would skip entries otherwise
+        db = queryset.db
+        queryset = queryset.using(db)
+        # read before the entries, so entries of a running import are synced again with the next version
+        self.data_version = rki_nodes.using(db).aggregate(version=Min('version'))['version']
+
+        since = self.request.query_params.get('since', None)
+        if since is None:
+            return queryset
+
+        if since.isdigit():
+            return queryset.filter(version__gt=int(since))
+
+        try:
+            return queryset.filter(day__gt=datetime.strptime(since, "%Y-%m-%d"))
+        except ValueError:
+            raise ValidationError({'since': 'Expected a data version or a day (YYYY-MM-DD).'})
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        version = getattr(self, 'data_version', None)
+        if version is not None and not response.has_header('X-Data-Version'):
+            response['X-Data-Version'] = str(version)
+
+        return super().finalize_response(request, response, *args, **kwargs)
+
+
 class DataEntryFilterMixin:
 
     def extract_filters(self, values):
@@ -67,10 +109,24 @@ class DataEntryFilterMixin:
     def get_serializer_context(self):
         return {**super().get_serializer_context(), **self.get_filter_context()}
 
+    def filter_regions(self, queryset):
+        """
+        Restricts the queryset to region nodes (e.g. federal states) if 'regions' is requested,
+        otherwise to regular nodes.
+        """
+        regions = Node.objects.filter(members__isnull=False)
+
+        if 'regions' in self.request.query_params:
+            return queryset.filter(node__in=regions)
+
+        return queryset.exclude(node__in=regions)
+
     def get_filtered_queryset(self, queryset):
         context = self.get_filter_context()
 
-        queryset = queryset.filter(percentile=context.get('percentile', 50))
+        percentile = context.get('percentile', 50)
+        if percentile != ALL_PERCENTILES:
+            queryset = queryset.filter(percentile=percentile)
 
         groups = context.get('groups', None)
         if groups is not None:
@@ -112,6 +168,9 @@ class DataEntryFilterMixin:
         return queryset
 
     def aggregateBy(self, field):
+        if self.get_filter_context().get('percentile') == ALL_PERCENTILES:
+            return self.aggregateBandsBy(field)
+
         data = self.paginate_queryset(self.get_queryset())
         serializer = self.get_serializer(data, many=True)
 
@@ -130,6 +189,42 @@ class DataEntryFilterMixin:
 
         return self.get_paginated_response(reduced)
 
+    def aggregateBandsBy(self, field):
+        """
+        Aggregates the entries of all stored percentiles in one pass. Every compartment value becomes
+        an array holding one value per percentile, in the order given by 'percentiles' (None if there is no entry).
+        Pages hold whole bands: the keys of the bands (days or nodes) are paginated, not the entries.
+        """
+        queryset = self.get_queryset()
+        column = 'node_name' if field == 'name' else field
+
+        if 'all' not in self.request.query_params:
+            keys = queryset.order_by(column).values_list(column, flat=True).distinct()
+            queryset = queryset.filter(**{'{}__in'.format(column): list(self.paginate_queryset(keys))})
+
+        data = list(queryset.order_by(column, 'percentile'))
+        serializer = self.get_serializer(data, many=True)
+
+        percentiles = self.get_band_percentiles(queryset)
+        index = {percentile: i for i, percentile in enumerate(percentiles)}
+
+        bands = {}
+
+        for instance, entry in zip(data, serializer.data):
+            band = bands.setdefault(entry[field], dict(entry, percentiles=percentiles, compartments={}))
+            i = index.get(instance.percentile)
+            if i is None:
+                continue
+            for compartment, value in entry['compartments'].items():
+                values = band['compartments'].setdefault(compartment, [None] * len(percentiles))
+                values[i] = value if values[i] is None else values[i] + value
+
+        return self.get_paginated_response(list(bands.values()))
+
+    def get_band_percentiles(self, queryset):
+        """Returns the percentiles of the bands, the same for every page."""
+        return list(queryset.order_by('percentile').values_list('percentile', flat=True).distinct())
+
     def paginate_queryset(self, queryset):
         if 'all' in self.request.query_params:
             return queryset
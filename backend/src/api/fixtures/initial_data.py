@@ -407,6 +407,27 @@ NODES = [
 ]
 
 
+# Federal states, keyed by the prefix of the AGS key of their counties
+STATES = [
+    ("01", "Schleswig-Holstein"),
+    ("02", "Hamburg"),
+    ("03", "Niedersachsen"),
+    ("04", "Bremen"),
+    ("05", "Nordrhein-Westfalen"),
+    ("06", "Hessen"),
+    ("07", "Rheinland-Pfalz"),
+    ("08", "Baden-Württemberg"),
+    ("09", "Bayern"),
+    ("10", "Saarland"),
+    ("11", "Berlin"),
+    ("12", "Brandenburg"),
+    ("13", "Mecklenburg-Vorpommern"),
+    ("14", "Sachsen"),
+    ("15", "Sachsen-Anhalt"),
+    ("16", "Thüringen")
+]
+
+
 RESTRICTIONS = [
     ("restriction_1", "Restriction 1"),
     ("restriction_2", "Restriction 2"),
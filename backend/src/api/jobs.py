@@ -0,0 +1,199 @@
+# SPDX-FileCopyrightText: 2024 German Aerospace Center (DLR)
+# SPDX-License-Identifier: Apache-2.0
+
+"""
+Phases and progress of the import commands.
+
+Importers split their work into phases and report steps within them. When they run as an ImportJob (option --job),
+the current phase, its progress and the timings of finished phases are written to the job, and a job that is being
+cancelled stops the import at its next update.
+
+The timings of a phase break its time down into database queries (by statement and table, with their row counts),
+other timed work such as reading HDF5 files (see Progress.timer) and the remaining Python code. Commands with
+ProgressMixin write them as a JSON report (--report) and push them to the Prometheus Pushgateway after every phase
+(--push-metrics, see METRICS_PUSHGATEWAY).
+"""
+import contextlib
+import json
+import re
+import sys
+import time
+
+from django.core.management.base import CommandError, OutputWrapper
+from django.conf import settings
+from django.db import connections
+
+from src.api.models import ImportJob
+from src.common.metrics import ImportMetrics
+
+# Statements whose table is part of the timings, e.g. 'INSERT api_dataentry'
+STATEMENT = re.compile(r'^\s*(INSERT INTO|UPDATE|DELETE FROM)\s+"?(\w+)"?', re.IGNORECASE)
+
+
+def statement(sql):
+    """Returns the statement of the query and the table it changes, or just the statement (e.g. SELECT)."""
+    match = STATEMENT.match(sql)
+    if match:
+        return '{} {}'.format(match.group(1).split()[0].upper(), match.group(2))
+
+    return sql.split(None, 1)[0].upper() if sql.strip() else ''
+
+
+class ImportCancelled(Exception):
+    pass
+
+
+class PhaseTimings:
+    """Database execute wrapper collecting the queries of a phase, and the time of other timed work."""
+
+    def __init__(self):
+        self.queries = {}
+        self.timers = {}
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            query = self.queries.setdefault(statement(sql), {'count': 0, 'rows': 0, 'seconds': 0.0})
+            query['count'] += 1
+            query['seconds'] += time.perf_counter() - start
+            # -1 if unknown
+            query['rows'] += max(context['cursor'].rowcount, 0)
+
+    def as_dict(self, seconds):
+        database = sum(query['seconds'] for query in self.queries.values())
+        return {
+            'rows': sum(query['rows'] for key, query in self.queries.items() if key.split()[0] != 'SELECT'),
+            'database_seconds': database,
+            'timers': self.timers,
+            'other_seconds': max(seconds - database - sum(self.timers.values()), 0.0),
+            'queries': self.queries,
+        }
+
+
+class Progress:
+
+    # Minimum time in seconds between two progress updates of the job
+    interval = 1.0
+
+    def __init__(self, job_id=None, command=None, push_metrics=False):
+        self.job_id = job_id
+        self.command = command
+        self.metrics = ImportMetrics(command) if push_metrics else None
+        self.phases = []
+        self.name = ''
+        self.total = None
+        self.done = 0
+        self.last_update = 0.0
+        self.start = time.perf_counter()
+        self.timings = None
+
+    @contextlib.contextmanager
+    def phase(self, name, total=None):
+        """Runs a phase of total steps (None if unknown) and yields the function to report steps."""
+        self.name, self.total, self.done = name, total, 0
+        self.update(force=True)
+
+        timings = self.timings = PhaseTimings()
+        start = time.perf_counter()
+        try:
+            with contextlib.ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(timings))
+                yield self.step
+        finally:
+            self.timings = None
+
+        seconds = time.perf_counter() - start
+        phase = {'name': name, 'seconds': seconds, **timings.as_dict(seconds)}
+        self.phases.append(phase)
+        self.update(force=True)
+
+        if self.metrics is not None:
+            self.metrics.push_phase(phase)
+
+    @contextlib.contextmanager
+    def timer(self, name):
+        """Adds the time of the block to the timer with the name of the current phase, e.g. 'hdf5' for reading files."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            if self.timings is not None:
+                self.timings.timers[name] = self.timings.timers.get(name, 0.0) + time.perf_counter() - start
+
+    def report(self):
+        """Returns the timings of the command and its finished phases."""
+        return {'command': self.command, 'seconds': time.perf_counter() - self.start, 'phases': self.phases}
+
+    def track(self, iterable, name, total=None):
+        """Yields the items of iterable, each one a step of the phase."""
+        with self.phase(name, len(iterable) if total is None else total) as step:
+            for item in iterable:
+                yield item
+                step()
+
+    def step(self, n=1):
+        self.done += n
+        self.update()
+
+    def update(self, force=False):
+        """Writes the progress to the job, raises ImportCancelled if it is being cancelled."""
+        if self.job_id is None:
+            return
+
+        now = time.perf_counter()
+        if not force and now - self.last_update < self.interval:
+            return
+        self.last_update = now
+
+        progress = min(self.done / self.total, 1.0) if self.total else None
+
+        # a single query, so the update can't overwrite a concurrent cancellation
+        updated = ImportJob.objects.filter(id=self.job_id).exclude(status=ImportJob.Status.CANCELLING).update(
+            phase=self.name, progress=progress, phases=self.phases)
+
+        if not updated:
+            raise ImportCancelled('Import job {} was cancelled'.format(self.job_id))
+
+
+class ProgressMixin:
+    """
+    Management command reporting its phases through self.progress, adds the --report and --push-metrics options.
+    The report is also written if the command fails. With '--report -' the report is the only output on stdout, the
+    output of the command goes to stderr.
+    """
+
+    def add_arguments(self, parser):
+        super().add_arguments(parser)
+        parser.add_argument('--report', default=None, type=str,
+                            help="Write the timings and row counts of every phase as JSON to the file ('-' for stdout)")
+        parser.add_argument('--push-metrics', action='store_true',
+                            help="Push the timings of every phase to the Prometheus Pushgateway (METRICS_PUSHGATEWAY)")
+
+    def execute(self, *args, **options):
+        if options.get('push_metrics') and not settings.METRICS_PUSHGATEWAY:
+            raise CommandError('METRICS_PUSHGATEWAY is not set!')
+
+        command = type(self).__module__.rsplit('.', 1)[-1]
+        self.progress = Progress(options.get('job'), command, options.get('push_metrics', False))
+
+        report_stream = None
+        if options.get('report') == '-':
+            report_stream = OutputWrapper(options.get('stdout') or sys.stdout)
+            options['stdout'] = options.get('stderr') or sys.stderr
+
+        try:
+            return super().execute(*args, **options)
+        finally:
+            if options.get('report'):
+                self.write_report(options['report'], report_stream)
+
+    def write_report(self, path, stream=None):
+        report = json.dumps(self.progress.report(), indent=2)
+        if path == '-':
+            stream.write(report)
+        else:
+            with open(path, 'w') as file:
+                file.write(report)
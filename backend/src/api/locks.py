@@ -0,0 +1,94 @@
+# SPDX-FileCopyrightText: 2024 German Aerospace Center (DLR)
+# SPDX-License-Identifier: Apache-2.0
+
+"""
+Postgres advisory locks of the import commands.
+
+Imports lock the data they change: a simulation by its key, a scenario by its key, the RKI data and the regions. Imports
+of simulations share the lock of their scenario and of the regions, so they run in parallel unless they import the same
+simulation, while the scenario is (re)imported or deleted, or while a region is created. A conflicting import fails
+right away, with --wait it waits until the locks are free.
+
+The locks are session locks, as imports are not run in one transaction, and are released when the command ends.
+"""
+import hashlib
+import time
+
+from django.core.management.base import CommandError
+from django.db import connection
+
+RKI_LOCK = 'rki'
+REGIONS_LOCK = 'regions'
+
+
+def simulation_lock(key):
+    return 'simulation:{}'.format(key)
+
+
+def scenario_lock(key):
+    return 'scenario:{}'.format(key)
+
+
+def upload_lock(upload_id):
+    """Lock of an ImportUpload while one of its chunks is written."""
+    return 'upload:{}'.format(upload_id)
+
+
+def lock_id(name):
+    """Returns the 64 bit key of the advisory lock with the name."""
+    return int.from_bytes(hashlib.sha1('esid:{}'.format(name).encode()).digest()[:8], 'big', signed=True)
+
+
+class ImportLocks:
+    """The advisory locks held by an import, see above."""
+
+    # Seconds between two attempts while waiting for a lock
+    interval = 1.0
+
+    def __init__(self, wait=False):
+        self.wait = wait
+        self.held = []
+
+    def acquire(self, exclusive=(), shared=(), progress=None):
+        """
+        Takes the locks with the names, raises CommandError if another import holds one of them (unless waiting).
+        While waiting, progress is updated so the job can be cancelled.
+        """
+        # always taken in the same order, so two waiting imports can't block each other forever
+        for name, is_shared in sorted([(name, False) for name in exclusive] + [(name, True) for name in shared]):
+            while not self.try_lock(name, is_shared):
+                if not self.wait:
+                    raise CommandError('{} is locked by another import, use --wait to wait for it'.format(name))
+                if progress is not None:
+                    progress.update(force=True)
+                time.sleep(self.interval)
+
+            self.held.append((name, is_shared))
+
+    def release(self):
+        while self.held:
+            name, is_shared = self.held.pop()
+            with connection.cursor() as cursor:
+                cursor.execute('SELECT pg_advisory_unlock{}(%s)'.format('_shared' if is_shared else ''), [lock_id(name)])
+
+    @staticmethod
+    def try_lock(name, shared):
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT pg_try_advisory_lock{}(%s)'.format('_shared' if shared else ''), [lock_id(name)])
+            return cursor.fetchone()[0]
+
+
+class ImportLocksMixin:
+    """Management command holding ImportLocks (self.locks) until it ends, adds the --wait option."""
+
+    def add_arguments(self, parser):
+        super().add_arguments(parser)
+        parser.add_argument('--wait', action='store_true',
+                            help='Wait for other imports of the same data instead of failing')
+
+    def execute(self, *args, **options):
+        self.locks = ImportLocks(options.get('wait', False))
+        try:
+            return super().execute(*args, **options)
+        finally:
+            self.locks.release()
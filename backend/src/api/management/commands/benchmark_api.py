@@ -0,0 +1,174 @@
+# SPDX-FileCopyrightText: 2024 German Aerospace Center (DLR)
+# SPDX-License-Identifier: Apache-2.0
+
+from django.core.management.base import BaseCommand, CommandError
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from urllib.error import HTTPError, URLError
+from urllib.request import Request, urlopen
+from prometheus_client.parser import text_string_to_metric_families
+from src.common.benchmarks import git_commit
+import functools
+import itertools
+import json
+import numpy as np
+import platform
+import time
+
+
+def get(url, token=None, timeout=60):
+    """Returns the status, response body and latency of a GET request."""
+    headers = {'Accept': 'application/json'}
+    if token is not None:
+        headers['Authorization'] = 'Bearer {}'.format(token)
+
+    start = time.perf_counter()
+    try:
+        with urlopen(Request(url, headers=headers), timeout=timeout) as response:
+            status, body = response.status, response.read()
+    except HTTPError as error:
+        status, body = error.code, error.read()
+    return status, body, time.perf_counter() - start
+
+
+def query_totals(base_url, metrics_token=None):
+    """Returns the total number of database queries and observed requests from /metrics, or None without metrics."""
+    try:
+        status, body, _ = get('{}/metrics'.format(base_url), token=metrics_token)
+    except URLError:
+        return None
+    if status != 200:
+        return None
+
+    totals = {'sum': 0.0, 'count': 0.0}
+    for family in text_string_to_metric_families(body.decode()):
+        if family.name != 'esid_request_queries':
+            continue
+        for sample in family.samples:
+            suffix = sample.name.rsplit('_', 1)[-1]
+            # the metrics requests of the benchmark itself are not counted
+            if suffix in totals and sample.labels.get('view') != 'metrics':
+                totals[suffix] += sample.value
+    return totals
+
+
+def access_patterns(base_url, simulation_id, compartment):
+    """
+    Returns the requests of the frontend by name, as lists of URLs to cycle through.
+    Node and day requests are spread over all nodes and days of the simulation.
+    """
+    status, body, _ = get('{}/api/v1/simulations/'.format(base_url))
+    if status != 200:
+        raise CommandError('Listing the simulations failed with status {}'.format(status))
+
+    simulations = json.loads(body)['results']
+    if simulation_id is not None:
+        simulations = [s for s in simulations if s['id'] == simulation_id]
+    if not simulations:
+        raise CommandError('No simulation to benchmark, import one first (see generate_dataset)')
+    simulation = simulations[0]
+
+    _, body, _ = get(simulation['scenario'])
+    nodes = json.loads(body)['results']['nodes']
+
+    start_day = datetime.strptime(simulation['startDay'], '%Y-%m-%d')
+    days = [(start_day + timedelta(days=i)).strftime('%Y-%m-%d') for i in range(simulation['numberOfDays'])]
+
+    api = '{}/api/v1'.format(base_url)
+    series = '?all&groups=total&compartments={}'.format(compartment)
+
+    return {
+        'simulation_list': ['{}/simulations/'.format(api)],
+        'scenario': [simulation['scenario']],
+        'simulation_node': ['{}/simulation/{}/{}/{}'.format(api, simulation['id'], node, series) for node in nodes],
+        'simulation_day': ['{}/simulation/{}/{}/{}'.format(api, simulation['id'], day, series) for day in days],
+        'rki_node': ['{}/rki/{}/{}'.format(api, node, series) for node in nodes],
+        'rki_day': ['{}/rki/{}/{}'.format(api, day, series) for day in days],
+    }
+
+
+class Command(BaseCommand):
+    help = 'Benchmark the latency and throughput of the REST API at several concurrency levels'
+
+    def add_arguments(self, parser):
+        parser.add_argument('output', type=str, help="Path of the JSON results file")
+        parser.add_argument('--url', default='http://localhost:8000', type=str, help="Base URL of the running backend")
+        parser.add_argument('--simulation', default=None, type=int, help="Id of the simulation (default: the first one)")
+        parser.add_argument('--concurrency', default=[1, 4, 16], nargs='+', type=int)
+        parser.add_argument('--requests', default=200, type=int, help="Number of requests per pattern and concurrency")
+        parser.add_argument('--token', default=None, type=str,
+                            help="JWT access token, so requests are throttled at the user instead of the anonymous rate")
+        parser.add_argument('--metrics-token', default=None, type=str,
+                            help="METRICS_TOKEN of the backend, the queries per request are read from /metrics with it")
+        parser.add_argument('--compartment', default='MildInfections', type=str,
+                            help="Compartment of the series and day requests")
+        parser.add_argument('--patterns', default=None, nargs='+', type=str, help="Request patterns (default: all)")
+
+    def handle(self, *args, **options):
+        base_url = options['url'].rstrip('/')
+        patterns = access_patterns(base_url, options['simulation'], options['compartment'])
+
+        unknown = set(options['patterns'] or []) - set(patterns)
+        if unknown:
+            raise CommandError('Unknown patterns {}!'.format(', '.join(sorted(unknown))))
+
+        results = []
+        for name in options['patterns'] or patterns:
+            for concurrency in options['concurrency']:
+                result = self.run(base_url, patterns[name], concurrency, options['requests'], options['token'],
+                                  options['metrics_token'])
+                results.append({'pattern': name, 'concurrency': concurrency, **result})
+                self.stdout.write(
+                    '{:<16} x{:<3} p50 {:7.1f} ms, p95 {:7.1f} ms, p99 {:7.1f} ms, {:7.1f} req/s, {} queries/request'.format(
+                        name, concurrency, *(result[p] * 1000 for p in ('p50', 'p95', 'p99')), result['requests_per_second'],
+                        '-' if result['queries_per_request'] is None else '{:.1f}'.format(result['queries_per_request'])))
+                if result['errors'] or result['throttled']:
+                    self.stdout.write(self.style.WARNING('  {errors} errors, {throttled} throttled'.format(**result)))
+
+        with open(options['output'], 'w') as file:
+            json.dump({
+                'commit': git_commit(),
+                'date': datetime.now().isoformat(),
+                'python': platform.python_version(),
+                'url': base_url,
+                'results': results,
+            }, file, indent=2)
+
+        self.stdout.write(self.style.SUCCESS('Wrote results to "{}"'.format(options['output'])))
+
+    def run(self, base_url, urls, concurrency, n_requests, token=None, metrics_token=None):
+        """Sends n_requests GET requests with the given concurrency, cycling through the URLs."""
+        request = functools.partial(get, token=token)
+
+        # warm up, so connections and caches are established before measuring
+        request(urls[0])
+
+        before = query_totals(base_url, metrics_token)
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            responses = list(executor.map(request, itertools.islice(itertools.cycle(urls), n_requests)))
+        seconds = time.perf_counter() - start
+
+        after = query_totals(base_url, metrics_token)
+
+        latencies = np.array([latency for _, _, latency in responses])
+        p50, p95, p99 = np.percentile(latencies, [50, 95, 99])
+
+        queries = None
+        if before is not None and after is not None and after['count'] > before['count']:
+            queries = (after['sum'] - before['sum']) / (after['count'] - before['count'])
+
+        return {
+            'requests': n_requests,
+            'errors': sum(1 for status, _, _ in responses if status >= 400 and status != 429),
+            'throttled': sum(1 for status, _, _ in responses if status == 429),
+            'seconds': seconds,
+            'requests_per_second': n_requests / seconds,
+            'mean': float(latencies.mean()),
+            'p50': float(p50),
+            'p95': float(p95),
+            'p99': float(p99),
+            'mean_bytes': float(np.mean([len(body) for _, body, _ in responses])),
+            'queries_per_request': queries,
+        }
@@ -0,0 +1,104 @@
+# SPDX-FileCopyrightText: 2024 German Aerospace Center (DLR)
+# SPDX-License-Identifier: Apache-2.0
+
+from django.conf import settings
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from datetime import datetime
+from src.api.fixtures.initial_data import GROUPS
+from src.common.benchmarks import git_commit
+import io
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+
+# Dataset sizes, see the generate_dataset command
+SIZES = {
+    'small': {'nodes': 20, 'groups': ['age_0', 'total'], 'percentiles': [50], 'days': 30},
+    'medium': {'nodes': 100, 'groups': [g[0] for g in GROUPS], 'percentiles': [25, 50, 75], 'days': 100},
+    'large': {'nodes': None, 'groups': [g[0] for g in GROUPS], 'percentiles': [5, 25, 50, 75, 95], 'days': 365},
+}
+
+IMPORTERS = ['import_scenario', 'import_simulation', 'import_rki']
+
+
+def generate(path, key, size):
+    options = SIZES[size]
+    args = [path, '--key', key, '--days', str(options['days']), '--groups', *options['groups'], '--percentiles',
+            *map(str, options['percentiles'])]
+    if options['nodes'] is not None:
+        args += ['--nodes', str(options['nodes'])]
+
+    call_command('generate_dataset', *args, stdout=io.StringIO())
+
+    return {
+        'import_scenario': [os.path.join(path, 'scenario.json')],
+        'import_simulation': [os.path.join(path, 'simulation')],
+        'import_rki': [os.path.join(path, 'rki')],
+    }
+
+
+class Command(BaseCommand):
+    help = 'Benchmark the import commands against generated datasets of several sizes'
+
+    def add_arguments(self, parser):
+        parser.add_argument('output', type=str, help="Path of the JSON results file")
+        parser.add_argument('--sizes', default=['small', 'medium'], nargs='+', choices=SIZES.keys())
+        parser.add_argument('--importers', default=IMPORTERS, nargs='+', choices=IMPORTERS)
+        parser.add_argument('--keepdb', action='store_true', help="Keep the benchmark database afterwards")
+
+    def handle(self, *args, **options):
+        # Imports run against a separate, freshly migrated database, so no existing data is touched
+        connection.settings_dict['POOL_SIZE'] = 0
+        connection.settings_dict['TEST']['NAME'] = 'benchmark_{}'.format(connection.settings_dict['NAME'])
+        old_name = connection.settings_dict['NAME']
+
+        self.stdout.write('Creating benchmark database')
+        database = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+
+        results = []
+        try:
+            for size in options['sizes']:
+                with tempfile.TemporaryDirectory() as path:
+                    self.stdout.write('Generating {} dataset'.format(size))
+                    key = 'bench_{}'.format(size)
+                    arguments = generate(os.path.join(path, 'data'), key, size)
+
+                    for importer in options['importers']:
+                        self.stdout.write('Running {} on {} dataset'.format(importer, size))
+                        result = self.run(database, path, importer, arguments[importer])
+                        results.append({'size': size, 'importer': importer, **SIZES[size], **result})
+                        self.stdout.write('  {seconds:.2f} s, {rows} rows ({rows_per_second:.0f}/s), {queries} queries, '
+                                          '{peak_rss_mb:.0f} MB peak RSS'.format(**result,
+                                                                                 peak_rss_mb=result['peak_rss'] / 2**20))
+        finally:
+            if not options['keepdb']:
+                self.stdout.write('Destroying benchmark database')
+                connection.creation.destroy_test_db(old_name, verbosity=0)
+
+        with open(options['output'], 'w') as file:
+            json.dump({
+                'commit': git_commit(),
+                'date': datetime.now().isoformat(),
+                'python': platform.python_version(),
+                'results': results,
+            }, file, indent=2)
+
+        self.stdout.write(self.style.SUCCESS('Wrote results to "{}"'.format(options['output'])))
+
+    def run(self, database, path, importer, arguments):
+        """Runs the importer in a new process, so the peak RSS is its own."""
+        report = os.path.join(path, '{}.json'.format(importer))
+        command = [sys.executable, os.path.join(settings.ROOT_DIR, 'manage.py'), 'measure', report, importer, *arguments]
+
+        process = subprocess.run(command, env={**os.environ, 'DB_NAME': database}, stdout=subprocess.DEVNULL,
+                                 stderr=subprocess.PIPE, text=True)
+        if process.returncode != 0:
+            raise CommandError('{} failed:\n{}'.format(importer, process.stderr))
+
+        with open(report) as file:
+            return json.load(file)
@@ -0,0 +1,56 @@
+# SPDX-FileCopyrightText: 2024 German Aerospace Center (DLR)
+# SPDX-License-Identifier: Apache-2.0
+
+from django.core.management.base import BaseCommand, CommandError
+from tqdm import tqdm
+import src.api.models as models
+from src.api.locks import ImportLocksMixin, REGIONS_LOCK
+from src.api.rollups import compute_simulation_rollups, compute_rki_rollups
+from src.common.cache import invalidate_responses, RKI, simulation_scope
+
+
+class Command(ImportLocksMixin, BaseCommand):
+    help = 'Create or update a region from a set of nodes and compute its rollups'
+
+    def add_arguments(self, parser):
+        super().add_arguments(parser)
+        parser.add_argument('key', type=str, help="Numeric key of the region node")
+        parser.add_argument('label', type=str)
+        parser.add_argument('nodes', nargs='+', type=str, help="Keys of the member nodes")
+
+    def handle(self, *args, **options):
+        key = options['key']
+        if not key.isnumeric():
+            raise CommandError('Region key "{}" must be numeric!'.format(key))
+
+        members = list(models.Node.objects.filter(name__in=options['nodes']))
+        missing = set(options['nodes']) - set(node.name for node in members)
+        if missing:
+            raise CommandError('Nodes {} do not exist!'.format(', '.join(sorted(missing))))
+
+        self.locks.acquire(exclusive=[REGIONS_LOCK])
+
+        region, created = models.Node.objects.get_or_create(name=key, defaults={'metadata': {'key': key}})
+
+        if not created and not region.members.exists():
+            raise CommandError('Node {} already exists and is not a region!'.format(key))
+
+        region.metadata = {**region.metadata, 'label': options['label']}
+        region.save()
+        region.members.set(members)
+
+        regions = models.Node.objects.filter(id=region.id)
+
+        simulations = models.Simulation.objects.all()
+        for simulation in tqdm(simulations, total=len(simulations), desc="Computing simulation rollups"):
+            compute_simulation_rollups(simulation, regions)
+
+        self.stdout.write('Computing RKI rollups')
+        version = models.RKINode.next_version()
+        compute_rki_rollups(regions, version=version)
+        models.RKINode.objects.update(version=version)
+
+        invalidate_responses(RKI, *(simulation_scope(simulation.id) for simulation in simulations))
+
+        self.stdout.write(self.style.SUCCESS('Successfully {} region "{}"'.format(
+            'created' if created else 'updated', options['label'])))
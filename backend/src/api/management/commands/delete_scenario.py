@@ -3,12 +3,14 @@
 
 from django.core.management.base import BaseCommand, CommandError
 import src.api.models as models
+from src.api.locks import ImportLocksMixin, scenario_lock
 
 
-class Command(BaseCommand):
+class Command(ImportLocksMixin, BaseCommand):
     help = 'Delete scenario'
 
     def add_arguments(self, parser):
+        super().add_arguments(parser)
         parser.add_argument('scenario_name', type=str)
 
     def handle(self, *args, **options):
@@ -16,5 +18,6 @@ class Command(BaseCommand):
         print(name)
         scenario = models.Scenario.objects.get(name=name)
         if scenario is not None:
+            self.locks.acquire(exclusive=[scenario_lock(scenario.key)])
             scenario.delete()
         
@@ -0,0 +1,166 @@
+# SPDX-FileCopyrightText: 2024 German Aerospace Center (DLR)
+# SPDX-License-Identifier: Apache-2.0
+
+from django.core.management.base import BaseCommand, CommandError
+from datetime import datetime
+from tqdm import tqdm
+from src.api.fixtures.initial_data import COMPARTMENTS, GROUPS, NODES, PARAMETERS
+import numpy as np
+import os
+import json
+import h5py
+
+
+def write_scenario(path, key, nodes, groups):
+    """Writes a scenario config for the import_scenario command."""
+    config = {
+        'key': key,
+        'name': 'Synthetic scenario {}'.format(key),
+        'description': 'Generated by generate_dataset',
+        'simulationModel': 'secihurd',
+        'numberOfNodes': len(nodes),
+        'nodes': nodes,
+        'groups': [{'key': g[0], 'name': g[0], 'description': g[2], 'category': g[1]} for g in GROUPS if g[0] in groups],
+        'parameters': {parameter: [{'groups': groups, 'value': [0.5, 1.5]}] for parameter in PARAMETERS},
+    }
+
+    with open(path, 'w') as file:
+        json.dump(config, file, indent=2)
+
+
+def write_metadata(path, meta):
+    with open(os.path.join(path, 'metadata.json'), 'w') as file:
+        json.dump(meta, file, indent=2)
+
+
+def node_series(rng, n_days, n_compartments, scale):
+    """Returns smooth, non-negative (n_days, n_compartments) series that grow and decline like an epidemic wave."""
+    days = np.arange(n_days)[:, np.newaxis]
+    peak = rng.uniform(0.3, 0.7, n_compartments) * n_days
+    width = rng.uniform(0.1, 0.3, n_compartments) * n_days
+    return scale * rng.uniform(0.5, 1.5, n_compartments) * np.exp(-((days - peak) / width)**2)
+
+
+def write_results(path, node_ids, datasets, n_days, n_compartments, rng, factor=1.0):
+    """
+    Writes Results.h5 with one group per node and Results_sum.h5 with their sum as node 0.
+    Every node group holds one (n_days, n_compartments) dataset per dataset name.
+    """
+    sums = {name: np.zeros((n_days, n_compartments)) for name in datasets}
+
+    with h5py.File(os.path.join(path, 'Results.h5'), 'w') as h5:
+        for node_id in tqdm(node_ids, total=len(node_ids), leave=False, desc='Writing {}'.format(path)):
+            h5node = h5.create_group(str(node_id))
+            for name in datasets:
+                values = node_series(rng, n_days, n_compartments, rng.uniform(10, 1000)) * factor
+                h5node.create_dataset(name, data=values)
+                sums[name] += values
+
+    with h5py.File(os.path.join(path, 'Results_sum.h5'), 'w') as h5:
+        h5node = h5.create_group('0')
+        for name in datasets:
+            h5node.create_dataset(name, data=sums[name])
+
+
+class Command(BaseCommand):
+    help = 'Generate a synthetic scenario, simulation and RKI dataset for benchmarks and tests'
+
+    def add_arguments(self, parser):
+        parser.add_argument('output_path', type=str)
+        parser.add_argument('--key', default='synthetic', type=str, help="Key of the scenario and the simulation")
+        parser.add_argument('--nodes', default=None, type=int,
+                            help="Number of counties to include (default: all counties)")
+        parser.add_argument('--groups', default=[g[0] for g in GROUPS], nargs='+', type=str)
+        parser.add_argument('--percentiles', default=[25, 50, 75], nargs='+', type=int)
+        parser.add_argument('--runs', default=0, type=int,
+                            help="Write the runs of an ensemble instead of computed percentiles, the importer computes "
+                                 "the percentiles from them")
+        parser.add_argument('--days', default=100, type=int, help="Number of simulated days (after the start day)")
+        parser.add_argument('--start-day', default='2022-01-01', type=str)
+        parser.add_argument('--compartments', default=COMPARTMENTS, nargs='+', type=str,
+                            help="Compartment order of the datasets, '**ignore**' adds an ignored column")
+        parser.add_argument('--seed', default=0, type=int)
+
+    def handle(self, *args, **options):
+        path = options['output_path']
+        if os.path.exists(path) and os.listdir(path):
+            raise CommandError('Output path {} is not empty!'.format(path))
+
+        unknown = set(options['groups']) - set(g[0] for g in GROUPS)
+        if unknown:
+            raise CommandError('Unknown groups {}!'.format(', '.join(sorted(unknown))))
+
+        start_day = datetime.strptime(options['start_day'], "%Y-%m-%d")
+
+        counties = [node['key'] for node in NODES if node['key'] != '00000'][:options['nodes']]
+        node_ids = [int(key) for key in counties]
+
+        groups = options['groups']
+        datasets = ['Group{}'.format(i + 1) for i in range(len(groups))]
+        order = options['compartments']
+        n_days = options['days'] + 1
+
+        rng = np.random.default_rng(options['seed'])
+
+        os.makedirs(path, exist_ok=True)
+
+        self.stdout.write('Writing scenario config')
+        write_scenario(os.path.join(path, 'scenario.json'), options['key'], ['00000'] + counties, groups)
+
+        self.stdout.write('Writing simulation')
+        simulation_path = os.path.join(path, 'simulation')
+        os.makedirs(simulation_path)
+        meta = {
+            'key': options['key'],
+            'name': 'Synthetic simulation {}'.format(options['key']),
+            'description': 'Generated by generate_dataset',
+            'startDay': start_day.strftime("%Y-%m-%d"),
+            'numberOfDays': options['days'],
+            'scenario': options['key'],
+            'datasets': datasets,
+            'groupMapping': dict(zip(datasets, groups)),
+            'compartmentOrder': order,
+        }
+        if options['runs']:
+            meta['percentiles'] = options['percentiles']
+        write_metadata(simulation_path, meta)
+
+        if options['runs']:
+            # every run scales the same series by a random factor around 1
+            folders = ['run{}'.format(run) for run in range(options['runs'])]
+            factors = rng.uniform(0.5, 1.5, options['runs'])
+        else:
+            folders = [str(percentile) for percentile in options['percentiles']]
+            factors = [percentile / 50 for percentile in options['percentiles']]
+
+        for folder, factor in zip(folders, factors):
+            folder_path = os.path.join(simulation_path, folder)
+            os.makedirs(folder_path)
+
+            for index, node_id in enumerate(node_ids):
+                with open(os.path.join(folder_path, 'GraphNode{}.json'.format(index)), 'w') as file:
+                    json.dump({'NodeId': node_id}, file)
+
+            # reuse the seed per folder, so percentiles and runs are scaled versions of the same series
+            write_results(folder_path, node_ids, datasets, n_days, len(order),
+                          np.random.default_rng(options['seed']), factor=factor)
+
+        self.stdout.write('Writing RKI data')
+        rki_path = os.path.join(path, 'rki')
+        os.makedirs(rki_path)
+        write_metadata(rki_path, {
+            'startDay': start_day.strftime("%Y-%m-%d"),
+            'datasets': datasets,
+            'groupMapping': dict(zip(datasets, groups)),
+            'compartmentOrder': order,
+        })
+        write_results(rki_path, node_ids, datasets, n_days, len(order), rng)
+
+        self.stdout.write(self.style.SUCCESS(
+            'Generated {} nodes, {} groups, {} percentiles and {} days in "{}"'.format(
+                len(node_ids), len(groups), len(options['percentiles']), n_days, path)))
+        self.stdout.write('Import with:\n'
+                          '  python manage.py import_scenario {0}\n'
+                          '  python manage.py import_simulation {1}\n'
+                          '  python manage.py import_rki {2}'.format(
+                              os.path.join(path, 'scenario.json'), simulation_path, rki_path))
@@ -3,8 +3,14 @@
 
 from django.core.management.base import BaseCommand, CommandError
 from datetime import datetime, timedelta
+from django.db.models import F, Max
 from tqdm import tqdm
 import src.api.models as models
+from src.api.rollups import BATCH_SIZE, compute_rki_rollups
+from src.api.jobs import ProgressMixin
+from src.api.locks import ImportLocksMixin, REGIONS_LOCK, RKI_LOCK
+from src.common.cache import invalidate_responses, RKI
+import argparse
 import zipfile
 import os
 import tempfile
@@ -18,15 +24,11 @@ MANDATORY = [
 ]
 
 
-def create_data_entries(self, start_day, n_days, compartments, dataset, group, node):
+def create_data_entries(self, start_day, first_day, compartments, rows):
+    """Returns a data entry per row, the first row holds the values of day first_day after start_day."""
     entries = []
 
-    # check if data already exists
-    # if node.data.filter(day__gte=start_day, group=group).exists():
-        # self.stdout.write('Data for node {} group {} day {} already exist! Skipping.'.format(node.node.name, group.name, date))
-    #    return entries
-        
-    for day in range(0, n_days):
+    for day, row in enumerate(rows, first_day):
         date = start_day + timedelta(days=day)
 
         values = dict()
@@ -34,7 +36,7 @@ def create_data_entries(self, start_day, n_days, compartments, dataset, group, n
             if compartment == '**ignore**':
                 continue
 
-            values[compartment] = dataset[day, index]
+            values[compartment] = row[index]
 
         entry = models.DataEntry(day=date, data=values)
         entries.append(entry)
@@ -42,18 +44,34 @@ def create_data_entries(self, start_day, n_days, compartments, dataset, group, n
     return entries
 
 
-def import_node(self, node, h5node, meta, start_day):
-    data_entries = []
+def import_node(self, node, h5node, meta, start_day, version, incremental=False, revise=0):
+    """
+    Imports the datasets of a node and returns the first day that changed (None if none did).
+    Incremental imports only add the days after the last stored day of each group and update the last 'revise' stored
+    days whose values changed, otherwise all days of the node are replaced. New and revised entries get the version.
+    """
+    # new entries with their group, and stored entries with revised values
+    entries, revised = [], []
 
     [rki_node, flag] = models.RKINode.objects.get_or_create(node=node)
-    
+    replaced = [] if incremental else list(rki_node.data.values_list('id', flat=True))
+
+    # last stored day by group, and the stored entries that may be revised by group and day
+    last_days, stored = {}, {}
+    if incremental:
+        last_days = dict(rki_node.data.order_by().values_list('groups').annotate(last=Max('day')))
+        if last_days and revise:
+            since = min(last_days.values()) - timedelta(days=revise - 1)
+            stored = {(entry.group, entry.day): entry
+                      for entry in rki_node.data.filter(day__gte=since).annotate(group=F('groups'))}
+
     order = meta['compartmentOrder']
 
     for dataset_name in meta['datasets']:
         group_name = meta['groupMapping'][dataset_name] if 'groupMapping' in meta else dataset_name
         try:
-            group = models.Group.objects.get(key=group_name)
-        except models.Group.DoesNotExist:
+            group = self.groups[group_name]
+        except KeyError:
             self.stdout.write(self.style.ERROR('No group for dataset {} found!'.format(group_name)))
             continue
 
@@ -65,32 +83,76 @@ def import_node(self, node, h5node, meta, start_day):
             self.stdout.write(self.style.ERROR('Compartment mapping must be of the same length as columns in dataset {}!={}'.format(len(order), n_compartments)))
             continue
 
-        # create data entry models
-        entries = create_data_entries(self, start_day, n_days, order, dataset, group, rki_node)
-        
-        # save data entry models
-        entries = models.DataEntry.objects.bulk_create(entries)
+        last = last_days.get(group.pk)
+        first_day = 0 if last is None else max(0, (last - start_day).days + 1 - revise)
+        if first_day >= n_days:
+            continue
+
+        # the rows are read at once
+        with self.progress.timer('hdf5'):
+            rows = dataset[first_day:]
+
+        # create data entry models, days already stored are updated if they changed
+        for entry in create_data_entries(self, start_day, first_day, order, rows):
+            previous = stored.get((group.pk, entry.day))
+            if previous is None:
+                entry.version = version
+                entries.append((entry, group))
+            elif previous.data != entry.data:
+                previous.data, previous.version = entry.data, version
+                revised.append(previous)
+
+    models.DataEntry.objects.bulk_update(revised, ['data', 'version'])
+
+    # save data entry models
+    data_entries = models.DataEntry.objects.bulk_create([entry for entry, _ in entries])
+
+    # set groups on data entries
+    DataEntryGroup = models.DataEntry.groups.through
+    DataEntryGroup.objects.bulk_create([DataEntryGroup(dataentry_id=entry.id, group_id=group.pk)
+                                        for entry, group in entries])
 
-        # set groups on data entries
-        for entry in entries:
-            entry.groups.add(group)
+    if incremental:
+        rki_node.data.add(*data_entries)
+    else:
+        rki_node.data.set(data_entries)
+        # the replaced entries are not linked anymore
+        models.DataEntry.objects.filter(id__in=replaced).delete()
 
-        data_entries.extend(entries)
-    
-    
-    rki_node.data.set(data_entries)
-    
-    return rki_node
+    changed = min((entry.day for entry in data_entries + revised), default=None)
+    if changed is not None or not incremental:
+        # clients syncing the node get the new entries from now on
+        rki_node.version = version
+        rki_node.save(update_fields=['version'])
 
+    return changed
 
-class Command(BaseCommand):
+
+class Command(ImportLocksMixin, ProgressMixin, BaseCommand):
     help = 'Import RKI data'
 
     def add_arguments(self, parser):
+        super().add_arguments(parser)
         parser.add_argument('data_path', type=str)
+        parser.add_argument('--incremental', action='store_true',
+                            help='Only import the days after the last imported day of each node and group')
+        parser.add_argument('--revise', type=int, default=0, metavar='DAYS',
+                            help='With --incremental, also update the last DAYS imported days if their values changed')
+        parser.add_argument('--batch-size', default=BATCH_SIZE, type=int,
+                            help="Number of rollup entries saved at once, bounds the memory used by the rollups")
+        parser.add_argument('--job', type=int, default=None, help=argparse.SUPPRESS)
 
     def handle(self, *args, **options):
-        
+        self.locks.acquire(exclusive=[RKI_LOCK], shared=[REGIONS_LOCK], progress=self.progress)
+
+        incremental, revise = options['incremental'], options['revise']
+        if revise and not incremental:
+            raise CommandError('--revise requires --incremental!')
+
+        batch_size = options['batch_size']
+        if batch_size < 1:
+            raise CommandError('The batch size must be positive!')
+
         path = options['data_path']
         if not path:
             raise CommandError('No path to data provided!')
@@ -132,14 +194,18 @@ class Command(BaseCommand):
                 raise CommandError('Mandatory key "{}" is missing in metadata file!'.format(key))
 
         order = meta['compartmentOrder']
+        self.groups = {group.key: group for group in models.Group.objects.all()}
+        version = models.RKINode.next_version()
 
-        start_day = datetime.strptime(meta['startDay'], "%Y-%m-%d")
+        start_day = datetime.strptime(meta['startDay'], "%Y-%m-%d").date()
+
+        # first day that changed in any node
+        changed = []
 
-        nodes = []
         with h5py.File(os.path.join(path, 'Results.h5'), 'r') as h5:
             node_names = list(h5.keys())
             with tqdm(node_names, total=len(node_names)) as progress:
-                for nodeId in progress:
+                for nodeId in self.progress.track(progress, 'Processing nodes'):
                     progress.set_description('Procressing node {}'.format(nodeId))
                     padded = nodeId.zfill(5)
 
@@ -150,18 +216,36 @@ class Command(BaseCommand):
                         continue
 
                     h5node = h5[nodeId]
-                    import_node(self, node, h5node, meta, start_day)
+                    changed.append(import_node(self, node, h5node, meta, start_day, version, incremental, revise))
 
 
         self.stdout.write("Importing Results_sum.h5 as node 00000")
-        with h5py.File(os.path.join(path, 'Results_sum.h5'), 'r') as h5:            
+        with self.progress.phase('Importing node 00000'), h5py.File(os.path.join(path, 'Results_sum.h5'), 'r') as h5:
             try:
                 h5node = h5['0']
                 node = models.Node.objects.get(name="00000")
-                import_node(self, node, h5node, meta, start_day)
+                changed.append(import_node(self, node, h5node, meta, start_day, version, incremental, revise))
             except models.Node.DoesNotExist:
                 self.stdout.write(self.style.ERROR('Node "00000" (Germany) does not exist!'.format(padded)))
-        
+
+        changed = [day for day in changed if day is not None]
+        if incremental and not changed:
+            self.stdout.write('No new or revised days')
+        elif incremental:
+            since = min(changed)
+            self.stdout.write('Computing regional rollups since {}'.format(since))
+            with self.progress.phase('Computing regional rollups'):
+                compute_rki_rollups(since=since, version=version, batch_size=batch_size)
+        else:
+            self.stdout.write('Computing regional rollups')
+            with self.progress.phase('Computing regional rollups'):
+                compute_rki_rollups(version=version, batch_size=batch_size)
+
+        if changed or not incremental:
+            # all nodes are complete up to the version now
+            models.RKINode.objects.update(version=version)
+            invalidate_responses(RKI)
+
         if is_zip:
             self.stdout.write('Deleting temporary folder {}'.format(path, temp_dir.name))
             temp_dir.cleanup()
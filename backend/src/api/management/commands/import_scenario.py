@@ -4,6 +4,10 @@
 from django.core.management.base import BaseCommand, CommandError
 from tqdm import tqdm
 import src.api.models as models
+from src.api.jobs import ProgressMixin
+from src.api.locks import ImportLocksMixin, scenario_lock
+from src.common.cache import invalidate_responses, SCENARIOS
+import argparse
 import json 
 
 MANDATORY = [
@@ -15,11 +19,13 @@ MANDATORY = [
     "parameters"
 ]
 
-class Command(BaseCommand):
+class Command(ImportLocksMixin, ProgressMixin, BaseCommand):
     help = 'Import a new scenario'
 
     def add_arguments(self, parser):
+        super().add_arguments(parser)
         parser.add_argument('config', type=str)
+        parser.add_argument('--job', type=int, default=None, help=argparse.SUPPRESS)
 
     def handle(self, *args, **options):
         self.stdout.write('Importing scenario from file "{}"'.format(options['config']))
@@ -32,6 +38,8 @@ class Command(BaseCommand):
             if key not in config:
                 raise CommandError('Mandatory key "{}" is missing!'.format(key))
 
+        self.locks.acquire(exclusive=[scenario_lock(config['key'])], progress=self.progress)
+
         
         scenario = models.Scenario()
         scenario.key = config['key']
@@ -52,7 +60,8 @@ class Command(BaseCommand):
 
         # select group models and create if neccessary
         all_groups = []
-        for group_info in tqdm(config['groups'], total=len(config['groups']), desc="Creating groups"):
+        for group_info in self.progress.track(tqdm(config['groups'], total=len(config['groups']), desc="Creating groups"),
+                                              'Creating groups'):
             group = None
 
             try:
@@ -68,7 +77,8 @@ class Command(BaseCommand):
         parameters = list(simulation_model.parameters.values_list('name', flat=True))
 
         # create scenario nodes
-        for node_key in tqdm(nodes, total=len(nodes), desc="Creating scenario nodes"):
+        for node_key in self.progress.track(tqdm(nodes, total=len(nodes), desc="Creating scenario nodes"),
+                                            'Creating scenario nodes'):
             # select reference node
             try:
                 node = models.Node.objects.get(metadata__key=node_key)
@@ -125,5 +135,6 @@ class Command(BaseCommand):
             scenario.nodes.add(scenario_node)
 
         scenario.save()
+        invalidate_responses(SCENARIOS)
         self.stdout.write(self.style.SUCCESS('Successfully imported scenario "{}"'.format(scenario.name)))
 
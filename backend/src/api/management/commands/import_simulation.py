@@ -5,11 +5,22 @@ from django.core.management.base import BaseCommand, CommandError
 from datetime import datetime, timedelta
 from tqdm import tqdm
 import src.api.models as models
+from src.api.rollups import BATCH_SIZE, compute_simulation_rollups
+from src.api.jobs import ProgressMixin
+from src.api.locks import ImportLocksMixin, REGIONS_LOCK, scenario_lock, simulation_lock
+from src.api.tasks import delete_simulation_nodes
+from src.common.cache import invalidate_responses, simulation_scope, warm_up_simulation
+import argparse
+import contextlib
+import itertools
+import re
+import uuid
 import zipfile
 import os
 import tempfile
 import json
 import h5py
+import numpy as np
 
 MANDATORY = [
     'name',
@@ -21,10 +32,64 @@ MANDATORY = [
     'compartmentOrder',
 ]
 
+# Folders of the runs of an ensemble, the other folders hold one computed percentile each (e.g. 50 or p50)
+RUN_FOLDER = re.compile(r'^run\d+$')
 
-def create_data_entries(start_day, n_days, compartments, dataset, group, percentile):
-    entries = []
+# Percentiles computed from the runs of an ensemble, unless given by --percentiles or in the metadata
+DEFAULT_PERCENTILES = [5, 25, 50, 75, 95]
+
+
+def metadata_problems(meta):
+    """Returns the scenario of the metadata.json of a simulation (None if there is none) and all problems found in it."""
+    missing = [key for key in MANDATORY if key not in meta]
+    if missing:
+        return None, ['Mandatory key "{}" is missing in metadata file!'.format(key) for key in missing]
+
+    try:
+        scenario = models.Scenario.objects.get(key=meta['scenario'])
+    except models.Scenario.DoesNotExist:
+        return None, ['Scenario {} does not exist!'.format(meta['scenario'])]
+
+    problems = []
+
+    for compartment in scenario.compartments.all():
+        if compartment.name not in meta['compartmentOrder']:
+            problems.append('Compartment {} not found in mapping'.format(compartment.name))
+
+    return scenario, problems
+
+
+def check_metadata(meta):
+    """Checks the metadata.json of a simulation and returns its scenario, raises CommandError if it can't be imported."""
+    scenario, problems = metadata_problems(meta)
+    if problems:
+        raise CommandError(problems[0])
+
+    return scenario
+
+
+def percentile_problems(results):
+    """Returns a problem for every percentile of the results (as listed by the command) outside of 0 to 100."""
+    percentiles = sorted({percentile for _, percentiles, _ in results for percentile in percentiles})
+    return ['Percentile {} is not between 0 and 100!'.format(p) for p in percentiles if not 0 <= p <= 100]
 
+
+def read_archive_metadata(path):
+    """Returns the metadata.json of a simulation zip file without extracting it."""
+    if not zipfile.is_zipfile(path):
+        raise CommandError('{} is not a zip file!'.format(os.path.basename(path)))
+
+    with zipfile.ZipFile(path) as archive:
+        try:
+            return json.loads(archive.read('metadata.json'))
+        except KeyError:
+            raise CommandError('No metadata.json found in zip file!')
+        except ValueError:
+            raise CommandError('metadata.json is not valid JSON!')
+
+
+def create_data_entries(start_day, n_days, compartments, dataset, group, percentile):
+    """Yields the data entries of the dataset day by day."""
     # Do not skip first data entry, to avoid discontinuity with initial rki data
     for day in range(n_days):
         date = start_day + timedelta(days=day)
@@ -36,15 +101,25 @@ def create_data_entries(start_day, n_days, compartments, dataset, group, percent
 
             values[compartment] = dataset[day, index]
 
-        entry = models.DataEntry(day=date, data=values, percentile=percentile)
-        entries.append(entry)
+        yield models.DataEntry(day=date, data=values, percentile=percentile)
 
-    return entries
 
+def compute_bands(runs, percentiles):
+    """
+    Returns the (percentiles, days, compartments) bands of one node and group, computed across the (days, compartments)
+    arrays of all runs of an ensemble. The array of an already computed percentile is returned as its only band.
+    """
+    return np.percentile(np.stack(runs), percentiles, axis=0)
+
+
+def process_node(self, meta, h5nodes, order, start_day, percentiles, simulation_node):
+    """
+    Imports the datasets of a node, h5nodes holds the node of every run (or of the percentile).
+    The entries are saved and linked in chunks of self.batch_size, so memory does not grow with the days and groups.
+    """
+    DataEntryGroup = models.DataEntry.groups.through
+    SimulationNodeEntry = models.SimulationNode.data.through
 
-def process_node(self, meta, h5node, compartments, order, start_day, percentile, simulation_node):
-    data_entries = []
-    group_mapping = []
     for dataset_name in meta['datasets']:
         group_name = meta['groupMapping'][dataset_name] if 'groupMapping' in meta else dataset_name
         try:
@@ -53,9 +128,9 @@ def process_node(self, meta, h5node, compartments, order, start_day, percentile,
             self.stdout.write(self.style.ERROR('No group for dataset {} found!'.format(group_name)))
             continue
 
-        dataset = h5node[dataset_name]
+        datasets = [h5node[dataset_name] for h5node in h5nodes]
 
-        [n_days, n_compartments] = dataset.shape
+        [n_days, n_compartments] = datasets[0].shape
 
         if n_days - 1 != meta['numberOfDays']:
             self.stdout.write(self.style.ERROR(
@@ -69,97 +144,185 @@ def process_node(self, meta, h5node, compartments, order, start_day, percentile,
                                                                                                      n_compartments)))
             continue
 
-        # create data entry models
-        entries = create_data_entries(start_day, n_days, order, dataset, group, percentile)
-
-        # save data entry models
-        entries = models.DataEntry.objects.bulk_create(entries)
-
-        # set groups on data entries
-        for entry in entries:
-            entry.groups.add(group)
-
-        data_entries.extend(entries)
-
-    simulation_node.data.set(list(simulation_node.data.all()) + data_entries)
-    simulation_node.save()
-
-
-def process_percentile(self, path, percentile, meta, simulation, scenario, compartments, order, start_day):
-    self.stdout.write("Processing percentile {}".format(percentile))
-
-    files = os.listdir(path)
+        if any(dataset.shape != (n_days, n_compartments) for dataset in datasets):
+            raise CommandError('The runs have different shapes in dataset {}!'.format(dataset_name))
+
+        with self.progress.timer('hdf5'):
+            runs = [dataset[()] for dataset in datasets]
+        with self.progress.timer('percentiles'):
+            bands = compute_bands(runs, percentiles)
+
+        entries = itertools.chain.from_iterable(
+            create_data_entries(start_day, n_days, order, band, group, percentile)
+            for percentile, band in zip(percentiles, bands))
+
+        while True:
+            # create data entry models
+            with self.progress.timer('objects'):
+                chunk = list(itertools.islice(entries, self.batch_size))
+            if not chunk:
+                break
+
+            # save data entry models
+            chunk = models.DataEntry.objects.bulk_create(chunk)
+
+            # set groups on data entries and add them to the node
+            DataEntryGroup.objects.bulk_create([DataEntryGroup(dataentry_id=entry.id, group_id=group.pk)
+                                                for entry in chunk])
+            SimulationNodeEntry.objects.bulk_create([SimulationNodeEntry(simulationnode_id=simulation_node.id,
+                                                                         dataentry_id=entry.id) for entry in chunk])
+
+
+def get_simulation_node(simulation, scenario_node):
+    try:
+        return simulation.nodes.get(scenario_node=scenario_node)
+    except models.SimulationNode.DoesNotExist:
+        simulation_node = models.SimulationNode(scenario_node=scenario_node)
+        simulation_node.save()
+        simulation.nodes.add(simulation_node)
+        return simulation_node
+
+
+def process_results(self, paths, percentiles, label, meta, simulation, scenario, order, start_day):
+    """
+    Imports the results in the folders of the paths, either one folder of an already computed percentile or the folders
+    of all runs of an ensemble, whose percentiles are computed node by node.
+    """
+    self.stdout.write(label)
+
+    for path in paths:
+        files = os.listdir(path)
 
-    if "Results.h5" not in files:
-        raise CommandError('No Results.h5 found in data folder!')
+        if "Results.h5" not in files:
+            raise CommandError('No Results.h5 found in data folder {}!'.format(os.path.basename(path)))
 
-    if "Results_sum.h5" not in files:
-        raise CommandError('No Results_sum.h5 found in data folder!')
+        if "Results_sum.h5" not in files:
+            raise CommandError('No Results_sum.h5 found in data folder {}!'.format(os.path.basename(path)))
 
     scenario_nodes = scenario.nodes.all()
     scenario_node_names = list(map(lambda n: n.name, scenario_nodes))
 
     self.stdout.write("Processing GraphNode files")
-    node_files = list(filter(lambda f: 'GraphNode' in f, files))
-
-    with h5py.File(os.path.join(path, 'Results.h5'), 'r') as h5:
-        with tqdm(node_files, total=len(node_files)) as progress:
-            for node_file in progress:
-                progress.set_description('Procressing node file {}'.format(node_file))
-                with open(os.path.join(path, node_file)) as handle:
-                    node = json.load(handle)
-                    nodeId = str(node['NodeId'])
-                    padded = nodeId.zfill(5)
-
-                    if not padded in scenario_node_names:
-                        self.stdout.write(
-                            self.style.ERROR('Node {} not part of scenario {}'.format(padded, scenario.name)))
+    # the runs of an ensemble share their nodes
+    node_files = list(filter(lambda f: 'GraphNode' in f, os.listdir(paths[0])))
 
-                    if not h5[nodeId]:
-                        self.stdout.write(self.style.ERROR('No data found for node {}'.format(padded, scenario.name)))
+    # the nodes and node 00000 of Results_sum.h5
+    with self.progress.phase(label, len(node_files) + 1) as step:
+        with contextlib.ExitStack() as stack:
+            h5s = [stack.enter_context(h5py.File(os.path.join(path, 'Results.h5'), 'r')) for path in paths]
+            with tqdm(node_files, total=len(node_files)) as progress:
+                for node_file in progress:
+                    progress.set_description('Procressing node file {}'.format(node_file))
+                    with open(os.path.join(paths[0], node_file)) as handle:
+                        node = json.load(handle)
+                        nodeId = str(node['NodeId'])
+                        padded = nodeId.zfill(5)
 
-                    h5node = h5[nodeId]
+                        if not padded in scenario_node_names:
+                            self.stdout.write(
+                                self.style.ERROR('Node {} not part of scenario {}'.format(padded, scenario.name)))
 
-                    scenario_node = scenario_nodes.get(node__name=padded)
+                        if not all(nodeId in h5 for h5 in h5s):
+                            self.stdout.write(self.style.ERROR('No data found for node {}'.format(padded, scenario.name)))
 
-                    try:
-                        simulation_node = simulation.nodes.get(scenario_node=scenario_node)
-                    except models.SimulationNode.DoesNotExist:
-                        simulation_node = models.SimulationNode(scenario_node=scenario_node)
-                        simulation_node.save()
-                        simulation.nodes.add(simulation_node)
+                        h5nodes = [h5[nodeId] for h5 in h5s]
 
-                    process_node(self, meta, h5node, compartments, order, start_day, percentile, simulation_node)
+                        simulation_node = get_simulation_node(simulation, scenario_nodes.get(node__name=padded))
 
-    self.stdout.write("Importing Results_sum.h5 as node 00000")
-    with h5py.File(os.path.join(path, 'Results_sum.h5'), 'r') as h5:
-        h5node = h5['0']
+                        process_node(self, meta, h5nodes, order, start_day, percentiles, simulation_node)
+                    step()
 
-        scenario_node = scenario_nodes.get(node__name='00000')
+        self.stdout.write("Importing Results_sum.h5 as node 00000")
+        with contextlib.ExitStack() as stack:
+            h5s = [stack.enter_context(h5py.File(os.path.join(path, 'Results_sum.h5'), 'r')) for path in paths]
+            h5nodes = [h5['0'] for h5 in h5s]
 
-        try:
-            simulation_node = simulation.nodes.get(scenario_node=scenario_node)
-        except models.SimulationNode.DoesNotExist:
-            simulation_node = models.SimulationNode(scenario_node=scenario_node)
-            simulation_node.save()
-            simulation.nodes.add(simulation_node)
+            simulation_node = get_simulation_node(simulation, scenario_nodes.get(node__name='00000'))
 
-        process_node(self, meta, h5node, compartments, order, start_day, percentile, simulation_node)
+            process_node(self, meta, h5nodes, order, start_day, percentiles, simulation_node)
+            step()
 
     simulation.save()
 
 
-class Command(BaseCommand):
+def results_problems(meta, scenario, results):
+    """
+    Scans the HDF5 files of the results (as listed by the command) against the metadata and the scenario, and returns
+    all problems found. Only the names and shapes of the nodes and datasets are read, not their data.
+    """
+    problems = []
+    order = meta['compartmentOrder']
+    shape = (meta['numberOfDays'] + 1, len(order))
+    scenario_node_names = set(scenario.nodes.values_list('node__name', flat=True))
+
+    groups = set(models.Group.objects.values_list('key', flat=True))
+    for dataset_name in meta['datasets']:
+        group_name = meta['groupMapping'].get(dataset_name) if 'groupMapping' in meta else dataset_name
+        if group_name not in groups:
+            problems.append('No group for dataset {} found!'.format(group_name or dataset_name))
+
+    def scan_node(file_name, h5, nodeId):
+        if nodeId not in h5:
+            problems.append('{}: no data found for node {}'.format(file_name, nodeId))
+            return
+
+        for dataset_name in meta['datasets']:
+            if dataset_name not in h5[nodeId]:
+                problems.append('{}: dataset {} is missing in node {}'.format(file_name, dataset_name, nodeId))
+            elif h5[nodeId][dataset_name].shape != shape:
+                problems.append('{}: dataset {} of node {} has the shape {}, expected {} (days, compartments)'.format(
+                    file_name, dataset_name, nodeId, h5[nodeId][dataset_name].shape, shape))
+
+    for paths, _, _ in results:
+        node_ids = []
+        for node_file in filter(lambda f: 'GraphNode' in f, os.listdir(paths[0])):
+            with open(os.path.join(paths[0], node_file)) as handle:
+                node_ids.append(str(json.load(handle)['NodeId']))
+
+        for nodeId in node_ids:
+            if nodeId.zfill(5) not in scenario_node_names:
+                problems.append('Node {} not part of scenario {}'.format(nodeId.zfill(5), scenario.name))
+
+        for path in paths:
+            for name, nodes in (('Results.h5', node_ids), ('Results_sum.h5', ['0'])):
+                file_name = os.path.join(os.path.basename(path), name)
+                if not os.path.isfile(os.path.join(path, name)):
+                    problems.append('{} not found!'.format(file_name))
+                    continue
+
+                with h5py.File(os.path.join(path, name), 'r') as h5:
+                    for nodeId in nodes:
+                        scan_node(file_name, h5, nodeId)
+
+    return problems
+
+
+class Command(ImportLocksMixin, ProgressMixin, BaseCommand):
     help = 'Download and import RKI data'
 
     def add_arguments(self, parser):
+        super().add_arguments(parser)
         parser.add_argument('data_path', type=str)
         parser.add_argument('--action', default=None, 
                             help="In the case of existing simulation data with the same key, action controls if the new data is appended or replaces the old data. "
                                  "If None is given or it is not specified, the command will ask for user input."
-                                 "A value of 1 replaces the previous scenario and a value of 2 appends the simulation data", type=str)
+                                 "A value of 1 replaces the previous scenario and a value of 2 appends the simulation data. "
+                                 "A value of 3 imports the new data next to the previous one and replaces it when done, so "
+                                 "users never see partial data", type=str)
+        parser.add_argument('--percentiles', default=None, nargs='+', type=int,
+                            help="Percentiles to compute from the runs of an ensemble (default: 'percentiles' in the "
+                                 "metadata or {})".format(' '.join(map(str, DEFAULT_PERCENTILES))))
+        parser.add_argument('--batch-size', default=BATCH_SIZE, type=int,
+                            help="Number of data entries saved at once, bounds the memory used by the import")
+        parser.add_argument('--validate-only', action='store_true',
+                            help="Only check the metadata and the names and shapes of all nodes and datasets against "
+                                 "the scenario and report every problem, nothing is imported")
+        parser.add_argument('--job', type=int, default=None, help=argparse.SUPPRESS)
 
     def handle(self, *args, **options):
+        self.batch_size = options['batch_size']
+        if self.batch_size < 1:
+            raise CommandError('The batch size must be positive!')
 
         path = options['data_path']
         if not path:
@@ -187,47 +350,56 @@ class Command(BaseCommand):
         if "metadata.json" not in files:
             raise CommandError('No metadata.json found in data folder!')
 
-        print(files)
-
-        percentiles = list(map(lambda p: int(p) if p.isnumeric() else int(p[1:]),
-                               filter(lambda f: os.path.isdir(os.path.join(path, f)), files)))
-
-        print(percentiles)
-        if len(percentiles) == 0:
-            raise CommandError('No percentiles found to import!')
-
         with open(os.path.join(path, 'metadata.json')) as metafile:
             meta = json.load(metafile)
 
-        # check mandatory keys
-        for key in MANDATORY:
-            if key not in meta:
-                raise CommandError('Mandatory key "{}" is missing in metadata file!'.format(key))
+        folders = sorted(filter(lambda f: os.path.isdir(os.path.join(path, f)), files))
+        runs = [os.path.join(path, f) for f in folders if RUN_FOLDER.match(f)]
 
-        try:
-            scenario = models.Scenario.objects.get(key=meta['scenario'])
-        except models.Scenario.DoesNotExist:
-            raise CommandError('Scenario {} does not exist!'.format(meta['scenario']))
+        if runs:
+            percentiles = options['percentiles'] or meta.get('percentiles', DEFAULT_PERCENTILES)
+            # all runs are imported at once, their percentiles are computed while importing
+            results = [(runs, percentiles, 'Processing {} runs, computing percentiles {}'.format(
+                len(runs), ', '.join(map(str, percentiles))))]
+        else:
+            results = [([os.path.join(path, f)], [int(f) if f.isnumeric() else int(f[1:])],
+                        'Processing percentile {}'.format(f)) for f in folders]
 
-        compartments = scenario.compartments.all()
-        order = meta['compartmentOrder']
+        if len(results) == 0:
+            raise CommandError('No percentiles found to import!')
 
-        for compartment in compartments:
+        if options['validate_only']:
             try:
-                index = order.index(compartment.name)
-            except ValueError:
-                raise CommandError(self.style.ERROR('Compartment {} not found in mapping'.format(compartment.name)))
+                return self.validate(meta, results)
+            finally:
+                if is_zip:
+                    temp_dir.cleanup()
+
+        # checked before anything is written, replacing a simulation (action 1) deletes it first
+        problems = percentile_problems(results)
+        if problems:
+            raise CommandError(problems[0])
+
+        scenario = check_metadata(meta)
+        self.locks.acquire(exclusive=[simulation_lock(meta['key'])], shared=[scenario_lock(scenario.key), REGIONS_LOCK],
+                           progress=self.progress)
+        order = meta['compartmentOrder']
 
         simulation = None
+        # replaced by the staging simulation after the import (action 3)
+        replaced = None
 
         try:
             simulation = models.Simulation.objects.get(key=meta['key'])
             
             self.stdout.write('Simulation {} already exists!\n'.format(meta['name']))
             action = options['action']
+            if action is None and options['job'] is not None:
+                raise CommandError('Simulation {} already exists, an action is required'.format(meta['key']))
             if action is None:
                 self.stdout.write('What do you want to do?')
-                action = input("(1) replace simulation, (2) append simulation data \n")
+                action = input("(1) replace simulation, (2) append simulation data, "
+                               "(3) replace simulation after importing it \n")
 
             if action == '1':
                 self.stdout.write(' Replacing simulation')
@@ -236,6 +408,10 @@ class Command(BaseCommand):
             elif action == '2':
                 self.stdout.write(' Appending simulation')
                 pass
+            elif action == '3':
+                self.stdout.write(' Replacing simulation after the import')
+                replaced = simulation
+                simulation = None
             else:
                 raise CommandError(self.style.ERROR('Unrecognized input {}!'.format(action)))
 
@@ -246,19 +422,68 @@ class Command(BaseCommand):
 
         if simulation is None:
             simulation = models.Simulation( \
-                key=meta['key'], \
+                # the key is unique, the staging simulation takes the key over when it replaces the simulation
+                key=meta['key'] if replaced is None else '~{}'.format(uuid.uuid4().hex[:19]), \
                 name=meta['name'], \
                 description=meta['description'], \
                 scenario=scenario, \
                 start_day=start_day,
-                number_of_days=meta['numberOfDays'])
+                number_of_days=meta['numberOfDays'],
+                staging=replaced is not None)
 
             simulation.save()
 
-        for percentile in percentiles:
-            process_percentile(self, os.path.join(path, str(percentile)), percentile, meta, simulation, scenario,
-                               compartments, order, start_day)
+        try:
+            for paths, percentiles, label in results:
+                process_results(self, paths, percentiles, label, meta, simulation, scenario, order, start_day)
+
+            self.stdout.write('Computing regional rollups')
+            with self.progress.phase('Computing regional rollups'):
+                compute_simulation_rollups(simulation, batch_size=self.batch_size)
+
+            simulation.refresh_metadata()
+        except Exception:
+            if replaced is not None:
+                self.stdout.write('Deleting the staging simulation, simulation {} is kept'.format(meta['key']))
+                staging_nodes = list(simulation.nodes.values_list('id', flat=True))
+                simulation.delete()
+                delete_simulation_nodes(staging_nodes)
+            raise
+
+        replaced_nodes = []
+        if replaced is not None:
+            self.stdout.write('Replacing simulation {} by the staging simulation'.format(meta['key']))
+            replaced_nodes = replaced.replace_with(simulation)
+            simulation = replaced
+
+        invalidate_responses(simulation_scope(simulation.id))
+        with self.progress.phase('Warming up the response cache'):
+            for url, status in warm_up_simulation(simulation).items():
+                if status != 200:
+                    self.stdout.write(self.style.WARNING('Warming up {} {}'.format(
+                        url, 'skipped' if status is None else 'failed with status {}'.format(status))))
+
+        if replaced_nodes and options['job'] is not None:
+            # the job is done, the worker deletes the data afterwards
+            delete_simulation_nodes.delay(replaced_nodes)
+        elif replaced_nodes:
+            self.stdout.write('Deleting the replaced simulation data')
+            delete_simulation_nodes(replaced_nodes)
 
         if is_zip:
             self.stdout.write('Deleting temporary folder {}'.format(path, temp_dir.name))
             temp_dir.cleanup()
+
+    def validate(self, meta, results):
+        scenario, problems = metadata_problems(meta)
+        problems += percentile_problems(results)
+        if scenario is not None:
+            problems += results_problems(meta, scenario, results)
+
+        for problem in problems:
+            self.stdout.write(self.style.ERROR(problem))
+
+        if problems:
+            raise CommandError('Found {} problems, the simulation can not be imported'.format(len(problems)))
+
+        self.stdout.write(self.style.SUCCESS('The simulation can be imported'))
@@ -0,0 +1,24 @@
+# SPDX-FileCopyrightText: 2024 German Aerospace Center (DLR)
+# SPDX-License-Identifier: Apache-2.0
+
+import argparse
+import json
+
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from src.common.benchmarks import measure
+
+
+class Command(BaseCommand):
+    help = 'Run a management command and write its wall time, written rows, queries and peak RSS to a JSON file'
+
+    def add_arguments(self, parser):
+        parser.add_argument('report', type=str, help="Path of the JSON report file")
+        parser.add_argument('command', type=str)
+        parser.add_argument('arguments', nargs=argparse.REMAINDER)
+
+    def handle(self, *args, **options):
+        result = measure(lambda: call_command(options['command'], *options['arguments']))
+
+        with open(options['report'], 'w') as file:
+            json.dump(result, file)
@@ -0,0 +1,30 @@
+# SPDX-FileCopyrightText: 2024 German Aerospace Center (DLR)
+# SPDX-License-Identifier: Apache-2.0
+
+import argparse
+
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from src.common.profiling import Profiler
+
+
+class Command(BaseCommand):
+    help = 'Run a management command under the profiler and write the report to a file'
+
+    def add_arguments(self, parser):
+        parser.add_argument('report', type=str, help="Path of the report file")
+        parser.add_argument('command', type=str)
+        parser.add_argument('arguments', nargs=argparse.REMAINDER)
+
+    def handle(self, *args, **options):
+        profiler = Profiler()
+        with profiler.activate():
+            call_command(options['command'], *options['arguments'])
+
+        self.stdout.write('Explaining queries')
+        title = 'Profile of command "{}"'.format(' '.join([options['command'], *options['arguments']]))
+
+        with open(options['report'], 'w') as file:
+            file.write(profiler.report(title))
+
+        self.stdout.write(self.style.SUCCESS('Wrote profile report to "{}"'.format(options['report'])))
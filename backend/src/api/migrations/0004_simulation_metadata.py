@@ -0,0 +1,46 @@
+# SPDX-FileCopyrightText: 2024 German Aerospace Center (DLR)
+# SPDX-License-Identifier: Apache-2.0
+
+from django.db import migrations, models
+
+
+def fillin_simulation_metadata(apps, schema_editor):
+    """Record the derived metadata for all simulations imported before it was stored"""
+    Simulation = apps.get_model('api', 'Simulation')
+    DataEntry = apps.get_model('api', 'DataEntry')
+    Group = apps.get_model('api', 'Group')
+
+    for simulation in Simulation.objects.all():
+        entries = DataEntry.objects.filter(simulationnode__simulation=simulation)
+
+        simulation.percentiles = list(entries.order_by('percentile').values_list('percentile', flat=True).distinct())
+        simulation.groups = list(
+            Group.objects.filter(dataentry__in=entries).order_by('key').values_list('key', flat=True).distinct())
+        simulation.number_of_nodes = simulation.nodes.count()
+        simulation.save()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0003_fill_data'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='simulation',
+            name='groups',
+            field=models.JSONField(default=list),
+        ),
+        migrations.AddField(
+            model_name='simulation',
+            name='number_of_nodes',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='simulation',
+            name='percentiles',
+            field=models.JSONField(default=list),
+        ),
+        migrations.RunPython(fillin_simulation_metadata, migrations.RunPython.noop),
+    ]
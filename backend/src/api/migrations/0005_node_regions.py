@@ -0,0 +1,38 @@
+# SPDX-FileCopyrightText: 2024 German Aerospace Center (DLR)
+# SPDX-License-Identifier: Apache-2.0
+
+from src.api.fixtures.initial_data import STATES
+from django.db import migrations, models
+
+
+def fillin_states(apps, schema_editor):
+    """Add a region node for every federal state, with its counties as members"""
+    Node = apps.get_model('api', 'Node')
+
+    for key, label in STATES:
+        state = Node(name=key, metadata={'key': key, 'label': label})
+        state.save()
+
+        state.members.set(Node.objects.filter(name__startswith=key).exclude(name=key))
+
+
+def remove_states(apps, schema_editor):
+    Node = apps.get_model('api', 'Node')
+
+    Node.objects.filter(name__in=[key for key, _ in STATES]).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0004_simulation_metadata'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='node',
+            name='members',
+            field=models.ManyToManyField(blank=True, related_name='regions', to='api.Node'),
+        ),
+        migrations.RunPython(fillin_states, remove_states),
+    ]
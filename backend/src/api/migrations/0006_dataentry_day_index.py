@@ -0,0 +1,18 @@
+# SPDX-FileCopyrightText: 2024 German Aerospace Center (DLR)
+# SPDX-License-Identifier: Apache-2.0
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0005_node_regions'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='dataentry',
+            index=models.Index(fields=['day', 'percentile'], name='api_dataent_day_d74fb7_idx'),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# SPDX-FileCopyrightText: 2024 German Aerospace Center (DLR)
+# SPDX-License-Identifier: Apache-2.0
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0008_importupload'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='simulation',
+            name='staging',
+            field=models.BooleanField(default=False),
+        ),
+    ]
@@ -0,0 +1,56 @@
+# SPDX-FileCopyrightText: 2024 German Aerospace Center (DLR)
+# SPDX-License-Identifier: Apache-2.0
+
+from django.db import migrations, models
+
+RKI_DATA_VIEW = """
+    CREATE VIEW api_rkidata AS
+    SELECT
+        api_dataentry.id as id,
+        api_rkinode_data.rkinode_id as rkinode_id,
+        api_node.id as node_id,
+        api_node.name as node_name,
+        api_dataentry.day as day,
+        api_dataentry.percentile as percentile,
+        api_dataentry.data as data,
+        {version}
+        string_agg(api_group.key, ',') as groups
+    FROM api_dataentry
+    INNER JOIN api_rkinode_data
+        ON (api_dataentry.id = api_rkinode_data.dataentry_id)
+    INNER JOIN api_rkinode
+        ON (api_rkinode.id = api_rkinode_data.rkinode_id)
+    INNER JOIN api_node
+        ON (api_node.id = api_rkinode.node_id)
+    INNER JOIN api_dataentry_groups
+        ON (api_dataentry.id = api_dataentry_groups.dataentry_id)
+    INNER JOIN api_group
+        ON (api_group.key = api_dataentry_groups.group_id)
+    GROUP BY 1, 2, 3, 4, 5, 6, 7{group_by}
+    ORDER BY api_dataentry.day ASC;
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0009_simulation_staging'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='dataentry',
+            name='version',
+            field=models.BigIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='rkinode',
+            name='version',
+            field=models.BigIntegerField(default=0),
+        ),
+        # the RKI data view exposes the version of the entries
+        migrations.RunSQL(
+            sql=['DROP VIEW api_rkidata', RKI_DATA_VIEW.format(version='api_dataentry.version as version,', group_by=', 8')],
+            reverse_sql=['DROP VIEW api_rkidata', RKI_DATA_VIEW.format(version='', group_by='')],
+        ),
+    ]
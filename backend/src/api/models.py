@@ -1,7 +1,8 @@
 # SPDX-FileCopyrightText: 2024 German Aerospace Center (DLR)
 # SPDX-License-Identifier: Apache-2.0
 
-from django.db import models
+from django.db import models, transaction
+import os
 
 # Create your models here.
 class Node(models.Model):
@@ -12,6 +13,9 @@ class Node(models.Model):
     description = models.TextField()
     metadata = models.JSONField()
 
+    # Region nodes (e.g. federal states) hold the rolled up data of their member nodes
+    members = models.ManyToManyField('self', symmetrical=False, related_name='regions', blank=True)
+
     class Meta:
         pass
 
@@ -139,11 +143,14 @@ class DataEntry(models.Model):
     day = models.DateField()
     data = models.JSONField()
     percentile = models.IntegerField(default=50)
+    # Data version of the RKI import that added or last revised the entry, see RKINode.version
+    version = models.BigIntegerField(default=0)
 
     groups = models.ManyToManyField(Group) 
 
     class Meta:
-        pass
+        # day maps select the entries of a single day, see the data views
+        indexes = [models.Index(fields=['day', 'percentile'])]
 
 
 class SimulationModel(models.Model):
@@ -287,12 +294,58 @@ class Simulation(models.Model):
     scenario = models.ForeignKey(Scenario, on_delete=models.CASCADE)
     nodes = models.ManyToManyField(SimulationNode)
 
+    # Derived metadata, recorded at import time by refresh_metadata()
+    percentiles = models.JSONField(default=list)
+    groups = models.JSONField(default=list)
+    number_of_nodes = models.IntegerField(default=0)
+
+    # Imported in the background to replace the simulation with the same key, see replace_with()
+    staging = models.BooleanField(default=False)
+
+    # Fields taken over from the staging simulation
+    REPLACED_FIELDS = ('name', 'description', 'start_day', 'number_of_days', 'scenario', 'percentiles', 'groups',
+                       'number_of_nodes')
+
     class Meta:
         pass
 
     def __str__(self):
         return 'Simulation(%s)'.format(self.name)
 
+    def replace_with(self, staging):
+        """
+        Takes over the nodes and metadata of the staging simulation and deletes it, in one short transaction.
+        Readers see either the previous or the new data. Returns the ids of the replaced simulation nodes, their data is
+        left for delete_simulation_nodes().
+        """
+        SimulationNodes = Simulation.nodes.through
+
+        with transaction.atomic():
+            # concurrent replacements of the same simulation wait for each other
+            Simulation.objects.select_for_update().get(id=self.id)
+
+            replaced = list(SimulationNodes.objects.filter(simulation=self).values_list('simulationnode_id', flat=True))
+            SimulationNodes.objects.filter(simulation=self).delete()
+            SimulationNodes.objects.filter(simulation=staging).update(simulation=self)
+
+            for field in self.REPLACED_FIELDS:
+                setattr(self, field, getattr(staging, field))
+            self.save()
+            staging.delete()
+
+        return replaced
+
+    def refresh_metadata(self):
+        """Recompute the derived metadata from the stored data entries and save it."""
+        entries = DataEntry.objects.filter(simulationnode__simulation=self)
+
+        self.percentiles = list(entries.order_by('percentile').values_list('percentile', flat=True).distinct())
+        self.groups = list(
+            Group.objects.filter(dataentry__in=entries).order_by('key').values_list('key', flat=True).distinct())
+        self.number_of_nodes = self.nodes.filter(scenario_node__node__members__isnull=True).count()
+
+        self.save(update_fields=['percentiles', 'groups', 'number_of_nodes'])
+
 
 class SimulationData(models.Model):
     simulationnode = models.ForeignKey(SimulationNode, on_delete=models.DO_NOTHING)
@@ -311,6 +364,8 @@ class RKINode(models.Model):
     """Model definition for one rki data entry."""
     node = models.ForeignKey(Node, on_delete=models.RESTRICT)
     data = models.ManyToManyField(DataEntry)
+    # Data version up to which the data of the node is complete, clients sync the entries with a newer version
+    version = models.BigIntegerField(default=0)
 
     class Meta:
         pass
@@ -319,6 +374,11 @@ class RKINode(models.Model):
     def name(self):
         return self.node.name
 
+    @staticmethod
+    def next_version():
+        """Returns the data version of a new RKI import, only one import may change the RKI data at a time."""
+        return (RKINode.objects.aggregate(version=models.Max('version'))['version'] or 0) + 1
+
 
 class RKIData(models.Model):
     rkinode = models.ForeignKey(RKINode, on_delete=models.DO_NOTHING)
@@ -328,7 +388,89 @@ class RKIData(models.Model):
     day = models.DateField()
     percentile = models.IntegerField()
     data = models.JSONField()
+    version = models.BigIntegerField()
 
     class Meta:
         managed = False
         db_table = 'api_rkidata'
+
+
+class ImportJob(models.Model):
+    """Model definition for an import running in the background on a worker, see src.api.tasks."""
+
+    class Command(models.TextChoices):
+        SCENARIO = 'import_scenario'
+        SIMULATION = 'import_simulation'
+        RKI = 'import_rki'
+
+    class Status(models.TextChoices):
+        PENDING = 'pending'
+        RUNNING = 'running'
+        CANCELLING = 'cancelling'
+        CANCELLED = 'cancelled'
+        SUCCEEDED = 'succeeded'
+        FAILED = 'failed'
+
+    # Fields
+    command = models.CharField(max_length=30, choices=Command.choices)
+    # Path of the data, relative to the IMPORT_DIR setting
+    path = models.CharField(max_length=1000)
+    # Further command line arguments, e.g. ['--action', '1']
+    arguments = models.JSONField(default=list, blank=True)
+
+    status = models.CharField(max_length=20, choices=Status.choices, default=Status.PENDING)
+    # Current phase and its progress (0 to 1, None if unknown), see src.api.jobs.Progress
+    phase = models.CharField(max_length=100, blank=True)
+    progress = models.FloatField(null=True, blank=True)
+    # Finished phases with their duration, [{'name': ..., 'seconds': ...}]
+    phases = models.JSONField(default=list, blank=True)
+    output = models.TextField(blank=True)
+    error = models.TextField(blank=True)
+
+    task_id = models.CharField(max_length=50, blank=True)
+    created_by = models.ForeignKey('users.User', null=True, blank=True, on_delete=models.SET_NULL)
+    created = models.DateTimeField(auto_now_add=True)
+    started = models.DateTimeField(null=True, blank=True)
+    finished = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        pass
+
+    def __str__(self):
+        return 'ImportJob({}, {})'.format(self.command, self.path)
+
+    @property
+    def is_finished(self):
+        return self.status in (self.Status.CANCELLED, self.Status.SUCCEEDED, self.Status.FAILED)
+
+
+class ImportUpload(models.Model):
+    """Model definition for a simulation archive uploaded in chunks, it is imported by a job once it is complete."""
+
+    # Fields
+    filename = models.CharField(max_length=255)
+    # Size of the archive and bytes received so far, an interrupted upload resumes at received
+    size = models.BigIntegerField()
+    received = models.BigIntegerField(default=0)
+    # Further command line arguments of the import, e.g. ['--action', '1']
+    arguments = models.JSONField(default=list, blank=True)
+    error = models.TextField(blank=True)
+
+    job = models.OneToOneField(ImportJob, null=True, blank=True, on_delete=models.SET_NULL, related_name='upload')
+    created_by = models.ForeignKey('users.User', null=True, blank=True, on_delete=models.SET_NULL)
+    created = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        pass
+
+    def __str__(self):
+        return 'ImportUpload({}, {}/{})'.format(self.filename, self.received, self.size)
+
+    @property
+    def path(self):
+        """Path of the archive, relative to the IMPORT_DIR setting."""
+        return os.path.join('uploads', '{}.zip'.format(self.id))
+
+    @property
+    def is_complete(self):
+        return self.received == self.size
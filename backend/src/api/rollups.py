@@ -0,0 +1,109 @@
+# SPDX-FileCopyrightText: 2024 German Aerospace Center (DLR)
+# SPDX-License-Identifier: Apache-2.0
+
+import collections
+
+import src.api.models as models
+
+# Data entries saved at once by the imports and rollups, bounds their memory
+BATCH_SIZE = 5000
+
+
+def get_regions(regions=None):
+    """Returns the given regions or all region nodes, i.e. nodes with members."""
+    if regions is not None:
+        return regions
+
+    return models.Node.objects.filter(members__isnull=False).distinct()
+
+
+def sum_entries(rows, version=0, batch_size=BATCH_SIZE):
+    """
+    Sums (day, percentile, groups, data) rows of the data views, ordered by day, into one data entry per day, percentile
+    and group set. The entries are saved with the data version and yielded in chunks of complete days, as soon as a
+    chunk holds batch_size entries. The views aggregate the groups of an entry in no particular order (e.g. 'a,b' or
+    'b,a'), so they are compared as sorted tuples.
+    """
+    totals = {}
+    last_day = None
+    for day, percentile, groups, data in rows:
+        if day != last_day and len(totals) >= batch_size:
+            yield save_totals(totals, version)
+            totals = {}
+
+        last_day = day
+        totals.setdefault((day, percentile, tuple(sorted(groups.split(',')))), collections.Counter()).update(data)
+
+    if totals:
+        yield save_totals(totals, version)
+
+
+def save_totals(totals, version):
+    entries = models.DataEntry.objects.bulk_create([
+        models.DataEntry(day=day, percentile=percentile, data=dict(values), version=version)
+        for (day, percentile, _), values in totals.items()
+    ])
+
+    DataEntryGroup = models.DataEntry.groups.through
+    DataEntryGroup.objects.bulk_create([
+        DataEntryGroup(dataentry_id=entry.id, group_id=group)
+        for entry, (_, _, groups) in zip(entries, totals.keys())
+        for group in groups
+    ])
+
+    return entries
+
+
+def compute_simulation_rollups(simulation, regions=None, batch_size=BATCH_SIZE):
+    """
+    (Re)computes the rolled up series of a simulation for the given regions (default: all).
+    Each region is stored as its own simulation node, so it is served by the regular node endpoints.
+    """
+    regions = get_regions(regions)
+
+    # remove previous rollups of these regions
+    for simulation_node in simulation.nodes.filter(scenario_node__node__in=regions).distinct():
+        simulation_node.data.all().delete()
+        simulation_node.scenario_node.delete()
+
+    for region in regions:
+        members = simulation.nodes.filter(scenario_node__node__in=region.members.all())
+        if not members.exists():
+            continue
+
+        rows = models.SimulationData.objects \
+            .filter(simulationnode_id__in=members) \
+            .order_by('day') \
+            .values_list('day', 'percentile', 'groups', 'data') \
+            .iterator()
+
+        # region nodes are not part of the scenario definition, so the scenario node is not added to the scenario
+        scenario_node = models.ScenarioNode.objects.create(node=region)
+        simulation_node = models.SimulationNode.objects.create(scenario_node=scenario_node)
+        for entries in sum_entries(rows, batch_size=batch_size):
+            simulation_node.data.add(*entries)
+        simulation.nodes.add(simulation_node)
+
+
+def compute_rki_rollups(regions=None, since=None, version=0, batch_size=BATCH_SIZE):
+    """
+    (Re)computes the rolled up RKI series for the given regions (default: all), from day since on if given.
+    The entries get the data version of the import and are saved in chunks of batch_size entries.
+    """
+    for region in get_regions(regions):
+        if not models.RKINode.objects.filter(node__in=region.members.all()).exists():
+            continue
+
+        rows = models.RKIData.objects.filter(node__in=region.members.all())
+        if since is not None:
+            rows = rows.filter(day__gte=since)
+        rows = rows.order_by('day').values_list('day', 'percentile', 'groups', 'data').iterator()
+
+        rki_node, _ = models.RKINode.objects.get_or_create(node=region)
+        if since is None:
+            rki_node.data.all().delete()
+        else:
+            rki_node.data.filter(day__gte=since).delete()
+
+        for entries in sum_entries(rows, version, batch_size):
+            rki_node.data.add(*entries)
@@ -2,8 +2,10 @@
 # SPDX-License-Identifier: Apache-2.0
 
 from .models import *
+from django.conf import settings
 from rest_framework import serializers
 import json
+import os
 
 
 class DistributionSerializer(serializers.ModelSerializer):
@@ -87,9 +89,11 @@ class NodeSerializer(serializers.ModelSerializer):
     """
     JSON serializer for a node
     """
+    members = serializers.SlugRelatedField(slug_field='name', read_only=True, many=True)
+
     class Meta:
         model = Node
-        fields = ['name', 'metadata']
+        fields = ['name', 'metadata', 'members']
 
 
 class ParameterSerializer(serializers.ModelSerializer):
@@ -156,16 +160,10 @@ class SimulationSerializerMeta(serializers.HyperlinkedModelSerializer):
     JSON serializer simulation meta data
     """
 
-    percentiles = serializers.SerializerMethodField('get_percentiles')
-
     class Meta:
         model = Simulation
-        fields = ['id', 'name', 'description', 'start_day', 'number_of_days', 'scenario', 'percentiles']
-
-
-    def get_percentiles(self, simulation):
-        entries = list(simulation.nodes.first().data.all().distinct("percentile"))
-        return [entry.percentile for entry in entries]
+        fields = ['id', 'name', 'description', 'start_day', 'number_of_days', 'scenario', 'percentiles', 'groups',
+                  'number_of_nodes']
 
 class SimulationNodeSerializer(serializers.ModelSerializer):
     """
@@ -286,4 +284,61 @@ class GroupSerializer(serializers.ModelSerializer):
     """
     class Meta:
         model = Group
-        fields = ["key", "name", "description", "category"]
\ No newline at end of file
+        fields = ["key", "name", "description", "category"]
+
+
+def validate_arguments(value):
+    """Checks the command line arguments of an import."""
+    if not isinstance(value, list) or not all(isinstance(argument, str) for argument in value):
+        raise serializers.ValidationError('Arguments must be a list of strings.')
+
+    return value
+
+
+class ImportJobSerializer(serializers.ModelSerializer):
+    """
+    JSON serializer for an import job, only the command, path and arguments are set when it is created
+    """
+    created_by = serializers.SlugRelatedField(slug_field='username', read_only=True)
+
+    class Meta:
+        model = ImportJob
+        fields = ['id', 'command', 'path', 'arguments', 'status', 'phase', 'progress', 'phases', 'output', 'error',
+                  'created_by', 'created', 'started', 'finished']
+        read_only_fields = ['status', 'phase', 'progress', 'phases', 'output', 'error', 'created', 'started',
+                            'finished']
+
+    def validate_path(self, value):
+        import_dir = os.path.realpath(settings.IMPORT_DIR)
+        path = os.path.realpath(os.path.join(import_dir, value))
+
+        if os.path.commonpath([import_dir, path]) != import_dir:
+            raise serializers.ValidationError('Path must be inside the import folder.')
+        if not os.path.exists(path):
+            raise serializers.ValidationError('Path does not exist in the import folder.')
+
+        return value
+
+    def validate_arguments(self, value):
+        return validate_arguments(value)
+
+
+class ImportUploadSerializer(serializers.ModelSerializer):
+    """
+    JSON serializer for an uploaded simulation archive, the data itself is sent in chunks
+    """
+    created_by = serializers.SlugRelatedField(slug_field='username', read_only=True)
+
+    class Meta:
+        model = ImportUpload
+        fields = ['id', 'filename', 'size', 'received', 'arguments', 'error', 'job', 'created_by', 'created']
+        read_only_fields = ['received', 'error', 'job', 'created']
+
+    def validate_size(self, value):
+        if value <= 0:
+            raise serializers.ValidationError('Size must be positive.')
+
+        return value
+
+    def validate_arguments(self, value):
+        return validate_arguments(value)
@@ -0,0 +1,19 @@
+# SPDX-FileCopyrightText: 2024 German Aerospace Center (DLR)
+# SPDX-License-Identifier: Apache-2.0
+
+from django.db.models.signals import post_delete
+from django.dispatch import receiver
+
+from src.api.models import Scenario, Simulation
+from src.common.cache import invalidate_responses, SCENARIOS, simulation_scope
+
+
+@receiver(post_delete, sender=Simulation)
+def simulation_deleted(sender, instance, **kwargs):
+    # e.g. a simulation replaced by an import, its id may not be served from the cache anymore
+    invalidate_responses(simulation_scope(instance.id))
+
+
+@receiver(post_delete, sender=Scenario)
+def scenario_deleted(sender, instance, **kwargs):
+    invalidate_responses(SCENARIOS)
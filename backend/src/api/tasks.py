@@ -0,0 +1,64 @@
+# SPDX-FileCopyrightText: 2024 German Aerospace Center (DLR)
+# SPDX-License-Identifier: Apache-2.0
+
+import io
+import os
+
+from celery import shared_task
+from django.conf import settings
+from django.core.management import call_command
+from django.db import transaction
+from django.utils import timezone
+
+from src.api.jobs import ImportCancelled
+from src.api.models import ImportJob, SimulationNode
+from src.api.rollups import get_regions
+
+
+@shared_task
+def run_import(job_id):
+    """Runs the import command of the job, the job records its status, progress and output."""
+    started = ImportJob.objects.filter(id=job_id, status=ImportJob.Status.PENDING).update(
+        status=ImportJob.Status.RUNNING, started=timezone.now())
+    if not started:
+        # cancelled before a worker picked it up
+        return
+
+    job = ImportJob.objects.get(id=job_id)
+    output = io.StringIO()
+
+    try:
+        call_command(job.command, os.path.join(settings.IMPORT_DIR, job.path), *job.arguments, job=job.id,
+                     stdout=output, stderr=output)
+    except ImportCancelled:
+        status, error = ImportJob.Status.CANCELLED, ''
+    except Exception as e:
+        status, error = ImportJob.Status.FAILED, '{}: {}'.format(type(e).__name__, e)
+    else:
+        status, error = ImportJob.Status.SUCCEEDED, ''
+
+    ImportJob.objects.filter(id=job_id).update(
+        status=status, error=error, output=output.getvalue(), finished=timezone.now())
+
+
+def queue_import(job):
+    """Queues the job for a worker once the current transaction is committed, so the worker finds it."""
+    def enqueue():
+        result = run_import.delay(job.id)
+        ImportJob.objects.filter(id=job.id).update(task_id=result.id)
+
+    transaction.on_commit(enqueue)
+
+
+@shared_task
+def delete_simulation_nodes(node_ids):
+    """Deletes simulation nodes and their data, e.g. the nodes of a replaced simulation (see Simulation.replace_with)."""
+    regions = set(get_regions().values_list('id', flat=True))
+
+    for simulation_node in SimulationNode.objects.filter(id__in=node_ids).select_related('scenario_node'):
+        simulation_node.data.all().delete()
+        # the scenario nodes of regions belong to a single simulation, see compute_simulation_rollups
+        if simulation_node.scenario_node.node_id in regions:
+            simulation_node.scenario_node.delete()
+        else:
+            simulation_node.delete()
@@ -0,0 +1,65 @@
+# SPDX-FileCopyrightText: 2024 German Aerospace Center (DLR)
+# SPDX-License-Identifier: Apache-2.0
+
+from datetime import date, timedelta
+
+import factory
+
+import src.api.models as models
+
+
+class ScenarioFactory(factory.django.DjangoModelFactory):
+    class Meta:
+        model = 'api.Scenario'
+
+    key = factory.Sequence(lambda n: f'scenario{n}')
+    name = factory.Sequence(lambda n: f'Scenario {n}')
+    description = ''
+    simulation_model = factory.LazyFunction(lambda: models.SimulationModel.objects.get(key='secihurd'))
+    number_of_groups = 0
+    number_of_nodes = 0
+
+
+class SimulationFactory(factory.django.DjangoModelFactory):
+    class Meta:
+        model = 'api.Simulation'
+
+    key = factory.Sequence(lambda n: f'simulation{n}')
+    name = factory.Sequence(lambda n: f'Simulation {n}')
+    description = ''
+    start_day = date(2021, 1, 1)
+    number_of_days = 3
+    scenario = factory.SubFactory(ScenarioFactory)
+
+
+def create_simulation(nodes=('00000', '01001'), groups=('total', ), percentiles=(50, ), number_of_days=3, **kwargs):
+    """Create a simulation with one data entry per node, group, percentile and day.
+
+    The compartment values are derived from the position of the entry so tests can check sums.
+    """
+    simulation = SimulationFactory(number_of_days=number_of_days, **kwargs)
+
+    for node_index, node_name in enumerate(nodes):
+        scenario_node = models.ScenarioNode.objects.create(node=models.Node.objects.get(name=node_name))
+        simulation.scenario.nodes.add(scenario_node)
+
+        simulation_node = models.SimulationNode.objects.create(scenario_node=scenario_node)
+        simulation.nodes.add(simulation_node)
+
+        for group_key in groups:
+            group = models.Group.objects.get(key=group_key)
+            for percentile in percentiles:
+                entries = models.DataEntry.objects.bulk_create([
+                    models.DataEntry(day=simulation.start_day + timedelta(days=day),
+                                     percentile=percentile,
+                                     data={
+                                         'MildInfections': float(node_index + 1) * percentile + day,
+                                         'Dead': float(day),
+                                     }) for day in range(number_of_days)
+                ])
+                for entry in entries:
+                    entry.groups.add(group)
+                simulation_node.data.add(*entries)
+
+    simulation.refresh_metadata()
+    return simulation
@@ -0,0 +1,381 @@
+# SPDX-FileCopyrightText: 2024 German Aerospace Center (DLR)
+# SPDX-License-Identifier: Apache-2.0
+
+import io
+import json
+import os
+import tempfile
+import threading
+from datetime import date
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+import h5py
+import numpy as np
+import psycopg2
+from django.core.cache import cache
+from django.core.management import call_command, CommandError
+from django.db import connection
+from django.test import LiveServerTestCase, override_settings, TestCase
+from nose.tools import assert_raises, eq_, ok_
+
+from ..locks import ImportLocks, lock_id, REGIONS_LOCK, scenario_lock, simulation_lock
+from ..models import DataEntry, RKINode, Scenario, ScenarioNode, Simulation, SimulationNode
+from .factories import create_simulation
+
+
+def run(*args):
+    call_command(*args, stdout=io.StringIO(), stderr=io.StringIO())
+
+
+class TestImportGeneratedDataset(TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.path = self.temp_dir.name
+        run('generate_dataset', self.path, '--nodes', '3', '--days', '5', '--groups', 'age_0', 'total',
+            '--percentiles', '25', '75')
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def test_import_generated_dataset(self):
+        run('import_scenario', os.path.join(self.path, 'scenario.json'))
+        eq_(Scenario.objects.get(key='synthetic').nodes.count(), 4)
+
+        run('import_simulation', os.path.join(self.path, 'simulation'))
+        simulation = Simulation.objects.get(key='synthetic')
+        eq_(simulation.percentiles, [25, 75])
+        eq_(simulation.groups, ['age_0', 'total'])
+        eq_(simulation.number_of_nodes, 4)
+
+        run('import_rki', os.path.join(self.path, 'rki'))
+        eq_(RKINode.objects.get(node__name='01001').data.count(), 2 * 6)
+
+    def test_import_report(self):
+        run('import_scenario', os.path.join(self.path, 'scenario.json'))
+        report_path = os.path.join(self.path, 'report.json')
+        run('import_simulation', os.path.join(self.path, 'simulation'), '--report', report_path)
+
+        with open(report_path) as file:
+            report = json.load(file)
+        eq_(report['command'], 'import_simulation')
+        eq_([phase['name'] for phase in report['phases']],
+            ['Processing percentile 25', 'Processing percentile 75', 'Computing regional rollups',
+             'Warming up the response cache'])
+
+        # 2 groups and 6 days of 4 nodes
+        phase = report['phases'][0]
+        eq_(phase['queries']['INSERT api_dataentry']['rows'], 2 * 6 * 4)
+        eq_(phase['queries']['INSERT api_dataentry_groups']['rows'], 2 * 6 * 4)
+        eq_(phase['queries']['INSERT api_simulationnode_data']['rows'], 2 * 6 * 4)
+        ok_({'hdf5', 'percentiles', 'objects'} <= set(phase['timers']))
+
+        # the report is the only output on stdout
+        stdout, stderr = io.StringIO(), io.StringIO()
+        call_command('import_simulation', os.path.join(self.path, 'simulation'), '--action', '1', '--report', '-',
+                     stdout=stdout, stderr=stderr)
+        eq_(json.loads(stdout.getvalue())['command'], 'import_simulation')
+        ok_('Replacing simulation' in stderr.getvalue())
+
+    def test_push_metrics(self):
+        pushed = []
+
+        class Pushgateway(BaseHTTPRequestHandler):
+            def do_PUT(self):
+                pushed.append((self.path, self.rfile.read(int(self.headers['Content-Length'])).decode()))
+                self.send_response(200)
+                self.end_headers()
+
+            def log_message(self, *args):
+                pass
+
+        server = HTTPServer(('localhost', 0), Pushgateway)
+        thread = threading.Thread(target=server.serve_forever)
+        thread.start()
+        try:
+            with override_settings(METRICS_PUSHGATEWAY='localhost:{}'.format(server.server_port)):
+                run('import_rki', os.path.join(self.path, 'rki'), '--push-metrics')
+                run('import_scenario', os.path.join(self.path, 'scenario.json'))
+                run('import_simulation', os.path.join(self.path, 'simulation'), '--push-metrics')
+        finally:
+            server.shutdown()
+            thread.join()
+
+        # pushed after every phase
+        eq_(len(pushed), 3 + 4)
+        path, metrics = pushed[2]
+        eq_(path, '/metrics/job/esid_import/command/import_rki')
+        ok_('esid_import_phase_seconds{command="import_rki",phase="Processing nodes"}' in metrics)
+        ok_('statement="INSERT api_dataentry"' in metrics)
+
+        # every run pushes only its own phases
+        path, metrics = pushed[-1]
+        eq_(path, '/metrics/job/esid_import/command/import_simulation')
+        ok_('command="import_rki"' not in metrics)
+
+        with override_settings(METRICS_PUSHGATEWAY=''), assert_raises(CommandError):
+            run('import_rki', os.path.join(self.path, 'rki'), '--push-metrics')
+
+    def test_import_in_batches(self):
+        run('import_scenario', os.path.join(self.path, 'scenario.json'))
+        run('import_simulation', os.path.join(self.path, 'simulation'), '--batch-size', '7')
+
+        # 2 groups, 2 percentiles and 6 days per node, the rollups are summed in chunks of complete days
+        simulation = Simulation.objects.get(key='synthetic')
+        for name in ['00000', '01001', '01']:
+            eq_(DataEntry.objects.filter(simulationnode__simulation=simulation,
+                                         simulationnode__scenario_node__node__name=name).count(), 2 * 2 * 6)
+
+        with assert_raises(CommandError):
+            run('import_simulation', os.path.join(self.path, 'simulation'), '--action', '1', '--batch-size', '0')
+
+    def test_import_rki_in_batches(self):
+        run('import_rki', os.path.join(self.path, 'rki'), '--batch-size', '5')
+
+        # 2 groups and 6 days per node, the rollups are summed in chunks of complete days
+        eq_(RKINode.objects.get(node__name='01').data.count(), 2 * 6)
+
+        with assert_raises(CommandError):
+            run('import_rki', os.path.join(self.path, 'rki'), '--batch-size', '0')
+
+    def test_import_ensemble(self):
+        with tempfile.TemporaryDirectory() as path:
+            run('generate_dataset', path, '--nodes', '3', '--days', '5', '--groups', 'age_0', 'total',
+                '--percentiles', '10', '50', '90', '--runs', '5')
+            run('import_scenario', os.path.join(path, 'scenario.json'))
+            run('import_simulation', os.path.join(path, 'simulation'))
+
+            simulation = Simulation.objects.get(key='synthetic')
+            eq_(simulation.percentiles, [10, 50, 90])
+
+            # the median across the runs
+            runs = []
+            for index in range(5):
+                with h5py.File(os.path.join(path, 'simulation', 'run{}'.format(index), 'Results.h5'), 'r') as h5:
+                    runs.append(h5['1001']['Group2'][2, 0])
+
+        entry = DataEntry.objects.get(simulationnode__scenario_node__node__name='01001', groups='total',
+                                      day=date(2022, 1, 3), percentile=50)
+        ok_(abs(entry.data['MildInfections'] - np.median(runs)) < 1e-9)
+
+    def test_import_prefixed_percentiles(self):
+        os.rename(os.path.join(self.path, 'simulation', '25'), os.path.join(self.path, 'simulation', 'p25'))
+        run('import_scenario', os.path.join(self.path, 'scenario.json'))
+        run('import_simulation', os.path.join(self.path, 'simulation'))
+        eq_(Simulation.objects.get(key='synthetic').percentiles, [25, 75])
+
+    def test_validate_only(self):
+        run('import_scenario', os.path.join(self.path, 'scenario.json'))
+        simulation_path = os.path.join(self.path, 'simulation')
+        run('import_simulation', simulation_path, '--validate-only')
+
+        with open(os.path.join(simulation_path, 'metadata.json')) as file:
+            meta = json.load(file)
+        meta['numberOfDays'] = 6
+        meta['groupMapping']['Group1'] = 'unknown'
+        with open(os.path.join(simulation_path, 'metadata.json'), 'w') as file:
+            json.dump(meta, file)
+        with open(os.path.join(simulation_path, '25', 'GraphNode9.json'), 'w') as file:
+            json.dump({'NodeId': 9999}, file)
+
+        # all problems are reported at once, nothing is imported
+        stdout = io.StringIO()
+        with assert_raises(CommandError):
+            call_command('import_simulation', simulation_path, '--validate-only', stdout=stdout)
+        problems = stdout.getvalue().splitlines()
+        ok_(any('unknown' in problem for problem in problems))
+        ok_(any('09999 not part of scenario' in problem for problem in problems))
+        # 2 datasets of 4 nodes per percentile, node 9999 has no data
+        eq_(len([problem for problem in problems if 'has the shape' in problem]), 2 * 2 * 4)
+        ok_(any('no data found for node 9999' in problem for problem in problems))
+        eq_((Simulation.objects.count(), DataEntry.objects.count()), (0, 0))
+
+    def test_invalid_percentiles(self):
+        run('import_scenario', os.path.join(self.path, 'scenario.json'))
+        simulation_path = os.path.join(self.path, 'simulation')
+        run('import_simulation', simulation_path)
+        os.rename(os.path.join(simulation_path, '75'), os.path.join(simulation_path, 'p150'))
+
+        stdout = io.StringIO()
+        with assert_raises(CommandError):
+            call_command('import_simulation', simulation_path, '--validate-only', stdout=stdout)
+        ok_('Percentile 150 is not between 0 and 100!' in stdout.getvalue())
+
+        # the simulation is not replaced by the failed import
+        with assert_raises(CommandError):
+            run('import_simulation', simulation_path, '--action', '1')
+        eq_(Simulation.objects.get(key='synthetic').percentiles, [25, 75])
+
+    def test_incremental_rki_import(self):
+        run('import_rki', os.path.join(self.path, 'rki'))
+        entries = DataEntry.objects.count()
+
+        # importing everything again replaces the entries
+        run('import_rki', os.path.join(self.path, 'rki'))
+        eq_(DataEntry.objects.count(), entries)
+
+        node = RKINode.objects.get(node__name='01001')
+        last_day = node.data.get(groups='total', day=date(2022, 1, 6)).data
+
+        # the next data has two more days and revised values
+        with tempfile.TemporaryDirectory() as path:
+            run('generate_dataset', path, '--nodes', '3', '--days', '7', '--groups', 'age_0', 'total',
+                '--percentiles', '50')
+
+            run('import_rki', os.path.join(path, 'rki'), '--incremental')
+            eq_(node.data.count(), 2 * 8)
+            eq_(RKINode.objects.get(node__name='01').data.count(), 2 * 8)
+            eq_(node.data.get(groups='total', day=date(2022, 1, 6)).data, last_day)
+
+            run('import_rki', os.path.join(path, 'rki'), '--incremental', '--revise', '3')
+            eq_(node.data.count(), 2 * 8)
+            ok_(node.data.get(groups='total', day=date(2022, 1, 6)).data != last_day)
+
+            # the rollups of the revised days are recomputed
+            region = RKINode.objects.get(node__name='01').data.filter(groups='total')
+            eq_(region.count(), 8)
+            counties = DataEntry.objects.filter(rkinode__node__name__in=['01001', '01002', '01003'], groups='total',
+                                                day=date(2022, 1, 6))
+            total = sum(entry.data['MildInfections'] for entry in counties)
+            ok_(abs(region.get(day=date(2022, 1, 6)).data['MildInfections'] - total) < 1e-6)
+
+    @override_settings(RESPONSE_CACHE_TIMEOUT=60)
+    def test_delta_sync(self):
+        cache.clear()
+        run('import_rki', os.path.join(self.path, 'rki'))
+        url = '/api/v1/rki/01001/?all&groups=total'
+
+        def days(response):
+            return [entry['day'] for entry in response.json()['results']]
+
+        response = self.client.get(url)
+        eq_(response['X-Data-Version'], '1')
+        eq_(len(days(response)), 6)
+
+        with tempfile.TemporaryDirectory() as path:
+            run('generate_dataset', path, '--nodes', '3', '--days', '7', '--groups', 'age_0', 'total',
+                '--percentiles', '50')
+            run('import_rki', os.path.join(path, 'rki'), '--incremental', '--revise', '3')
+
+        # only the new and revised days
+        response = self.client.get(url + '&since=1')
+        eq_(response['X-Data-Version'], '2')
+        ok_({'2022-01-07', '2022-01-08'} <= set(days(response)))
+        ok_(all(day >= '2022-01-04' for day in days(response)))
+
+        # cached responses keep their version
+        with self.assertNumQueries(0):
+            eq_(self.client.get(url + '&since=1')['X-Data-Version'], '2')
+
+        eq_(days(self.client.get(url + '&since=2')), [])
+        eq_(days(self.client.get(url + '&since=2022-01-06')), ['2022-01-07', '2022-01-08'])
+        eq_(self.client.get(url + '&since=yesterday').status_code, 400)
+
+        response = self.client.get('/api/v1/rki/2022-01-08/?all&groups=total&since=1')
+        eq_(response['X-Data-Version'], '2')
+        eq_(len(days(response)), 4)
+
+    def test_replace_simulation_after_import(self):
+        run('import_scenario', os.path.join(self.path, 'scenario.json'))
+        run('import_simulation', os.path.join(self.path, 'simulation'))
+        simulation = Simulation.objects.get(key='synthetic')
+        nodes = set(simulation.nodes.values_list('id', flat=True))
+        counts = DataEntry.objects.count(), SimulationNode.objects.count(), ScenarioNode.objects.count()
+
+        run('import_simulation', os.path.join(self.path, 'simulation'), '--action', '3')
+
+        # the simulation keeps its id, the previous nodes and their data are deleted
+        replaced = Simulation.objects.get()
+        eq_((replaced.id, replaced.key, replaced.staging), (simulation.id, 'synthetic', False))
+        eq_(replaced.percentiles, [25, 75])
+        ok_(nodes.isdisjoint(replaced.nodes.values_list('id', flat=True)))
+        eq_((DataEntry.objects.count(), SimulationNode.objects.count(), ScenarioNode.objects.count()), counts)
+
+    def test_failed_replacement_keeps_the_simulation(self):
+        run('import_scenario', os.path.join(self.path, 'scenario.json'))
+        run('import_simulation', os.path.join(self.path, 'simulation'))
+        simulation = Simulation.objects.get(key='synthetic')
+        nodes = set(simulation.nodes.values_list('id', flat=True))
+        entries = DataEntry.objects.count()
+
+        os.remove(os.path.join(self.path, 'simulation', '75', 'Results_sum.h5'))
+        with assert_raises(CommandError):
+            run('import_simulation', os.path.join(self.path, 'simulation'), '--action', '3')
+
+        eq_(list(Simulation.objects.all()), [simulation])
+        eq_(set(simulation.nodes.values_list('id', flat=True)), nodes)
+        eq_(DataEntry.objects.count(), entries)
+
+
+class TestImportLocks(TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.path = self.temp_dir.name
+        run('generate_dataset', self.path, '--nodes', '2', '--days', '3', '--groups', 'total', '--percentiles', '50')
+        run('import_scenario', os.path.join(self.path, 'scenario.json'))
+
+        # another import, running in a different process
+        self.other = psycopg2.connect(**connection.get_connection_params())
+        self.other.autocommit = True
+
+    def tearDown(self):
+        self.other.close()
+        self.temp_dir.cleanup()
+
+    def lock(self, name, shared=False):
+        with self.other.cursor() as cursor:
+            cursor.execute('SELECT pg_advisory_lock{}(%s)'.format('_shared' if shared else ''), [lock_id(name)])
+
+    def unlock(self, name):
+        with self.other.cursor() as cursor:
+            cursor.execute('SELECT pg_advisory_unlock(%s)', [lock_id(name)])
+
+    def test_conflicting_imports_fail(self):
+        self.lock(simulation_lock('synthetic'))
+        with assert_raises(CommandError):
+            run('import_simulation', os.path.join(self.path, 'simulation'))
+        ok_(not Simulation.objects.exists())
+
+        # imports of other simulations of the scenario run in parallel
+        self.unlock(simulation_lock('synthetic'))
+        self.lock(simulation_lock('other'))
+        self.lock(scenario_lock('synthetic'), shared=True)
+        run('import_simulation', os.path.join(self.path, 'simulation'))
+        ok_(Simulation.objects.filter(key='synthetic').exists())
+
+        # the locks are released when the import is done
+        locks = ImportLocks()
+        locks.acquire(exclusive=[simulation_lock('synthetic'), REGIONS_LOCK])
+        locks.release()
+
+    def test_imports_wait_for_the_lock(self):
+        self.lock(scenario_lock('synthetic'))
+        threading.Timer(0.5, self.unlock, [scenario_lock('synthetic')]).start()
+
+        interval, ImportLocks.interval = ImportLocks.interval, 0.1
+        try:
+            run('import_simulation', os.path.join(self.path, 'simulation'), '--wait')
+        finally:
+            ImportLocks.interval = interval
+        ok_(Simulation.objects.filter(key='synthetic').exists())
+
+
+class TestBenchmarkApi(LiveServerTestCase):
+    @override_settings(METRICS_TOKEN='secret')
+    def test_benchmark_api(self):
+        create_simulation()
+
+        with tempfile.TemporaryDirectory() as path:
+            output = os.path.join(path, 'results.json')
+            run('benchmark_api', output, '--url', self.live_server_url, '--requests', '4', '--concurrency', '1', '2',
+                '--patterns', 'simulation_list', 'simulation_node', '--metrics-token', 'secret')
+
+            with open(output) as file:
+                results = json.load(file)['results']
+
+        eq_([(r['pattern'], r['concurrency']) for r in results],
+            [('simulation_list', 1), ('simulation_list', 2), ('simulation_node', 1), ('simulation_node', 2)])
+        for result in results:
+            eq_(result['errors'], 0)
+            eq_(result['requests'], 4)
+            ok_(result['p50'] <= result['p99'])
+            ok_(result['queries_per_request'] > 0)
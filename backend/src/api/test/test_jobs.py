@@ -0,0 +1,265 @@
+# SPDX-FileCopyrightText: 2024 German Aerospace Center (DLR)
+# SPDX-License-Identifier: Apache-2.0
+
+import io
+import os
+import shutil
+import tempfile
+
+import psycopg2
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, override_settings
+from nose.tools import eq_, ok_, assert_raises
+from rest_framework.test import APITestCase
+from rest_framework import status
+
+from src.users.test.factories import UserFactory
+from ..jobs import ImportCancelled, Progress
+from ..locks import lock_id, upload_lock
+from ..models import ImportJob, ImportUpload, Simulation
+from ..tasks import run_import
+
+
+class TestImportJobs(APITestCase):
+    """
+    Tests /importjobs operations.
+    """
+    def setUp(self):
+        self.url = '/api/v1/importjobs/'
+        self.temp_dir = tempfile.TemporaryDirectory()
+        call_command('generate_dataset', self.temp_dir.name, '--nodes', '2', '--days', '3', '--groups', 'total',
+                     '--percentiles', '50', stdout=io.StringIO())
+
+        self.settings = override_settings(IMPORT_DIR=self.temp_dir.name)
+        self.settings.enable()
+
+        self.admin = UserFactory(is_staff=True)
+        self.client.force_authenticate(user=self.admin)
+
+    def tearDown(self):
+        self.settings.disable()
+        self.temp_dir.cleanup()
+
+    def create(self, command, path, arguments=()):
+        # tasks run eagerly in tests, when the job is committed
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(self.url, {'command': command, 'path': path, 'arguments': list(arguments)})
+        eq_(response.status_code, status.HTTP_201_CREATED, response.data)
+        return ImportJob.objects.get(id=response.data['id'])
+
+    def test_only_admins_have_access(self):
+        self.client.force_authenticate(user=UserFactory())
+        eq_(self.client.get(self.url).status_code, status.HTTP_403_FORBIDDEN)
+
+        self.client.force_authenticate(user=None)
+        ok_(self.client.get(self.url).status_code in (status.HTTP_401_UNAUTHORIZED, status.HTTP_403_FORBIDDEN))
+
+    def test_path_must_be_inside_import_folder(self):
+        for path in ('../', '/etc', 'missing'):
+            response = self.client.post(self.url, {'command': 'import_rki', 'path': path})
+            eq_(response.status_code, status.HTTP_400_BAD_REQUEST)
+        eq_(ImportJob.objects.count(), 0)
+
+    def test_jobs_run_imports(self):
+        job = self.create('import_scenario', 'scenario.json')
+        eq_(job.status, ImportJob.Status.SUCCEEDED, job.error)
+
+        job = self.create('import_simulation', 'simulation')
+        eq_(job.status, ImportJob.Status.SUCCEEDED, job.error)
+        eq_(job.created_by.username, self.admin.username)
+        ok_(job.started is not None and job.finished is not None)
+        eq_([phase['name'] for phase in job.phases], ['Processing percentile 50', 'Computing regional rollups',
+                                                   'Warming up the response cache'])
+        ok_(Simulation.objects.filter(key='synthetic').exists())
+
+        response = self.client.get('{}{}/'.format(self.url, job.id))
+        eq_(response.data['status'], 'succeeded')
+        eq_(response.data['progress'], None)
+        eq_(len(response.data['phases']), 3)
+
+    def test_existing_simulation_fails_without_action(self):
+        self.create('import_scenario', 'scenario.json')
+        self.create('import_simulation', 'simulation')
+
+        job = self.create('import_simulation', 'simulation')
+        eq_(job.status, ImportJob.Status.FAILED)
+        ok_('an action is required' in job.error)
+
+        job = self.create('import_simulation', 'simulation', ['--action', '1'])
+        eq_(job.status, ImportJob.Status.SUCCEEDED, job.error)
+
+        job = self.create('import_simulation', 'simulation', ['--action', '3'])
+        eq_(job.status, ImportJob.Status.SUCCEEDED, job.error)
+        eq_(list(Simulation.objects.values_list('key', flat=True)), ['synthetic'])
+
+    def test_cancel(self):
+        job = ImportJob.objects.create(command='import_rki', path='rki')
+
+        response = self.client.post('{}{}/cancel/'.format(self.url, job.id))
+        eq_(response.status_code, status.HTTP_200_OK)
+        eq_(response.data['status'], 'cancelled')
+
+        # a cancelled job is not started by the worker anymore
+        run_import(job.id)
+        job.refresh_from_db()
+        eq_(job.status, ImportJob.Status.CANCELLED)
+        eq_(job.started, None)
+
+        response = self.client.post('{}{}/cancel/'.format(self.url, job.id))
+        eq_(response.status_code, status.HTTP_409_CONFLICT)
+
+        job = ImportJob.objects.create(command='import_rki', path='rki', status=ImportJob.Status.RUNNING)
+        response = self.client.post('{}{}/cancel/'.format(self.url, job.id))
+        eq_(response.data['status'], 'cancelling')
+
+
+class TestImportUploads(APITestCase):
+    """
+    Tests /importuploads operations.
+    """
+    def setUp(self):
+        self.url = '/api/v1/importuploads/'
+        self.temp_dir = tempfile.TemporaryDirectory()
+        path = os.path.join(self.temp_dir.name, 'dataset')
+        call_command('generate_dataset', path, '--nodes', '2', '--days', '3', '--groups', 'total',
+                     '--percentiles', '50', stdout=io.StringIO())
+        call_command('import_scenario', os.path.join(path, 'scenario.json'), stdout=io.StringIO())
+
+        with open(shutil.make_archive(path, 'zip', os.path.join(path, 'simulation')), 'rb') as file:
+            self.archive = file.read()
+
+        self.settings = override_settings(IMPORT_DIR=os.path.join(self.temp_dir.name, 'imports'))
+        self.settings.enable()
+
+        self.client.force_authenticate(user=UserFactory(is_staff=True))
+
+    def tearDown(self):
+        self.settings.disable()
+        self.temp_dir.cleanup()
+
+    def put(self, upload_id, first, last, data=None):
+        data = self.archive[first:last + 1] if data is None else data
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.client.put('{}{}/'.format(self.url, upload_id), data, content_type='application/octet-stream',
+                                   HTTP_CONTENT_RANGE='bytes {}-{}/{}'.format(first, last, len(self.archive)))
+
+    def create(self):
+        response = self.client.post(self.url, {'filename': 'simulation.zip', 'size': len(self.archive)})
+        eq_(response.status_code, status.HTTP_201_CREATED, response.data)
+        return response.data['id']
+
+    def test_only_admins_have_access(self):
+        self.client.force_authenticate(user=UserFactory())
+        eq_(self.client.post(self.url, {'filename': 'simulation.zip', 'size': 1}).status_code,
+            status.HTTP_403_FORBIDDEN)
+
+    def test_upload_in_chunks_is_imported(self):
+        upload_id = self.create()
+        size = len(self.archive)
+        chunk = size // 3 + 1
+
+        for first in range(0, size, chunk):
+            response = self.put(upload_id, first, min(first + chunk, size) - 1)
+            eq_(response.status_code, status.HTTP_200_OK, response.data)
+
+        upload = ImportUpload.objects.get(id=upload_id)
+        eq_(upload.received, size)
+        eq_(upload.job.status, ImportJob.Status.SUCCEEDED, upload.job.error)
+        ok_(Simulation.objects.filter(key='synthetic').exists())
+
+        eq_(self.put(upload_id, 0, 9).status_code, status.HTTP_409_CONFLICT)
+
+    def test_upload_resumes_at_received(self):
+        upload_id = self.create()
+
+        # the connection drops after 10 of 100 bytes
+        response = self.put(upload_id, 0, 99, data=self.archive[:10])
+        eq_(response.status_code, status.HTTP_400_BAD_REQUEST)
+        eq_(response.data['received'], 10)
+
+        response = self.put(upload_id, 50, 99)
+        eq_(response.status_code, status.HTTP_409_CONFLICT)
+        eq_(response.data['received'], 10)
+
+        response = self.put(upload_id, 10, len(self.archive) - 1)
+        eq_(response.status_code, status.HTTP_200_OK, response.data)
+        eq_(ImportUpload.objects.get(id=upload_id).job.status, ImportJob.Status.SUCCEEDED)
+
+    def test_chunks_are_written_one_after_another(self):
+        upload_id = self.create()
+
+        # another request writes a chunk of the upload
+        other = psycopg2.connect(**connection.get_connection_params())
+        try:
+            with other.cursor() as cursor:
+                cursor.execute('SELECT pg_advisory_lock(%s)', [lock_id(upload_lock(upload_id))])
+            eq_(self.put(upload_id, 0, 9).status_code, status.HTTP_409_CONFLICT)
+            eq_(ImportUpload.objects.get(id=upload_id).received, 0)
+        finally:
+            other.close()
+
+        eq_(self.put(upload_id, 0, 9).status_code, status.HTTP_200_OK)
+        eq_(ImportUpload.objects.get(id=upload_id).received, 10)
+
+    def test_invalid_archive_is_not_imported(self):
+        self.archive = b'not a zip file'
+        upload_id = self.create()
+
+        response = self.put(upload_id, 0, len(self.archive) - 1)
+        eq_(response.status_code, status.HTTP_400_BAD_REQUEST)
+        ok_('not a zip file' in response.data['error'])
+        eq_(ImportJob.objects.count(), 0)
+
+
+class TestProgress(TestCase):
+
+    def test_progress_is_recorded(self):
+        job = ImportJob.objects.create(command='import_rki', path='rki', status=ImportJob.Status.RUNNING)
+        progress = Progress(job.id)
+
+        with progress.phase('Loading', total=4) as step:
+            step(2)
+            progress.update(force=True)
+            job.refresh_from_db()
+            eq_(job.phase, 'Loading')
+            eq_(job.progress, 0.5)
+
+        job.refresh_from_db()
+        eq_([phase['name'] for phase in job.phases], ['Loading'])
+
+    def test_cancelling_stops_the_import(self):
+        job = ImportJob.objects.create(command='import_rki', path='rki', status=ImportJob.Status.RUNNING)
+        progress = Progress(job.id)
+
+        ImportJob.objects.filter(id=job.id).update(status=ImportJob.Status.CANCELLING)
+        with assert_raises(ImportCancelled):
+            list(progress.track(range(3), 'Processing nodes'))
+
+    def test_without_job(self):
+        progress = Progress()
+        eq_(list(progress.track(range(3), 'Processing nodes')), [0, 1, 2])
+        eq_([phase['name'] for phase in progress.phases], ['Processing nodes'])
+
+    def test_phase_timings(self):
+        progress = Progress(command='import_rki')
+
+        with progress.phase('Saving'):
+            with progress.timer('hdf5'):
+                pass
+            ImportJob.objects.create(command='import_rki', path='a')
+            ImportJob.objects.create(command='import_rki', path='b')
+            ImportJob.objects.update(progress=0.5)
+            list(ImportJob.objects.all())
+
+        phase = progress.phases[0]
+        eq_(phase['queries']['INSERT api_importjob']['count'], 2)
+        eq_(phase['queries']['UPDATE api_importjob']['rows'], 2)
+        eq_(phase['queries']['SELECT']['count'], 1)
+        # the rows written
+        eq_(phase['rows'], 4)
+        ok_('hdf5' in phase['timers'])
+        ok_(phase['database_seconds'] <= phase['seconds'])
+
+        report = progress.report()
+        eq_((report['command'], report['phases']), ('import_rki', [phase]))
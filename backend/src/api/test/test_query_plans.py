@@ -0,0 +1,189 @@
+# SPDX-FileCopyrightText: 2024 German Aerospace Center (DLR)
+# SPDX-License-Identifier: Apache-2.0
+
+"""
+Query plan regression tests of the data endpoints.
+
+Every endpoint is requested against a seeded database and the plans of its queries are checked with
+EXPLAIN (FORMAT JSON): tables with at least LARGE_TABLE_ROWS rows must not be scanned sequentially and the total
+cost must not exceed the recorded baseline in query_plans.json by more than COST_TOLERANCE.
+Seeding takes about a minute, so the tests only run with QUERY_PLAN_TESTS=1. Intended plan changes are recorded by
+running them with UPDATE_QUERY_PLANS=1 in addition.
+"""
+from datetime import date
+import json
+import os
+import unittest
+
+from django.db import connection
+from django.test import TestCase
+from rest_framework.test import APIClient
+from nose.tools import eq_
+
+import src.api.models as models
+from .factories import SimulationFactory
+
+LARGE_TABLE_ROWS = 10000
+COST_TOLERANCE = 2.0
+BASELINE = os.path.join(os.path.dirname(__file__), 'query_plans.json')
+
+START_DAY = date(2021, 1, 1)
+
+ENDPOINTS = {
+    'simulation_node': '/api/v1/simulation/{simulation}/{node}/?all&groups=total&compartments=MildInfections',
+    'simulation_node_range': '/api/v1/simulation/{simulation}/{node}/?all&groups=total&from=2021-03-01&to=2021-03-31',
+    'simulation_node_percentiles': '/api/v1/simulation/{simulation}/{node}/?all&groups=total&percentile=all',
+    'simulation_day': '/api/v1/simulation/{simulation}/{day}/?all&groups=total&compartments=MildInfections',
+    'rki_node': '/api/v1/rki/{node}/?all&groups=total&compartments=MildInfections',
+    'rki_day': '/api/v1/rki/{day}/?all&groups=total&compartments=MildInfections',
+}
+
+
+def add_data(owners, groups, percentiles, n_days):
+    """Adds one data entry per owner (simulation or RKI nodes), group, percentile and day, in SQL for speed."""
+    Model = type(owners[0])
+    OwnerData = Model.data.through
+
+    with connection.cursor() as cursor:
+        cursor.execute(
+            """
+            WITH entry AS MATERIALIZED (
+                SELECT nextval(pg_get_serial_sequence(%(entries)s, 'id')) AS id, owner.id AS owner, g.key AS group_key,
+                       p AS percentile, d AS day
+                FROM unnest(%(owners)s) AS owner(id), unnest(%(groups)s) AS g(key), unnest(%(percentiles)s) AS p,
+                     generate_series(0, %(days)s - 1) AS d
+            ), entries AS (
+                INSERT INTO {entries} (id, day, percentile, data, version)
+                SELECT id, %(start)s::date + day, percentile, jsonb_build_object('MildInfections', day), 0 FROM entry
+            ), groups AS (
+                INSERT INTO {groups} (dataentry_id, group_id) SELECT id, group_key FROM entry
+            )
+            INSERT INTO {owner_data} ({owner_field}, dataentry_id) SELECT owner, id FROM entry
+            """.format(entries=models.DataEntry._meta.db_table, groups=models.DataEntry.groups.through._meta.db_table,
+                       owner_data=OwnerData._meta.db_table, owner_field='{}_id'.format(Model._meta.model_name)),
+            {'entries': models.DataEntry._meta.db_table, 'owners': [owner.id for owner in owners],
+             'groups': list(groups), 'percentiles': list(percentiles), 'days': n_days, 'start': START_DAY})
+
+
+def seed(n_nodes=200, groups=('age_0', 'total'), percentiles=(25, 50, 75), n_days=365, n_rki_days=1000):
+    """
+    Creates a simulation and RKI data for n_nodes counties and returns the simulation.
+    The shares of the tables selected by a node or a day are close to production, so the planner faces the same choices.
+    """
+    nodes = list(models.Node.objects.filter(members__isnull=True).exclude(name='00000').order_by('name')[:n_nodes])
+
+    simulation = SimulationFactory(number_of_days=n_days, start_day=START_DAY)
+
+    scenario_nodes = models.ScenarioNode.objects.bulk_create([models.ScenarioNode(node=node) for node in nodes])
+    simulation.scenario.nodes.add(*scenario_nodes)
+    simulation_nodes = models.SimulationNode.objects.bulk_create(
+        [models.SimulationNode(scenario_node=scenario_node) for scenario_node in scenario_nodes])
+    simulation.nodes.add(*simulation_nodes)
+    add_data(simulation_nodes, groups, percentiles, n_days)
+
+    rki_nodes = models.RKINode.objects.bulk_create([models.RKINode(node=node) for node in nodes])
+    add_data(rki_nodes, groups, [50], n_rki_days)
+
+    simulation.refresh_metadata()
+
+    # check the deferred foreign keys once, instead of after every test
+    connection.check_constraints()
+
+    return simulation
+
+
+def walk(plan):
+    yield plan
+    for child in plan.get('Plans', []):
+        yield from walk(child)
+
+
+@unittest.skipUnless(os.getenv('QUERY_PLAN_TESTS') == '1', 'set QUERY_PLAN_TESTS=1 to run the query plan tests')
+class TestQueryPlans(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.simulation = seed()
+        cls.node = cls.simulation.nodes.first().scenario_node.node.name
+
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+            cursor.execute("SELECT relname, reltuples FROM pg_class WHERE relkind = 'r' AND reltuples >= %s",
+                           [LARGE_TABLE_ROWS])
+            cls.large_tables = {name for name, _ in cursor.fetchall()}
+
+    @classmethod
+    def setUpClass(cls):
+        cls.update = os.getenv('UPDATE_QUERY_PLANS') == '1'
+        with open(BASELINE) as file:
+            cls.baseline = json.load(file)
+
+        super().setUpClass()
+
+    @classmethod
+    def tearDownClass(cls):
+        if cls.update:
+            with open(BASELINE, 'w') as file:
+                json.dump(cls.baseline, file, indent=2, sort_keys=True)
+                file.write('\n')
+
+        super().tearDownClass()
+
+    def get_plans(self, url):
+        """Requests the url and returns the plans of its SELECT queries."""
+        queries = []
+
+        def record(execute, sql, params, many, context):
+            if sql.startswith('SELECT'):
+                queries.append((sql, params))
+            return execute(sql, params, many, context)
+
+        with connection.execute_wrapper(record):
+            response = APIClient().get(url)
+        eq_(response.status_code, 200)
+
+        plans = []
+        for sql, params in queries:
+            with connection.cursor() as cursor:
+                cursor.execute('EXPLAIN (FORMAT JSON) {}'.format(sql), params)
+                plans.append(cursor.fetchone()[0][0]['Plan'])
+
+        return plans
+
+    def check_plans(self, endpoint):
+        url = ENDPOINTS[endpoint].format(simulation=self.simulation.id, node=self.node, day='2021-06-15')
+        plans = self.get_plans(url)
+
+        seq_scans = sorted({
+            node['Relation Name'] for plan in plans for node in walk(plan)
+            if node['Node Type'] == 'Seq Scan' and node['Relation Name'] in self.large_tables
+        })
+        eq_(seq_scans, [], 'Sequential scans on {} for {}'.format(', '.join(seq_scans), url))
+
+        cost = sum(plan['Total Cost'] for plan in plans)
+        if self.update:
+            self.baseline[endpoint] = round(cost, 2)
+            return
+
+        self.assertIn(endpoint, self.baseline, 'No baseline cost for {}, run with UPDATE_QUERY_PLANS=1'.format(endpoint))
+        self.assertLessEqual(
+            cost, self.baseline[endpoint] * COST_TOLERANCE,
+            'Plan cost of {} jumped from {} to {:.2f}'.format(url, self.baseline[endpoint], cost))
+
+    def test_simulation_node(self):
+        self.check_plans('simulation_node')
+
+    def test_simulation_node_range(self):
+        self.check_plans('simulation_node_range')
+
+    def test_simulation_node_percentiles(self):
+        self.check_plans('simulation_node_percentiles')
+
+    def test_simulation_day(self):
+        self.check_plans('simulation_day')
+
+    def test_rki_node(self):
+        self.check_plans('rki_node')
+
+    def test_rki_day(self):
+        self.check_plans('rki_day')
@@ -0,0 +1,67 @@
+# SPDX-FileCopyrightText: 2024 German Aerospace Center (DLR)
+# SPDX-License-Identifier: Apache-2.0
+
+from datetime import date
+
+from django.test import TestCase
+from nose.tools import eq_, ok_
+from rest_framework.test import APITestCase
+from rest_framework import status
+
+from ..models import Node
+from ..rollups import compute_simulation_rollups, sum_entries
+from .factories import create_simulation
+
+
+class TestStateRegions(TestCase):
+    def test_states_contain_their_counties(self):
+        state = Node.objects.get(name='01')
+
+        eq_(state.metadata['label'], 'Schleswig-Holstein')
+        ok_(state.members.filter(name='01001').exists())
+        ok_(not state.members.filter(name='02000').exists())
+
+
+class TestSumEntries(TestCase):
+    def test_group_order_does_not_matter(self):
+        day = date(2021, 1, 1)
+        rows = [(day, 50, 'age_0,total', {'Dead': 1.0}), (day, 50, 'total,age_0', {'Dead': 2.0})]
+
+        entries = [entry for chunk in sum_entries(rows) for entry in chunk]
+        eq_(len(entries), 1)
+        eq_(entries[0].data, {'Dead': 3.0})
+        eq_(sorted(entries[0].groups.values_list('key', flat=True)), ['age_0', 'total'])
+
+
+class TestSimulationRollups(APITestCase):
+    def setUp(self):
+        self.simulation = create_simulation(nodes=('00000', '01001', '01002', '02000'), groups=('age_0', 'total'),
+                                            percentiles=(25, 75))
+        compute_simulation_rollups(self.simulation)
+        self.simulation.refresh_metadata()
+
+    def test_rollup_sums_members(self):
+        response = self.client.get(f'/api/v1/simulation/{self.simulation.id}/01/?all&groups=total&percentile=25')
+        eq_(response.status_code, status.HTTP_200_OK)
+
+        eq_(len(response.data), 3)
+        # node indices 1 and 2 -> (2 + 3) * 25
+        eq_(response.data[0]['compartments']['MildInfections'], 125.0)
+        eq_(response.data[2]['compartments']['Dead'], 4.0)
+
+    def test_recomputing_replaces_rollups(self):
+        compute_simulation_rollups(self.simulation)
+
+        response = self.client.get(f'/api/v1/simulation/{self.simulation.id}/01/?all&groups=total&percentile=25')
+        eq_(len(response.data), 3)
+        eq_(response.data[0]['compartments']['MildInfections'], 125.0)
+
+    def test_regions_are_excluded_from_metadata_and_day_map(self):
+        eq_(self.simulation.number_of_nodes, 4)
+
+        response = self.client.get(f'/api/v1/simulation/{self.simulation.id}/2021-01-01/?all&groups=total&percentile=25')
+        eq_(sorted(entry['name'] for entry in response.data), ['00000', '01001', '01002', '02000'])
+
+    def test_day_map_of_regions(self):
+        response = self.client.get(f'/api/v1/simulation/{self.simulation.id}/2021-01-01/?all&groups=total&percentile=25&regions')
+        eq_(sorted(entry['name'] for entry in response.data), ['01', '02'])
@@ -0,0 +1,103 @@
+# SPDX-FileCopyrightText: 2024 German Aerospace Center (DLR)
+# SPDX-License-Identifier: Apache-2.0
+
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from nose.tools import eq_, ok_
+from rest_framework.test import APITestCase
+from rest_framework import status
+
+from ..models import DataEntry
+from .factories import create_simulation
+
+
+class TestSimulationListTestCase(APITestCase):
+    """
+    Tests /simulations list operations.
+    """
+    def setUp(self):
+        self.url = '/api/v1/simulations/'
+
+    def test_simulation_metadata_is_recorded(self):
+        simulation = create_simulation(groups=('age_0', 'total'), percentiles=(25, 50, 75))
+
+        eq_(simulation.percentiles, [25, 50, 75])
+        eq_(simulation.groups, ['age_0', 'total'])
+        eq_(simulation.number_of_nodes, 2)
+
+    def test_list_returns_metadata(self):
+        create_simulation(percentiles=(5, 50, 95))
+
+        response = self.client.get(self.url)
+        eq_(response.status_code, status.HTTP_200_OK)
+
+        result = response.data['results'][0]
+        eq_(result['percentiles'], [5, 50, 95])
+        eq_(result['groups'], ['total'])
+        eq_(result['number_of_nodes'], 2)
+
+    def test_list_query_count_does_not_grow_with_simulations(self):
+        create_simulation()
+
+        with CaptureQueriesContext(connection) as single:
+            self.client.get(self.url)
+
+        create_simulation()
+        create_simulation()
+
+        with CaptureQueriesContext(connection) as multiple:
+            response = self.client.get(self.url)
+
+        eq_(len(response.data['results']), 3)
+        ok_(len(multiple) == len(single))
+
+
+class TestPercentileBandsTestCase(APITestCase):
+    """
+    Tests the all-percentile band mode of the data endpoints.
+    """
+    def setUp(self):
+        self.simulation = create_simulation(groups=('age_0', 'total'), percentiles=(25, 50, 75))
+
+    def test_single_percentile_is_default(self):
+        response = self.client.get(f'/api/v1/simulation/{self.simulation.id}/00000/?all&groups=total')
+        eq_(response.status_code, status.HTTP_200_OK)
+
+        eq_(len(response.data), 3)
+        eq_(response.data[0]['compartments']['MildInfections'], 50.0)
+
+    def test_node_bands(self):
+        response = self.client.get(f'/api/v1/simulation/{self.simulation.id}/00000/?all&groups=total&percentile=all')
+        eq_(response.status_code, status.HTTP_200_OK)
+
+        eq_(len(response.data), 3)
+        entry = response.data[1]
+        eq_(entry['day'], '2021-01-02')
+        eq_(entry['percentiles'], [25, 50, 75])
+        eq_(entry['compartments']['MildInfections'], [26.0, 51.0, 76.0])
+        eq_(entry['compartments']['Dead'], [1.0, 1.0, 1.0])
+
+    def test_day_bands_sum_groups(self):
+        response = self.client.get(
+            f'/api/v1/simulation/{self.simulation.id}/2021-01-01/?all&groups=age_0,total&percentile=all')
+        eq_(response.status_code, status.HTTP_200_OK)
+
+        bands = {entry['name']: entry for entry in response.data}
+        eq_(sorted(bands.keys()), ['00000', '01001'])
+        eq_(bands['01001']['compartments']['MildInfections'], [100.0, 200.0, 300.0])
+
+    def test_bands_are_paginated_whole(self):
+        # day 2021-01-02 of node 00000 lacks percentile 75
+        DataEntry.objects.filter(simulationnode__scenario_node__node__name='00000', day='2021-01-02',
+                                 percentile=75).delete()
+
+        response = self.client.get(
+            f'/api/v1/simulation/{self.simulation.id}/00000/?groups=total&percentile=all&limit=1&offset=1')
+        eq_(response.status_code, status.HTTP_200_OK)
+
+        eq_(response.data['count'], 3)
+        eq_(len(response.data['results']), 1)
+        entry = response.data['results'][0]
+        eq_(entry['day'], '2021-01-02')
+        eq_(entry['percentiles'], [25, 50, 75])
+        eq_(entry['compartments']['MildInfections'], [26.0, 51.0, None])
@@ -14,6 +14,8 @@ api_router.register(r'scenarios', views.ScenarioViewSet, basename='scenario')
 api_router.register(r'simulationmodels', views.SimulationModelViewSet, basename='simulationmodel')
 api_router.register(r'nodes', views.NodesViewSet, basename="node")
 api_router.register(r'simulations', views.SimulationsViewSet, basename="simulation")
+api_router.register(r'importjobs', views.ImportJobsViewSet, basename="importjob")
+api_router.register(r'importuploads', views.ImportUploadsViewSet, basename="importupload")
 
 
 urlpatterns = [
@@ -2,12 +2,26 @@
 # SPDX-License-Identifier: Apache-2.0
 
 # Create your views here.
-from rest_framework import viewsets, permissions, mixins, generics
+from rest_framework import viewsets, permissions, mixins, generics, status
+from rest_framework.decorators import action
+from rest_framework.response import Response
 
+from django.conf import settings
+from django.core.management.base import CommandError
+from django.db import transaction
 from django.db.models import Q
+from django.utils import timezone
+
+import os
+import re
 
 from src.api.models import *
-from src.api.classes import DataEntryFilterMixin
+from src.api.classes import DataEntryFilterMixin, DataVersionMixin
+from src.common.cache import CachedResponseMixin, RKI, SCENARIOS, simulation_scope
+
+from src.api.locks import ImportLocks, upload_lock
+from src.api.tasks import queue_import
+from src.api.management.commands.import_simulation import check_metadata, read_archive_metadata
 
 import src.api.serializers as serializers
 
@@ -22,14 +36,22 @@ class RestrictionsViewSet(mixins.ListModelMixin, viewsets.GenericViewSet):
 
 class NodesViewSet(mixins.ListModelMixin, viewsets.GenericViewSet):
     """
-    Return a list of all available nodes (e.g. counties)
+    Return a list of all available nodes (e.g. counties).
+    With 'regions' the region nodes (e.g. federal states) and their members are returned instead.
     """
-    queryset = Node.objects.all().order_by('id')
     serializer_class = serializers.NodeSerializer
     permission_classes = [permissions.AllowAny]
 
+    def get_queryset(self):
+        queryset = Node.objects.prefetch_related('members').order_by('id')
+
+        if 'regions' in self.request.query_params:
+            return queryset.filter(members__isnull=False).distinct()
 
-class ScenarioViewSet(mixins.ListModelMixin, mixins.RetrieveModelMixin, viewsets.GenericViewSet):
+        return queryset.filter(members__isnull=True)
+
+
+class ScenarioViewSet(CachedResponseMixin, mixins.ListModelMixin, mixins.RetrieveModelMixin, viewsets.GenericViewSet):
     """
     retrieve:
     Return all information for the given scenario.
@@ -39,6 +61,7 @@ class ScenarioViewSet(mixins.ListModelMixin, mixins.RetrieveModelMixin, viewsets
     """
     queryset = Scenario.objects.all().order_by('id')
     permission_classes = [permissions.AllowAny]
+    cache_scope = SCENARIOS
 
     serializers_ = {'list': serializers.ScenarioSerializerMeta, 'retrieve': serializers.ScenarioSerializerFull}
 
@@ -51,7 +74,7 @@ class SimulationsViewSet(mixins.ListModelMixin, viewsets.GenericViewSet):
     list:
     Return a list of all available simulations.
     """
-    queryset = Simulation.objects.all().order_by('id')
+    queryset = Simulation.objects.filter(staging=False).order_by('id')
     serializer_class = serializers.SimulationSerializerMeta
     permission_classes = [permissions.AllowAny]
 
@@ -74,11 +97,18 @@ class SimulationModelViewSet(mixins.ListModelMixin, mixins.RetrieveModelMixin, v
         return self.serializers_.get(self.action, serializers.SimulationModelSerializerMeta)
 
 
-class SimulationDataByNodeView(DataEntryFilterMixin, generics.GenericAPIView):
+class SimulationDataByNodeView(CachedResponseMixin, DataEntryFilterMixin, generics.GenericAPIView):
     
     serializer_class = serializers.SimulationDataSerializer
     permission_classes = [permissions.AllowAny]
 
+    def get_cache_scope(self):
+        return simulation_scope(self.kwargs['id'])
+
+    def get_band_percentiles(self, queryset):
+        # the percentiles stored with the simulation, so a missing one is part of the bands as well
+        return Simulation.objects.get(id=self.kwargs['id']).percentiles or super().get_band_percentiles(queryset)
+
     def get_queryset(self):
         simulationId = self.kwargs.get('id')
         nodeId = self.kwargs.get('nodeId')
@@ -95,16 +125,18 @@ class SimulationDataByNodeView(DataEntryFilterMixin, generics.GenericAPIView):
         return self.aggregateBy("day")
 
 
-class RkiDataByNodeView(DataEntryFilterMixin, generics.GenericAPIView):
+class RkiDataByNodeView(DataVersionMixin, CachedResponseMixin, DataEntryFilterMixin, generics.GenericAPIView):
     
     serializer_class = serializers.SimulationDataSerializer
     permission_classes = [permissions.AllowAny]
+    cache_scope = RKI
 
     def get_queryset(self):
         nodeId = self.kwargs.get('nodeId')
         node = RKINode.objects.get(node__name=nodeId)
 
-        return self.get_filtered_queryset(RKIData.objects.filter(rkinode_id=node)).order_by('day')
+        queryset = self.get_filtered_queryset(RKIData.objects.filter(rkinode_id=node)).order_by('day')
+        return self.filter_since(queryset, RKINode.objects.filter(id=node.id))
 
     def get(self, request, nodeId, format=None):
         return self.aggregateBy('day')
@@ -113,15 +145,22 @@ class RkiDataByNodeView(DataEntryFilterMixin, generics.GenericAPIView):
         return self.aggregateBy('day')
 
 
-class SimulationDataByDayView(DataEntryFilterMixin, generics.GenericAPIView):
+class SimulationDataByDayView(CachedResponseMixin, DataEntryFilterMixin, generics.GenericAPIView):
     serializer_class = serializers.SimulationDataSerializer
     permission_classes = [permissions.AllowAny]
 
+    def get_cache_scope(self):
+        return simulation_scope(self.kwargs['id'])
+
+    def get_band_percentiles(self, queryset):
+        # the percentiles stored with the simulation, so a missing one is part of the bands as well
+        return Simulation.objects.get(id=self.kwargs['id']).percentiles or super().get_band_percentiles(queryset)
+
     def get_queryset(self):
         simulationId = self.kwargs.get('id')
         nodes = SimulationNode.objects.filter(simulation=simulationId)
         
-        return self.get_filtered_queryset(SimulationData.objects.filter(simulationnode_id__in=nodes))
+        return self.get_filtered_queryset(self.filter_regions(SimulationData.objects.filter(simulationnode_id__in=nodes)))
 
     def get(self, request, id, day, format=None):
         return self.aggregateBy('name')
@@ -130,13 +169,15 @@ class SimulationDataByDayView(DataEntryFilterMixin, generics.GenericAPIView):
         return self.aggregateBy('name')
 
 
-class RkiDataByDayView(DataEntryFilterMixin, generics.GenericAPIView):
+class RkiDataByDayView(DataVersionMixin, CachedResponseMixin, DataEntryFilterMixin, generics.GenericAPIView):
 
     serializer_class = serializers.SimulationDataSerializer
     permission_classes = [permissions.AllowAny]
+    cache_scope = RKI
 
     def get_queryset(self):
-        return self.get_filtered_queryset(RKIData.objects.all())
+        queryset = self.get_filtered_queryset(self.filter_regions(RKIData.objects.all()))
+        return self.filter_since(queryset, RKINode.objects.all())
 
     def get(self, request, day, format=None):
         return self.aggregateBy('name')
@@ -159,4 +200,137 @@ class GroupsViewSet(mixins.ListModelMixin, viewsets.GenericViewSet):
     """
     queryset = Group.objects.all().order_by('name')
     serializer_class = serializers.GroupSerializer
-    permission_classes = [permissions.AllowAny]
\ No newline at end of file
+    permission_classes = [permissions.AllowAny]
+
+
+class ImportJobsViewSet(mixins.CreateModelMixin, mixins.ListModelMixin, mixins.RetrieveModelMixin,
+                        viewsets.GenericViewSet):
+    """
+    Imports running in the background on a worker (admin users only).
+    Creating a job queues the import of a path in the import folder, its status and progress are polled here.
+    """
+    queryset = ImportJob.objects.select_related('created_by').order_by('-id')
+    serializer_class = serializers.ImportJobSerializer
+    permission_classes = [permissions.IsAdminUser]
+
+    def perform_create(self, serializer):
+        queue_import(serializer.save(created_by=self.request.user))
+
+    @action(detail=True, methods=['post'])
+    def cancel(self, request, pk=None):
+        """
+        Cancel the job, a pending job is not started anymore and a running one stops at its next progress update.
+        """
+        job = self.get_object()
+
+        cancelled = ImportJob.objects.filter(id=job.id, status=ImportJob.Status.PENDING).update(
+            status=ImportJob.Status.CANCELLED, finished=timezone.now())
+        if not cancelled:
+            cancelled = ImportJob.objects.filter(id=job.id, status=ImportJob.Status.RUNNING).update(
+                status=ImportJob.Status.CANCELLING)
+        if not cancelled:
+            return Response({'error': 'Job is already finished'}, status=status.HTTP_409_CONFLICT)
+
+        job.refresh_from_db()
+        return Response(self.get_serializer(job).data)
+
+
+# e.g. 'bytes 0-1048575/5000000'
+CONTENT_RANGE = re.compile(r'bytes (\d+)-(\d+)/(\d+)')
+
+
+class ImportUploadsViewSet(mixins.CreateModelMixin, mixins.ListModelMixin, mixins.RetrieveModelMixin,
+                           viewsets.GenericViewSet):
+    """
+    Simulation archives (zip) uploaded in chunks and imported by a job once complete (admin users only).
+    Create the upload with the filename and size of the archive, then PUT it in chunks with a Content-Range header,
+    e.g. 'bytes 0-1048575/5000000'. An interrupted upload continues at 'received'.
+    """
+    queryset = ImportUpload.objects.select_related('created_by').order_by('-id')
+    serializer_class = serializers.ImportUploadSerializer
+    permission_classes = [permissions.IsAdminUser]
+
+    # Bytes read from the request body at once, so a chunk is never held in memory as a whole
+    read_size = 1024 * 1024
+
+    def perform_create(self, serializer):
+        upload = serializer.save(created_by=self.request.user)
+
+        path = os.path.join(settings.IMPORT_DIR, upload.path)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        open(path, 'wb').close()
+
+    def update(self, request, pk=None):
+        """
+        Write the chunk in the request body at the position of its Content-Range header.
+        The last chunk validates the metadata.json of the archive and queues its import.
+        """
+        match = CONTENT_RANGE.fullmatch(request.META.get('HTTP_CONTENT_RANGE', ''))
+        if match is None:
+            return Response({'error': 'Content-Range header "bytes <first>-<last>/<size>" is required'},
+                            status=status.HTTP_400_BAD_REQUEST)
+        first, last, size = map(int, match.groups())
+
+        upload = self.get_object()
+
+        # chunks of an upload are written one after another; the lock is not a transaction, so none is open while the
+        # body is read from a slow client
+        locks = ImportLocks()
+        try:
+            locks.acquire(exclusive=[upload_lock(upload.id)])
+        except CommandError:
+            return Response({'error': 'Another chunk of the upload is being written'}, status=status.HTTP_409_CONFLICT)
+
+        try:
+            upload.refresh_from_db()
+            return self.write_chunk(request, upload, first, last, size)
+        finally:
+            locks.release()
+
+    def write_chunk(self, request, upload, first, last, size):
+        """Writes the chunk in the request body, the caller holds the lock of the upload."""
+        if upload.is_complete:
+            return Response({'error': 'Upload is already complete'}, status=status.HTTP_409_CONFLICT)
+        if size != upload.size or last < first or last >= size:
+            return Response({'error': 'Invalid range {}-{}/{}'.format(first, last, size)},
+                            status=status.HTTP_400_BAD_REQUEST)
+        if first != upload.received:
+            return Response({'error': 'Upload continues at byte {}'.format(upload.received),
+                             'received': upload.received}, status=status.HTTP_409_CONFLICT)
+
+        path = os.path.join(settings.IMPORT_DIR, upload.path)
+        with open(path, 'r+b') as file:
+            file.seek(first)
+            remaining = last - first + 1
+            while remaining:
+                data = request.read(min(self.read_size, remaining))
+                if not data:
+                    break
+                file.write(data)
+                remaining -= len(data)
+            file.truncate()
+
+        # an incomplete chunk is kept, so the upload resumes after it
+        upload.received = last + 1 - remaining
+        upload.save(update_fields=['received'])
+
+        if remaining:
+            return Response({'error': 'Chunk ended {} bytes early'.format(remaining),
+                             'received': upload.received}, status=status.HTTP_400_BAD_REQUEST)
+
+        if upload.is_complete:
+            try:
+                check_metadata(read_archive_metadata(path))
+            except CommandError as e:
+                upload.error = str(e)
+                upload.save(update_fields=['error'])
+                os.remove(path)
+                return Response({'error': upload.error}, status=status.HTTP_400_BAD_REQUEST)
+
+            with transaction.atomic():
+                upload.job = ImportJob.objects.create(command=ImportJob.Command.SIMULATION, path=upload.path,
+                                                      arguments=upload.arguments, created_by=upload.created_by)
+                upload.save(update_fields=['job'])
+                queue_import(upload.job)
+
+        return Response(self.get_serializer(upload).data)
@@ -0,0 +1,73 @@
+# SPDX-FileCopyrightText: 2024 German Aerospace Center (DLR)
+# SPDX-License-Identifier: Apache-2.0
+
+"""
+Measurement helpers for the benchmark commands.
+"""
+import contextlib
+import resource
+import subprocess
+import sys
+import time
+
+from django.apps import apps
+from django.conf import settings
+from django.db import connections
+
+
+def count_rows(app_label='api'):
+    """Returns the number of rows in all tables of the app, including the many-to-many tables."""
+    return sum(
+        model.objects.count()
+        for model in apps.get_app_config(app_label).get_models(include_auto_created=True)
+        if model._meta.managed)
+
+
+def peak_rss():
+    """Returns the peak resident set size of this process in bytes."""
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss if sys.platform == 'darwin' else rss * 1024
+
+
+def git_commit():
+    """Returns the checked out commit or None outside of a git repository."""
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=settings.ROOT_DIR, capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class QueryCounter:
+    """Database execute wrapper counting the executed queries."""
+
+    def __init__(self):
+        self.queries = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.queries += 1
+        return execute(sql, params, many, context)
+
+
+def measure(func):
+    """Calls func and returns its wall time, number of written rows and queries, and the peak RSS of the process."""
+    rows = count_rows()
+    counter = QueryCounter()
+
+    with contextlib.ExitStack() as stack:
+        for connection in connections.all():
+            stack.enter_context(connection.execute_wrapper(counter))
+
+        start = time.perf_counter()
+        func()
+        seconds = time.perf_counter() - start
+
+    rows = count_rows() - rows
+
+    return {
+        'seconds': seconds,
+        'rows': rows,
+        'rows_per_second': rows / seconds if seconds > 0 else None,
+        'queries': counter.queries,
+        'peak_rss': peak_rss(),
+    }
@@ -0,0 +1,361 @@
+# SPDX-FileCopyrightText: 2024 German Aerospace Center (DLR)
+# SPDX-License-Identifier: Apache-2.0
+
+"""
+Cache of rendered API responses.
+
+Views with CachedResponseMixin store the rendered JSON of successful GET requests, keyed by scheme, host, path and query
+parameters (the links in the responses contain the host).
+Every key contains the generation of its scope (the scenarios, a simulation or the RKI data), so
+invalidate_responses() drops all cached responses of a scope at once. The new generation is published with a
+Postgres NOTIFY; the Listener of every process keeps its in-process copy of the generations current, so requests
+find their key without asking the cache first. Concurrent requests for a response that is not cached yet are
+coalesced within a process and, through a lock in the shared cache, across processes; only one of them computes it
+(see coalesce()). Responses read from a replica are only cached for
+DB_REPLICA_MAX_LAG seconds. warm_up() computes responses in advance for the host of SITE_URL, e.g. the hot queries
+of a new simulation (see RESPONSE_CACHE_WARM_UP); that needs a cache shared with the web workers (CACHE_URL).
+"""
+import hashlib
+import json
+import logging
+import os
+import select
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlencode, urlsplit
+
+import psycopg2
+from django.conf import settings
+from django.core.cache import cache, caches, DEFAULT_CACHE_ALIAS
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.db import connection
+from django.http import HttpResponse
+from django.test import RequestFactory
+from django.urls import resolve
+from rest_framework.response import Response
+
+from src.common.db.router import read_from_replica
+from src.common.metrics import RESPONSE_CACHE
+
+logger = logging.getLogger(__name__)
+
+CHANNEL = 'esid_data_changed'
+
+SCENARIOS = 'scenarios'
+RKI = 'rki'
+
+# request.META key of warm-up requests, it can't be set by a client
+WARM_UP = 'esid.response_cache_warm_up'
+
+# Cache backends that keep the responses in the process, a warm-up outside of the web workers is of no use with them
+LOCAL_CACHES = (LocMemCache, DummyCache)
+
+
+def simulation_scope(simulation_id):
+    return 'simulation:{}'.format(simulation_id)
+
+
+class Listener(threading.Thread):
+    """
+    Receives the generations published by invalidate_responses() in any process.
+    While listening, the generations are kept in memory, after a lost connection they are read from the cache again.
+    """
+
+    # Seconds between checks whether the listener was stopped, and before reconnecting after an error
+    interval = 1.0
+
+    def __init__(self):
+        super().__init__(name='response-cache-listener', daemon=True)
+        self.lock = threading.Lock()
+        self.generations = {}
+        self.listening = threading.Event()
+        self.stopped = threading.Event()
+
+    def run(self):
+        while not self.stopped.is_set():
+            try:
+                self.listen()
+            except (psycopg2.Error, OSError):
+                logger.exception('Listening for %s failed, reconnecting', CHANNEL)
+                self.stopped.wait(self.interval)
+
+    def listen(self):
+        conn = psycopg2.connect(**connection.get_connection_params())
+        try:
+            conn.autocommit = True
+            conn.cursor().execute('LISTEN {}'.format(CHANNEL))
+            self.listening.set()
+
+            while not self.stopped.is_set():
+                if select.select([conn], [], [], self.interval) == ([], [], []):
+                    continue
+                conn.poll()
+                while conn.notifies:
+                    payload = json.loads(conn.notifies.pop(0).payload)
+                    self.set(payload['scope'], payload['generation'])
+        finally:
+            # notifications may be missed until listening again
+            self.listening.clear()
+            with self.lock:
+                self.generations.clear()
+            conn.close()
+
+    def stop(self):
+        self.stopped.set()
+        self.join()
+
+    def get(self, scope):
+        """Returns the generation of the scope, reading it from the cache if it is not known."""
+        if not self.listening.is_set():
+            return read_generation(scope)
+
+        with self.lock:
+            if scope in self.generations:
+                return self.generations[scope]
+
+        value = read_generation(scope)
+        with self.lock:
+            # a generation received in the meantime is newer
+            return self.generations.setdefault(scope, value) if self.listening.is_set() else value
+
+    def set(self, scope, value):
+        with self.lock:
+            if self.listening.is_set():
+                self.generations[scope] = value
+
+
+_listener = None
+_listener_pid = None
+
+
+def get_listener():
+    """Returns the listener of this process, it is started on first use (and again in forked processes)."""
+    global _listener, _listener_pid
+
+    if _listener is None or _listener_pid != os.getpid():
+        _listener, _listener_pid = Listener(), os.getpid()
+        if settings.RESPONSE_CACHE_LISTEN:
+            _listener.start()
+
+    return _listener
+
+
+def read_generation(scope):
+    # a random generation, so an evicted generation never revives old responses
+    return cache.get_or_set('response:generation:{}'.format(scope), lambda: uuid.uuid4().hex, timeout=None)
+
+
+def invalidate_responses(*scopes):
+    """Drops all cached responses of the scopes in all processes, e.g. after data was imported."""
+    for scope in scopes:
+        value = uuid.uuid4().hex
+        cache.set('response:generation:{}'.format(scope), value, timeout=None)
+        get_listener().set(scope, value)
+
+        # delivered to the listeners when the current transaction is committed
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT pg_notify(%s, %s)', [CHANNEL, json.dumps({'scope': scope, 'generation': value})])
+
+
+def response_key(request, scope):
+    """Returns the cache key of the request, the order of the query parameters does not matter."""
+    query = urlencode(sorted(request.query_params.lists()), doseq=True)
+    url = '{}://{}{}?{}'.format(request.scheme, request.get_host(), request.path, query)
+    digest = hashlib.sha1(url.encode()).hexdigest()
+    return 'response:{}:{}:{}'.format(scope, get_listener().get(scope), digest)
+
+
+# Seconds between two lookups while another process computes a response, doubled after every lookup up to
+# POLL_MAX_INTERVAL
+POLL_INTERVAL = 0.01
+POLL_MAX_INTERVAL = 0.5
+
+# Responses being computed in this process by their key
+_flights = {}
+_flights_lock = threading.Lock()
+
+
+class Flight:
+    """The computation of a response, concurrent requests for it wait until it lands."""
+
+    def __init__(self, key):
+        self.key = key
+        self.lock_key = '{}:lock'.format(key)
+        self.locked = False
+        self.landed = threading.Event()
+
+    def land(self):
+        """Ends the computation, the waiting requests look the response up in the cache."""
+        if self.locked:
+            cache.delete(self.lock_key)
+            self.locked = False
+
+        with _flights_lock:
+            if _flights.get(self.key) is self:
+                del _flights[self.key]
+        self.landed.set()
+
+
+def coalesce(key):
+    """
+    Waits for a concurrent computation of the response with the key, in this process or (through a lock in the cache)
+    in another one. Returns the cached response, or None and the Flight to land if the caller computes it.
+    Without a response after RESPONSE_CACHE_COALESCE_SECONDS or a failed computation the caller computes it as well.
+    Other processes are polled with a growing interval, so a long computation costs few lookups.
+    """
+    timeout = settings.RESPONSE_CACHE_COALESCE_SECONDS
+
+    with _flights_lock:
+        flight = _flights.get(key)
+        computes = flight is None
+        if computes:
+            flight = _flights[key] = Flight(key)
+
+    if not computes:
+        flight.landed.wait(timeout)
+        return cache.get(key), None
+
+    # the lock expires with the wait, in case its process dies while computing
+    flight.locked = cache.add(flight.lock_key, True, timeout)
+
+    deadline = time.monotonic() + timeout
+    interval = POLL_INTERVAL
+    while True:
+        # the response may have landed since the caller looked it up
+        cached = cache.get(key)
+        if cached is not None:
+            flight.land()
+            return cached, None
+
+        remaining = deadline - time.monotonic()
+        if flight.locked or remaining <= 0:
+            return None, flight
+
+        time.sleep(min(interval, remaining))
+        interval = min(interval * 2, POLL_MAX_INTERVAL)
+        # the other process failed
+        flight.locked = cache.add(flight.lock_key, True, timeout)
+
+
+class CachedResponseMixin:
+    """
+    Serves GET requests of JSON from the response cache when RESPONSE_CACHE_TIMEOUT is set.
+    Authentication, permissions and throttling are checked before the lookup, as for any other request.
+    Views set cache_scope or override get_cache_scope() with the scope their data belongs to, and cached_headers with
+    the headers of their responses that are cached along with the content.
+    """
+    cache_scope = None
+    cached_headers = ()
+
+    def get_cache_scope(self):
+        return self.cache_scope
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+
+        self.response_key = None
+        if not settings.RESPONSE_CACHE_TIMEOUT or request.method != 'GET' or request.accepted_renderer.format != 'json':
+            return
+
+        self.response_key = response_key(request, self.get_cache_scope())
+        cached = cache.get(self.response_key)
+        result = 'hit'
+
+        if cached is None:
+            # finalize_response stores the response, dispatch lands the flight
+            cached, self.flight = coalesce(self.response_key)
+            result = 'miss' if cached is None else 'coalesced'
+
+        RESPONSE_CACHE.labels(type(self).__name__, result).inc()
+
+        if cached is not None:
+            content, content_type, *headers = cached
+            # replaces the handler for this request, as viewsets bind their actions
+            self.get = lambda *args, **kwargs: HttpResponse(content, content_type=content_type,
+                                                            headers=headers[0] if headers else None)
+            self.response_key = None
+
+    def dispatch(self, request, *args, **kwargs):
+        try:
+            return super().dispatch(request, *args, **kwargs)
+        finally:
+            # also after exceptions that DRF re-raises without finalizing a response, the waiting requests compute it
+            flight = getattr(self, 'flight', None)
+            if flight is not None:
+                flight.land()
+
+    def get_throttles(self):
+        if self.request.META.get(WARM_UP):
+            return []
+        return super().get_throttles()
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        # dispatch() lands the flight once the response is stored
+        key = getattr(self, 'response_key', None)
+        response = super().finalize_response(request, response, *args, **kwargs)
+
+        if key is not None and isinstance(response, Response) and response.status_code == 200:
+            response.render()
+            timeout = settings.RESPONSE_CACHE_TIMEOUT
+            if read_from_replica():
+                # it may miss an import that was committed on the primary shortly before
+                timeout = min(timeout, settings.DB_REPLICA_MAX_LAG)
+            headers = {name: response[name] for name in self.cached_headers if response.has_header(name)}
+            cache.set(key, (response.content, response['Content-Type'], headers), timeout)
+
+        return response
+
+
+def warm_up_url(url):
+    """Requests the url without a client, so its response is cached, and returns the status code."""
+    # as sent by the clients, so the response is cached under their key
+    site = urlsplit(settings.SITE_URL)
+    request = RequestFactory().get(url, secure=site.scheme == 'https', HTTP_HOST=site.netloc,
+                                   HTTP_ACCEPT='application/json', **{WARM_UP: True})
+    match = resolve(request.path_info)
+    return match.func(request, *match.args, **match.kwargs).status_code
+
+
+def warm_up(urls, workers=1, budget=None):
+    """
+    Caches the responses of the urls with up to workers requests in parallel and returns their status codes.
+    Requests not started within budget seconds are skipped, their status is None.
+    """
+    deadline = None if budget is None else time.monotonic() + budget
+
+    def run(url):
+        if deadline is not None and time.monotonic() > deadline:
+            return None
+        return warm_up_url(url)
+
+    if workers <= 1:
+        return [run(url) for url in urls]
+
+    def run_in_thread(url):
+        try:
+            return run(url)
+        finally:
+            connection.close()
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(run_in_thread, urls))
+
+
+def warm_up_simulation(simulation):
+    """Caches the hot queries of RESPONSE_CACHE_WARM_UP for the simulation and returns their status codes by url."""
+    if not settings.RESPONSE_CACHE_TIMEOUT:
+        return {}
+
+    if isinstance(caches[DEFAULT_CACHE_ALIAS], LOCAL_CACHES):
+        logger.warning('Skipping the warm-up of the response cache, it is local to this process (see CACHE_URL)')
+        return {}
+
+    urls = [url.format(simulation=simulation.id, scenario=simulation.scenario_id,
+                       start_day=simulation.start_day.strftime('%Y-%m-%d'))
+            for url in settings.RESPONSE_CACHE_WARM_UP]
+
+    return dict(zip(urls, warm_up(urls, settings.RESPONSE_CACHE_WARM_UP_WORKERS,
+                                  settings.RESPONSE_CACHE_WARM_UP_SECONDS)))
@@ -0,0 +1,200 @@
+# SPDX-FileCopyrightText: 2024 German Aerospace Center (DLR)
+# SPDX-License-Identifier: Apache-2.0
+
+"""
+PostgreSQL database backend with a per process connection pool and server-side prepared statements.
+
+Settings (in addition to the ones of django.db.backends.postgresql):
+- POOL_SIZE: number of idle connections kept open per process, 0 disables the pool.
+- PREPARED_STATEMENTS: run the queries on the data views as prepared statements, so their plans are reused.
+"""
+import functools
+import hashlib
+import itertools
+import queue
+import re
+import threading
+from collections import OrderedDict
+
+import psycopg2
+from psycopg2 import extensions
+from django.db.backends.postgresql import base
+
+# Only SELECTs on these relations are prepared, all other queries are executed as usual
+PREPARED_RELATIONS = ('"api_simulationdata"', '"api_rkidata"')
+
+PLACEHOLDERS = re.compile(r'%[s%]')
+
+# Maximum number of prepared statements per connection, the least recently used one is deallocated first
+MAX_PREPARED_STATEMENTS = 200
+
+
+class PreparingConnection(extensions.connection):
+    """psycopg2 connection that keeps track of the statements prepared on it."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.prepared = OrderedDict()
+
+
+class PreparingCursor(extensions.cursor):
+    """psycopg2 cursor that executes SELECTs on the data views as prepared statements."""
+
+    def execute(self, sql, params=None):
+        if self.name is not None or not sql.startswith('SELECT') or not any(r in sql for r in PREPARED_RELATIONS):
+            return super().execute(sql, params)
+
+        name = 'esid_{}'.format(hashlib.md5(sql.encode()).hexdigest())
+        prepared = self.connection.prepared
+
+        if name not in prepared:
+            prepared[name] = self.prepare(name, sql)
+
+            if len(prepared) > MAX_PREPARED_STATEMENTS:
+                evicted, is_prepared = prepared.popitem(last=False)
+                if is_prepared:
+                    super().execute('DEALLOCATE {}'.format(evicted))
+
+        prepared.move_to_end(name)
+
+        if not prepared[name]:
+            return super().execute(sql, params)
+
+        if not params:
+            return super().execute('EXECUTE {}'.format(name))
+
+        return super().execute('EXECUTE {} ({})'.format(name, ', '.join(['%s'] * len(params))), params)
+
+    def prepare(self, name, sql):
+        """Prepares the statement and returns whether that succeeded."""
+        counter = itertools.count(1)
+        # replace the client side placeholders by numbered parameters and unescape '%'
+        statement = PLACEHOLDERS.sub(lambda m: '%' if m.group() == '%%' else '${}'.format(next(counter)), sql)
+
+        # a failed PREPARE would abort the transaction of the caller, PREPARE itself is not undone by a rollback
+        in_transaction = not self.connection.autocommit
+        if in_transaction:
+            super().execute('SAVEPOINT esid_prepare')
+
+        try:
+            super().execute('PREPARE {} AS {}'.format(name, statement))
+        except psycopg2.ProgrammingError:
+            # e.g. parameter types that can't be inferred, the query is executed as usual
+            if in_transaction:
+                super().execute('ROLLBACK TO SAVEPOINT esid_prepare')
+                super().execute('RELEASE SAVEPOINT esid_prepare')
+            return False
+
+        if in_transaction:
+            super().execute('RELEASE SAVEPOINT esid_prepare')
+
+        return True
+
+
+class ConnectionPool:
+    """
+    Keeps up to 'size' idle connections open. Connections are checked before they are handed out again,
+    if none is idle a new one is opened.
+    """
+
+    def __init__(self, size):
+        self.size = size
+        self.idle = queue.LifoQueue()
+
+    def get(self, connect):
+        while True:
+            try:
+                connection = self.idle.get_nowait()
+            except queue.Empty:
+                return connect()
+
+            if self.is_usable(connection):
+                return connection
+
+            connection.close()
+
+    def put(self, connection):
+        if connection.closed:
+            return
+
+        try:
+            if connection.get_transaction_status() != extensions.TRANSACTION_STATUS_IDLE:
+                connection.rollback()
+            connection.autocommit = True
+            # the session state must not leak to the next user, e.g. the import locks (src.api.locks); DISCARD ALL
+            # would also drop the prepared statements the connection keeps track of
+            with connection.cursor() as cursor:
+                cursor.execute('SELECT pg_advisory_unlock_all()')
+                cursor.execute('RESET ALL')
+        except psycopg2.Error:
+            connection.close()
+            return
+
+        if self.idle.qsize() >= self.size:
+            connection.close()
+            return
+
+        self.idle.put(connection)
+
+    def close(self):
+        while True:
+            try:
+                self.idle.get_nowait().close()
+            except queue.Empty:
+                return
+
+    @staticmethod
+    def is_usable(connection):
+        if connection.closed:
+            return False
+
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute('SELECT 1')
+        except psycopg2.Error:
+            return False
+
+        return True
+
+
+pools = {}
+pools_lock = threading.Lock()
+
+
+def get_pool(conn_params, size):
+    key = repr(sorted(conn_params.items()))
+
+    with pools_lock:
+        if key not in pools:
+            pools[key] = ConnectionPool(size)
+
+        return pools[key]
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    pool = None
+
+    def get_connection_params(self):
+        return {**super().get_connection_params(), 'connection_factory': PreparingConnection}
+
+    def get_new_connection(self, conn_params):
+        size = self.settings_dict.get('POOL_SIZE', 0)
+
+        if size:
+            self.pool = get_pool(conn_params, size)
+            connection = self.pool.get(functools.partial(super().get_new_connection, conn_params))
+            self.isolation_level = connection.isolation_level
+        else:
+            connection = super().get_new_connection(conn_params)
+
+        if self.settings_dict.get('PREPARED_STATEMENTS', False):
+            connection.cursor_factory = PreparingCursor
+
+        return connection
+
+    def _close(self):
+        if self.connection is not None and self.pool is not None:
+            with self.wrap_database_errors:
+                return self.pool.put(self.connection)
+
+        return super()._close()
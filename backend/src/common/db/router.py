@@ -0,0 +1,138 @@
+# SPDX-FileCopyrightText: 2024 German Aerospace Center (DLR)
+# SPDX-License-Identifier: Apache-2.0
+
+"""
+Routes reads of the API data to read replicas of the database.
+
+Replicas are the databases named replica<n> in DATABASES (see DB_REPLICAS). Only reads of the api app during GET, HEAD
+and OPTIONS requests go to a replica (see ReplicaMiddleware), so import commands, jobs and requests that write read
+their own writes from the primary. The replication lag of each replica is checked at most every
+DB_REPLICA_CHECK_SECONDS per process. Replicas lagging more than DB_REPLICA_MAX_LAG seconds, or unreachable ones, are
+skipped until the next check; without a usable replica the primary is read.
+"""
+import contextlib
+import contextvars
+import logging
+import random
+import time
+
+from django.conf import settings
+from django.db import connections, DatabaseError, DEFAULT_DB_ALIAS
+
+logger = logging.getLogger(__name__)
+
+REPLICA_PREFIX = 'replica'
+
+# Models of the api app that are written during requests and read back right away
+PRIMARY_MODELS = ('api.importjob', 'api.importupload')
+
+# 0 while the replica has replayed all WAL it received, e.g. when the primary is idle
+LAG_QUERY = """
+    SELECT CASE
+        WHEN NOT pg_is_in_recovery() OR pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+        ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)
+    END
+"""
+
+
+class ReplicaReads:
+    """Reads of the current request may go to a replica, used tells whether one of them did."""
+
+    def __init__(self):
+        self.used = False
+
+
+_replica_reads = contextvars.ContextVar('replica_reads', default=None)
+
+
+@contextlib.contextmanager
+def replica_reads():
+    """Routes the reads of the API data within the block to the replicas."""
+    token = _replica_reads.set(ReplicaReads())
+    try:
+        yield _replica_reads.get()
+    finally:
+        _replica_reads.reset(token)
+
+
+def read_from_replica():
+    """Returns whether the current request read data from a replica, which may lag behind the primary."""
+    reads = _replica_reads.get()
+    return reads is not None and reads.used
+
+
+class ReplicaMiddleware:
+    """Lets requests that don't change data read from the replicas."""
+
+    safe_methods = ('GET', 'HEAD', 'OPTIONS')
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if request.method not in self.safe_methods:
+            return self.get_response(request)
+
+        with replica_reads():
+            return self.get_response(request)
+
+
+class ReplicaRouter:
+    """Database router sending reads to the replicas and everything else to the primary, see above."""
+
+    def __init__(self, replicas=None):
+        self.replicas = [alias for alias in connections if alias.startswith(REPLICA_PREFIX)] \
+            if replicas is None else replicas
+        # replication lag in seconds (None if unreachable) and time of the check by replica
+        self.lags = {}
+
+    def db_for_read(self, model, **hints):
+        reads = _replica_reads.get()
+        if reads is None or not settings.DB_REPLICA_READS or model._meta.app_label != 'api' \
+                or model._meta.label_lower in PRIMARY_MODELS:
+            return DEFAULT_DB_ALIAS
+
+        usable = self.usable_replicas()
+        if not usable:
+            return DEFAULT_DB_ALIAS
+
+        reads.used = True
+        return random.choice(usable)
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # the replicas hold the same data as the primary
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # the replicas receive the schema from the primary
+        return not db.startswith(REPLICA_PREFIX)
+
+    def usable_replicas(self):
+        """Returns the replicas lagging at most DB_REPLICA_MAX_LAG seconds, checking them if necessary."""
+        now = time.monotonic()
+        usable = []
+
+        for alias in self.replicas:
+            lag, checked = self.lags.get(alias, (None, None))
+            if checked is None or now - checked >= settings.DB_REPLICA_CHECK_SECONDS:
+                lag = self.replication_lag(alias)
+                self.lags[alias] = lag, now
+
+            if lag is not None and lag <= settings.DB_REPLICA_MAX_LAG:
+                usable.append(alias)
+
+        return usable
+
+    def replication_lag(self, alias):
+        """Returns the replication lag of the replica in seconds, None if it can't be reached."""
+        try:
+            with connections[alias].cursor() as cursor:
+                cursor.execute(LAG_QUERY)
+                return float(cursor.fetchone()[0])
+        except DatabaseError:
+            logger.warning('Replica %s is not available, reading from the primary', alias, exc_info=True)
+            connections[alias].close()
+            return None
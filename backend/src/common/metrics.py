@@ -0,0 +1,171 @@
+# SPDX-FileCopyrightText: 2024 German Aerospace Center (DLR)
+# SPDX-License-Identifier: Apache-2.0
+
+"""
+Per view request metrics, exposed in the Prometheus text format on /metrics to staff users and to scrapers sending
+METRICS_TOKEN.
+
+With multiple worker processes, PROMETHEUS_MULTIPROC_DIR has to point to an empty directory shared by all workers.
+Imports run outside of the workers, they push the timings of their phases to the Pushgateway instead
+(ImportMetrics).
+"""
+import contextlib
+import hmac
+import logging
+import os
+import time
+
+from django.conf import settings
+from django.db import connections
+from django.http import HttpResponse, HttpResponseForbidden
+from prometheus_client import CollectorRegistry, Counter, Gauge, Histogram, CONTENT_TYPE_LATEST, REGISTRY, \
+    generate_latest, push_to_gateway
+from prometheus_client import multiprocess
+
+logger = logging.getLogger(__name__)
+
+LABELS = ['view', 'method']
+
+TIME_BUCKETS = (.001, .0025, .005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5, 10, 30, 60)
+
+REQUEST_TIME = Histogram('esid_request_seconds', 'Total time spent on the request', LABELS, buckets=TIME_BUCKETS)
+DB_TIME = Histogram('esid_request_db_seconds', 'Time spent in database queries', LABELS, buckets=TIME_BUCKETS)
+VIEW_PYTHON_TIME = Histogram('esid_request_view_python_seconds',
+                             'Time spent in the view outside of database queries (filtering, aggregation and '
+                             'serialization)', LABELS, buckets=TIME_BUCKETS)
+RENDER_TIME = Histogram('esid_request_render_seconds', 'Time spent rendering the response', LABELS, buckets=TIME_BUCKETS)
+QUERIES = Histogram('esid_request_queries', 'Number of database queries', LABELS,
+                    buckets=(0, 1, 2, 3, 5, 10, 20, 50, 100, 200, 500, 1000))
+RESPONSE_SIZE = Histogram('esid_response_bytes', 'Size of the response body', LABELS,
+                          buckets=tuple(256 * 4**i for i in range(10)))
+RESPONSES = Counter('esid_responses', 'Number of responses', LABELS + ['status'])
+RESPONSE_CACHE = Counter('esid_response_cache', 'Lookups in the response cache, see src.common.cache',
+                         ['view', 'result'])
+
+
+class ImportMetrics:
+    """
+    Phase timings of one import run, pushed as a whole after every phase. Each run has its own registry, so a process
+    running several imports (e.g. a Celery worker) never pushes the phases of earlier runs again.
+    """
+
+    def __init__(self, command):
+        self.command = command
+        self.registry = CollectorRegistry()
+        self.phase_time = Gauge('esid_import_phase_seconds', 'Duration of the import phase', ['command', 'phase'],
+                                registry=self.registry)
+        self.phase_rows = Gauge('esid_import_phase_rows', 'Rows inserted, updated or deleted in the import phase',
+                                ['command', 'phase'], registry=self.registry)
+        self.query_time = Gauge('esid_import_query_seconds', 'Time spent in queries of the import phase by statement',
+                                ['command', 'phase', 'statement'], registry=self.registry)
+        self.query_rows = Gauge('esid_import_query_rows', 'Rows of the queries of the import phase by statement',
+                                ['command', 'phase', 'statement'], registry=self.registry)
+        self.timer_time = Gauge('esid_import_timer_seconds',
+                                'Time spent in timed work of the import phase (e.g. hdf5)',
+                                ['command', 'phase', 'timer'], registry=self.registry)
+
+    def push_phase(self, phase):
+        """Pushes the timings of a finished import phase (see src.api.jobs) to METRICS_PUSHGATEWAY."""
+        labels = (self.command, phase['name'])
+        self.phase_time.labels(*labels).set(phase['seconds'])
+        self.phase_rows.labels(*labels).set(phase['rows'])
+        for name, query in phase['queries'].items():
+            self.query_time.labels(*labels, name).set(query['seconds'])
+            self.query_rows.labels(*labels, name).set(query['rows'])
+        for name, seconds in phase['timers'].items():
+            self.timer_time.labels(*labels, name).set(seconds)
+
+        try:
+            push_to_gateway(settings.METRICS_PUSHGATEWAY, job='esid_import', grouping_key={'command': self.command},
+                            registry=self.registry)
+        except OSError:
+            # the import goes on without metrics
+            logger.warning('Pushing the import metrics to %s failed', settings.METRICS_PUSHGATEWAY, exc_info=True)
+
+
+class RequestMetrics:
+    """Collects the measurements of a single request."""
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.view_start = None
+        self.view_end = None
+        self.db_time = 0.0
+        self.queries = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        """Database execute wrapper, see https://docs.djangoproject.com/en/3.2/topics/db/instrumentation/"""
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.db_time += time.perf_counter() - start
+            self.queries += 1
+
+
+class MetricsMiddleware:
+    """Records per view timings, query counts and response sizes."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        metrics = request.metrics = RequestMetrics()
+
+        with contextlib.ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(metrics))
+
+            response = self.get_response(request)
+
+        end = time.perf_counter()
+
+        match = request.resolver_match
+        labels = (match.view_name if match is not None else '<unresolved>', request.method)
+
+        REQUEST_TIME.labels(*labels).observe(end - metrics.start)
+        DB_TIME.labels(*labels).observe(metrics.db_time)
+        QUERIES.labels(*labels).observe(metrics.queries)
+        RESPONSES.labels(*labels, response.status_code).inc()
+
+        if metrics.view_start is not None:
+            view_end = metrics.view_end if metrics.view_end is not None else end
+            VIEW_PYTHON_TIME.labels(*labels).observe(max(view_end - metrics.view_start - metrics.db_time, 0.0))
+            RENDER_TIME.labels(*labels).observe(end - view_end)
+
+        if not response.streaming:
+            RESPONSE_SIZE.labels(*labels).observe(len(response.content))
+
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        request.metrics.view_start = time.perf_counter()
+
+    def process_template_response(self, request, response):
+        # called right before the response (e.g. a DRF response) is rendered
+        request.metrics.view_end = time.perf_counter()
+        return response
+
+
+def is_metrics_client(request):
+    """Whether the request may read the metrics: a staff user or a scraper with the bearer token METRICS_TOKEN."""
+    if request.user.is_authenticated and request.user.is_staff:
+        return True
+
+    token = settings.METRICS_TOKEN
+    authorization = request.META.get('HTTP_AUTHORIZATION', '')
+    return bool(token) and hmac.compare_digest(authorization, 'Bearer {}'.format(token))
+
+
+def metrics_view(request):
+    """Returns all metrics in the Prometheus text format."""
+    if not is_metrics_client(request):
+        return HttpResponseForbidden()
+
+    if 'PROMETHEUS_MULTIPROC_DIR' in os.environ:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+
+    return HttpResponse(generate_latest(registry), content_type=CONTENT_TYPE_LATEST)
@@ -0,0 +1,130 @@
+# SPDX-FileCopyrightText: 2024 German Aerospace Center (DLR)
+# SPDX-License-Identifier: Apache-2.0
+
+"""
+Opt-in profiling of single requests and management commands.
+
+A request is profiled if it carries the query flag 'profile' or the header 'X-Profile' and the user is staff
+(session or JWT). Instead of the response, the profile report is returned as plain text.
+Management commands are profiled with 'python manage.py profile <report file> <command> [arguments]'.
+"""
+import cProfile
+import contextlib
+import functools
+import io
+import pstats
+import time
+
+from django.db import connections, DatabaseError
+from django.http import HttpResponse
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.authentication import JWTAuthentication
+
+
+class Profiler:
+    """Profiles the Python code and collects the database queries while it is active."""
+
+    def __init__(self):
+        self.profile = cProfile.Profile()
+        self.queries = {}
+        self.duration = 0.0
+
+    @contextlib.contextmanager
+    def activate(self):
+        with contextlib.ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(functools.partial(self.record, connection.alias)))
+
+            start = time.perf_counter()
+            self.profile.enable()
+            try:
+                yield self
+            finally:
+                self.profile.disable()
+                self.duration += time.perf_counter() - start
+
+    def record(self, alias, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            duration = time.perf_counter() - start
+
+            query = self.queries.setdefault((alias, sql), {'count': 0, 'time': 0.0, 'slowest': -1.0})
+            query['count'] += 1
+            query['time'] += duration
+            if duration > query['slowest'] and not many:
+                query.update(slowest=duration, params=params)
+
+    def explain(self, alias, sql, params):
+        """Returns the plan of the query, executing it once more with EXPLAIN ANALYZE."""
+        try:
+            with connections[alias].cursor() as cursor:
+                cursor.execute('EXPLAIN (ANALYZE, BUFFERS) {}'.format(sql), params)
+                return '\n'.join(row[0] for row in cursor.fetchall())
+        except DatabaseError as error:
+            return 'EXPLAIN failed: {}'.format(error)
+
+    def report(self, title, max_functions=40, max_explained=20):
+        """
+        Returns the report as text: the Python profile sorted by cumulative time and the queries sorted by total time.
+        The plans of the slowest SELECT queries are included.
+        """
+        out = io.StringIO()
+
+        total_queries = sum(query['count'] for query in self.queries.values())
+        total_time = sum(query['time'] for query in self.queries.values())
+
+        out.write('{}\n'.format(title))
+        out.write('Total {:.3f} s, {} queries in {:.3f} s\n\n'.format(self.duration, total_queries, total_time))
+
+        out.write('== Python profile (top {} by cumulative time) ==\n'.format(max_functions))
+        pstats.Stats(self.profile, stream=out).sort_stats('cumulative').print_stats(max_functions)
+
+        out.write('== Queries (by total time) ==\n\n')
+        queries = sorted(self.queries.items(), key=lambda item: item[1]['time'], reverse=True)
+        for index, ((alias, sql), query) in enumerate(queries):
+            out.write('-- {:.3f} s in {} executions on "{}"\n{}\n'.format(query['time'], query['count'], alias, sql))
+
+            if index < max_explained and 'params' in query and sql.lstrip().upper().startswith('SELECT'):
+                out.write('\n{}\n'.format(self.explain(alias, sql, query['params'])))
+
+            out.write('\n')
+
+        return out.getvalue()
+
+
+class ProfilingMiddleware:
+    """Returns the profile report instead of the response for requests that ask for it, see above."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not ('profile' in request.GET or 'HTTP_X_PROFILE' in request.META) or not self.is_authorized(request):
+            return self.get_response(request)
+
+        profiler = Profiler()
+        with profiler.activate():
+            response = self.get_response(request)
+
+        title = 'Profile of {} {} (status {})'.format(request.method, request.get_full_path(), response.status_code)
+
+        return HttpResponse(profiler.report(title), content_type='text/plain')
+
+    @staticmethod
+    def is_authorized(request):
+        user = request.user
+
+        if not user.is_authenticated:
+            try:
+                authenticated = JWTAuthentication().authenticate(request)
+            except AuthenticationFailed:
+                return False
+
+            if authenticated is None:
+                return False
+
+            user = authenticated[0]
+
+        return user.is_staff
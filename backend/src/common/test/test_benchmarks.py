@@ -0,0 +1,23 @@
+# SPDX-FileCopyrightText: 2024 German Aerospace Center (DLR)
+# SPDX-License-Identifier: Apache-2.0
+
+from nose.tools import eq_, ok_
+from django.test import TestCase
+
+from src.api.test.factories import ScenarioFactory
+from src.common.benchmarks import count_rows, measure
+
+
+class TestMeasure(TestCase):
+    def test_measure(self):
+        result = measure(lambda: ScenarioFactory.create_batch(2))
+
+        eq_(result['rows'], 2)
+        ok_(result['queries'] >= 2)
+        ok_(result['seconds'] > 0)
+        ok_(result['peak_rss'] > 0)
+
+    def test_count_rows_excludes_views(self):
+        before = count_rows()
+        ScenarioFactory()
+        eq_(count_rows(), before + 1)
@@ -0,0 +1,230 @@
+# SPDX-FileCopyrightText: 2024 German Aerospace Center (DLR)
+# SPDX-License-Identifier: Apache-2.0
+
+import json
+import multiprocessing
+import tempfile
+import threading
+import time
+
+import psycopg2
+from django.core.cache import cache
+from django.db import connection
+from django.test import override_settings, SimpleTestCase
+from django.test.utils import CaptureQueriesContext
+from nose.tools import eq_, ok_
+from rest_framework.test import APITestCase
+from rest_framework import status
+
+from src.api.test.factories import create_simulation
+from src.common.cache import _flights, coalesce, invalidate_responses, Listener, RKI, simulation_scope, \
+    warm_up_simulation
+
+
+def shared_cache(location):
+    """Uses a cache shared with other processes (a file based one in the folder location), as in production."""
+    return override_settings(CACHES={'default': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache', 'LOCATION': location}})
+
+
+@override_settings(RESPONSE_CACHE_TIMEOUT=60, RESPONSE_CACHE_WARM_UP_WORKERS=1, SITE_URL='http://testserver',
+                   RESPONSE_CACHE_WARM_UP=['/api/v1/simulation/{simulation}/00000/?all&groups=total'])
+class TestResponseCache(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.simulation = create_simulation()
+        self.url = f'/api/v1/simulation/{self.simulation.id}/00000/?all&groups=total'
+
+    def test_responses_are_cached(self):
+        response = self.client.get(self.url)
+        eq_(response.status_code, status.HTTP_200_OK)
+
+        with self.assertNumQueries(0):
+            cached = self.client.get(f'/api/v1/simulation/{self.simulation.id}/00000/?groups=total&all')
+        eq_(cached.status_code, status.HTTP_200_OK)
+        eq_(cached.content, response.content)
+        eq_(cached['Content-Type'], response['Content-Type'])
+
+    def test_hosts_are_cached_apart(self):
+        self.client.get(self.url)
+
+        # the responses link to their host
+        for extra in ({'HTTP_HOST': 'esid.example.org'}, {'secure': True}):
+            with CaptureQueriesContext(connection) as queries:
+                eq_(self.client.get(self.url, **extra).status_code, status.HTTP_200_OK)
+            ok_(len(queries) > 0)
+
+    def test_invalidate_responses(self):
+        self.client.get(self.url)
+
+        # only the responses of the affected scope are dropped
+        invalidate_responses(RKI, simulation_scope(self.simulation.id + 1))
+        with self.assertNumQueries(0):
+            self.client.get(self.url)
+
+        invalidate_responses(simulation_scope(self.simulation.id))
+        with CaptureQueriesContext(connection) as queries:
+            eq_(self.client.get(self.url).status_code, status.HTTP_200_OK)
+        ok_(len(queries) > 0)
+
+    def test_deleted_simulation_is_not_served(self):
+        self.client.get(self.url)
+        self.simulation.delete()
+
+        # unknown simulations fail with a server error
+        self.client.raise_request_exception = False
+        ok_(self.client.get(self.url).status_code != status.HTTP_200_OK)
+
+    def test_post_requests_are_not_cached(self):
+        eq_(self.client.post(self.url, {}).status_code, status.HTTP_200_OK)
+
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(self.url)
+        ok_(len(queries) > 0)
+
+        with CaptureQueriesContext(connection) as queries:
+            self.client.post(self.url, {})
+        ok_(len(queries) > 0)
+
+    def test_warm_up_simulation(self):
+        # the responses would only be cached in this process
+        eq_(warm_up_simulation(self.simulation), {})
+
+        with tempfile.TemporaryDirectory() as location, shared_cache(location):
+            eq_(warm_up_simulation(self.simulation), {self.url: status.HTTP_200_OK})
+
+            with self.assertNumQueries(0):
+                eq_(self.client.get(self.url).status_code, status.HTTP_200_OK)
+
+            # cached for the host of SITE_URL only
+            with override_settings(SITE_URL='https://esid.example.org'):
+                warm_up_simulation(self.simulation)
+            with self.assertNumQueries(0):
+                eq_(self.client.get(self.url, secure=True, HTTP_HOST='esid.example.org').status_code,
+                    status.HTTP_200_OK)
+
+    @override_settings(RESPONSE_CACHE_COALESCE_SECONDS=10)
+    def test_failed_request_lands_its_flight(self):
+        # unknown nodes raise RKINode.DoesNotExist, which DRF re-raises without finalizing a response
+        self.client.raise_request_exception = False
+        eq_(self.client.get('/api/v1/rki/99999/?all').status_code, status.HTTP_500_INTERNAL_SERVER_ERROR)
+        eq_(_flights, {})
+
+        start = time.monotonic()
+        eq_(self.client.get('/api/v1/rki/99999/?all').status_code, status.HTTP_500_INTERNAL_SERVER_ERROR)
+        ok_(time.monotonic() - start < 5)
+
+    def test_browsable_api_is_not_cached(self):
+        with tempfile.TemporaryDirectory() as location, shared_cache(location):
+            warm_up_simulation(self.simulation)
+
+            response = self.client.get(self.url, HTTP_ACCEPT='text/html')
+            ok_(response['Content-Type'].startswith('text/html'))
+
+
+class TestListener(APITestCase):
+    def test_generations_are_received(self):
+        listener = Listener()
+        listener.start()
+        try:
+            ok_(listener.listening.wait(10))
+            eq_(listener.generations, {})
+
+            # notifications are only delivered on commit, so they are sent from a separate connection
+            notifier = psycopg2.connect(**connection.get_connection_params())
+            notifier.autocommit = True
+            with notifier, notifier.cursor() as cursor:
+                cursor.execute('NOTIFY esid_data_changed, %s', [json.dumps({'scope': RKI, 'generation': 'abc'})])
+            notifier.close()
+
+            for _ in range(100):
+                if RKI in listener.generations:
+                    break
+                time.sleep(0.1)
+            eq_(listener.get(RKI), 'abc')
+        finally:
+            listener.stop()
+
+        ok_(not listener.listening.is_set())
+        eq_(listener.generations, {})
+
+
+def compute_in_process(key, started):
+    """Computes the response in another process, coalesce() waits for it through the lock in the shared cache."""
+    cached, flight = coalesce(key)
+    started.set()
+    time.sleep(0.5)
+    cache.set(key, 'computed')
+    flight.land()
+
+
+@override_settings(RESPONSE_CACHE_COALESCE_SECONDS=10)
+class TestCoalesce(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+
+    def compute(self, key, started, finish):
+        """Computes the response in a thread, once finish is set."""
+        def run():
+            cached, flight = coalesce(key)
+            started.set()
+            finish.wait(10)
+            cache.set(key, 'computed')
+            flight.land()
+
+        thread = threading.Thread(target=run)
+        thread.start()
+        return thread
+
+    def test_concurrent_requests_wait_for_the_computation(self):
+        started, finish = threading.Event(), threading.Event()
+        thread = self.compute('response:a', started, finish)
+        ok_(started.wait(10))
+
+        results = []
+        waiting = [threading.Thread(target=lambda: results.append(coalesce('response:a'))) for _ in range(3)]
+        for waiter in waiting:
+            waiter.start()
+
+        finish.set()
+        for waiter in waiting + [thread]:
+            waiter.join()
+
+        eq_(results, [('computed', None)] * 3)
+
+    def test_requests_wait_for_other_processes(self):
+        with tempfile.TemporaryDirectory() as location, shared_cache(location):
+            context = multiprocessing.get_context('fork')
+            started = context.Event()
+            process = context.Process(target=compute_in_process, args=('response:b', started))
+            process.start()
+            try:
+                ok_(started.wait(10))
+                start = time.monotonic()
+                eq_(coalesce('response:b'), ('computed', None))
+                ok_(time.monotonic() - start > 0.2)
+            finally:
+                process.join(10)
+            eq_(process.exitcode, 0)
+
+    @override_settings(RESPONSE_CACHE_COALESCE_SECONDS=0.3)
+    def test_requests_stop_waiting_for_other_processes(self):
+        # another process holds the lock but never stores the response
+        cache.set('response:d:lock', True)
+
+        start = time.monotonic()
+        cached, flight = coalesce('response:d')
+        ok_(cached is None and not flight.locked)
+        ok_(0.3 <= time.monotonic() - start < 2)
+        flight.land()
+        eq_(cache.get('response:d:lock'), True)
+
+    def test_failed_computation_is_computed_again(self):
+        cached, flight = coalesce('response:c')
+        ok_(cached is None and flight.locked)
+
+        # lands without a response, e.g. after an error, the lock is released so the next request computes it
+        flight.land()
+        cached, flight = coalesce('response:c')
+        ok_(cached is None and flight.locked)
+        flight.land()
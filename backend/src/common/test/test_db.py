@@ -0,0 +1,173 @@
+# SPDX-FileCopyrightText: 2024 German Aerospace Center (DLR)
+# SPDX-License-Identifier: Apache-2.0
+
+import os
+import time
+import unittest
+
+from django.db import connection, connections
+from django.test import override_settings, SimpleTestCase, TransactionTestCase
+from django.test.utils import CaptureQueriesContext
+from nose.tools import eq_, ok_
+from rest_framework.test import APITestCase
+
+from src.api.models import ImportJob, Simulation
+from src.api.test.factories import create_simulation
+from src.users.models import User
+from ..db.base import DatabaseWrapper
+from ..db.router import read_from_replica, replica_reads, ReplicaRouter
+
+
+class TestConnectionPool(SimpleTestCase):
+    def setUp(self):
+        self.wrapper = DatabaseWrapper({**connection.settings_dict, 'POOL_SIZE': 1}, alias='pooled')
+
+    def tearDown(self):
+        self.wrapper.close()
+        self.wrapper.pool.close()
+
+    def test_connections_are_reused(self):
+        self.wrapper.ensure_connection()
+        raw = self.wrapper.connection
+        self.wrapper.close()
+
+        ok_(not raw.closed)
+
+        self.wrapper.ensure_connection()
+        ok_(self.wrapper.connection is raw)
+
+    def test_session_state_is_reset(self):
+        self.wrapper.ensure_connection()
+        with self.wrapper.cursor() as cursor:
+            cursor.execute('SELECT pg_advisory_lock(4242)')
+            cursor.execute("SET statement_timeout = '5s'")
+        raw = self.wrapper.connection
+        self.wrapper.close()
+
+        self.wrapper.ensure_connection()
+        ok_(self.wrapper.connection is raw)
+        with self.wrapper.cursor() as cursor:
+            cursor.execute("SELECT count(*) FROM pg_locks WHERE locktype = 'advisory' AND pid = pg_backend_pid()")
+            eq_(cursor.fetchone()[0], 0)
+            cursor.execute('SHOW statement_timeout')
+            eq_(cursor.fetchone()[0], '0')
+
+    def test_broken_connections_are_replaced(self):
+        self.wrapper.ensure_connection()
+        raw = self.wrapper.connection
+        self.wrapper.close()
+
+        raw.close()
+
+        self.wrapper.ensure_connection()
+        ok_(self.wrapper.connection is not raw)
+        ok_(self.wrapper.is_usable())
+
+
+class TestPreparedStatements(APITestCase):
+    def prepared_statements(self):
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT name FROM pg_prepared_statements WHERE name LIKE 'esid_%%'")
+            return [row[0] for row in cursor.fetchall()]
+
+    def test_data_queries_are_prepared_once(self):
+        simulation = create_simulation()
+        url = f'/api/v1/simulation/{simulation.id}/00000/?all&groups=total&from=2021-01-02'
+
+        first = self.client.get(url)
+        prepared = self.prepared_statements()
+        ok_(len(prepared) > 0)
+
+        second = self.client.get(url)
+        eq_(self.prepared_statements(), prepared)
+        eq_(first.data, second.data)
+        eq_(len(second.data), 2)
+
+    def test_failed_prepare_keeps_the_transaction(self):
+        # the type of the parameter can't be inferred, the query runs unprepared in the transaction of the test
+        prepared = self.prepared_statements()
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT %s IS NULL FROM "api_rkidata"', [None])
+            eq_(cursor.fetchall(), [])
+            eq_(self.prepared_statements(), prepared)
+            eq_(Simulation.objects.count(), 0)
+
+
+class FakeLagRouter(ReplicaRouter):
+    def __init__(self, lags):
+        super().__init__(replicas=list(lags))
+        self.fake_lags = lags
+        self.checks = 0
+
+    def replication_lag(self, alias):
+        self.checks += 1
+        return self.fake_lags[alias]
+
+
+@override_settings(DB_REPLICA_READS=True, DB_REPLICA_MAX_LAG=10, DB_REPLICA_CHECK_SECONDS=60)
+class TestReplicaRouter(SimpleTestCase):
+
+    def test_only_data_reads_of_requests_go_to_replicas(self):
+        router = FakeLagRouter({'replica1': 0.0})
+        eq_(router.db_for_read(Simulation), 'default')
+
+        with replica_reads():
+            ok_(not read_from_replica())
+            eq_(router.db_for_read(User), 'default')
+            eq_(router.db_for_read(ImportJob), 'default')
+            ok_(not read_from_replica())
+
+            eq_(router.db_for_read(Simulation), 'replica1')
+            eq_(router.db_for_write(Simulation), 'default')
+            ok_(read_from_replica())
+
+        ok_(not read_from_replica())
+
+    def test_lagging_and_unreachable_replicas_are_skipped(self):
+        router = FakeLagRouter({'replica1': 30.0, 'replica2': None, 'replica3': 2.0})
+        with replica_reads():
+            eq_({router.db_for_read(Simulation) for _ in range(10)}, {'replica3'})
+
+            router.fake_lags['replica3'] = None
+            # the lag is only checked again after DB_REPLICA_CHECK_SECONDS
+            eq_(router.db_for_read(Simulation), 'replica3')
+            eq_(router.checks, 3)
+
+            with override_settings(DB_REPLICA_CHECK_SECONDS=0):
+                eq_(router.db_for_read(Simulation), 'default')
+
+    def test_migrations_only_run_on_the_primary(self):
+        router = FakeLagRouter({})
+        ok_(router.allow_migrate('default', 'api'))
+        ok_(not router.allow_migrate('replica1', 'api'))
+
+
+@unittest.skipUnless(os.getenv('REPLICA_TESTS') == '1' and 'replica1' in connections,
+                     'set REPLICA_TESTS=1 and DB_REPLICAS to a streaming replica to run the replica tests')
+@override_settings(DB_REPLICA_READS=True)
+class TestReplicas(TransactionTestCase):
+    """Runs against a streaming replica of the test database, which has to be committed so it is replicated."""
+    databases = '__all__'
+
+    def test_requests_read_from_the_replica(self):
+        simulation = create_simulation()
+        url = f'/api/v1/simulation/{simulation.id}/00000/?all&groups=total'
+
+        # wait until the simulation is replayed
+        router = ReplicaRouter()
+        for _ in range(100):
+            with connections['replica1'].cursor() as cursor:
+                cursor.execute('SELECT count(*) FROM api_simulation WHERE id = %s', [simulation.id])
+                if cursor.fetchone()[0] and router.replication_lag('replica1') == 0:
+                    break
+            time.sleep(0.1)
+
+        with CaptureQueriesContext(connections['replica1']) as replica, CaptureQueriesContext(connection) as primary:
+            response = self.client.get(url)
+        eq_(response.status_code, 200)
+        ok_(len(replica) > 0)
+        eq_(len(primary), 0)
+
+        with CaptureQueriesContext(connections['replica1']) as replica:
+            eq_(self.client.post(url, {}).status_code, 200)
+        eq_(len(replica), 0)
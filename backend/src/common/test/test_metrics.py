@@ -0,0 +1,48 @@
+# SPDX-FileCopyrightText: 2024 German Aerospace Center (DLR)
+# SPDX-License-Identifier: Apache-2.0
+
+from django.test import override_settings
+from nose.tools import eq_, ok_
+from prometheus_client import REGISTRY
+from rest_framework.test import APITestCase
+from rest_framework import status
+
+from src.api.test.factories import create_simulation
+from src.users.test.factories import UserFactory
+
+VIEW = 'src.api.views.SimulationDataByNodeView'
+
+
+def sample(name, **labels):
+    return REGISTRY.get_sample_value(name, {'view': VIEW, 'method': 'GET', **labels}) or 0
+
+
+class TestMetrics(APITestCase):
+    def test_request_is_measured(self):
+        simulation = create_simulation()
+
+        count = sample('esid_request_seconds_count')
+        queries = sample('esid_request_queries_sum')
+        size = sample('esid_response_bytes_sum')
+
+        response = self.client.get(f'/api/v1/simulation/{simulation.id}/00000/?all&groups=total')
+        eq_(response.status_code, status.HTTP_200_OK)
+
+        eq_(sample('esid_request_seconds_count'), count + 1)
+        eq_(sample('esid_request_render_seconds_count'), count + 1)
+        eq_(sample('esid_request_view_python_seconds_count'), count + 1)
+        ok_(sample('esid_request_queries_sum') > queries)
+        eq_(sample('esid_response_bytes_sum'), size + len(response.content))
+        ok_(sample('esid_responses_total', status='200') >= 1)
+
+    @override_settings(METRICS_TOKEN='secret')
+    def test_metrics_endpoint(self):
+        eq_(self.client.get('/metrics').status_code, status.HTTP_403_FORBIDDEN)
+        eq_(self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer wrong').status_code, status.HTTP_403_FORBIDDEN)
+
+        response = self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer secret')
+        eq_(response.status_code, status.HTTP_200_OK)
+        ok_(b'# TYPE esid_request_seconds histogram' in response.content)
+
+        self.client.force_login(UserFactory(is_staff=True))
+        eq_(self.client.get('/metrics').status_code, status.HTTP_200_OK)
@@ -0,0 +1,41 @@
+# SPDX-FileCopyrightText: 2024 German Aerospace Center (DLR)
+# SPDX-License-Identifier: Apache-2.0
+
+from nose.tools import eq_, ok_
+from rest_framework.test import APITestCase
+from rest_framework import status
+
+from src.api.test.factories import create_simulation
+from src.users.test.factories import UserFactory
+
+
+class TestProfilingMiddleware(APITestCase):
+    def setUp(self):
+        simulation = create_simulation()
+        self.url = f'/api/v1/simulation/{simulation.id}/00000/?all&groups=total&profile'
+
+    def test_profile_is_returned_to_staff(self):
+        self.client.force_login(UserFactory(is_staff=True))
+
+        response = self.client.get(self.url)
+        eq_(response.status_code, status.HTTP_200_OK)
+        eq_(response['Content-Type'], 'text/plain')
+
+        report = response.content.decode()
+        ok_('== Python profile' in report)
+        ok_('FROM "api_simulationdata"' in report)
+        ok_('Execution Time' in report)
+
+    def test_profile_with_jwt_and_header(self):
+        access_token = UserFactory(is_staff=True).get_tokens()['access']
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {access_token}', HTTP_X_PROFILE='1')
+
+        response = self.client.get(self.url.replace('&profile', ''))
+        eq_(response['Content-Type'], 'text/plain')
+
+    def test_profile_flag_is_ignored_for_other_users(self):
+        self.client.force_login(UserFactory())
+
+        response = self.client.get(self.url)
+        eq_(response.status_code, status.HTTP_200_OK)
+        eq_(len(response.data), 3)
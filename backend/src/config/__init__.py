@@ -0,0 +1,6 @@
+# SPDX-FileCopyrightText: 2024 German Aerospace Center (DLR)
+# SPDX-License-Identifier: Apache-2.0
+
+from .celery import app as celery_app
+
+__all__ = ('celery_app', )
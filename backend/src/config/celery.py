@@ -0,0 +1,15 @@
+# SPDX-FileCopyrightText: 2024 German Aerospace Center (DLR)
+# SPDX-License-Identifier: Apache-2.0
+
+"""
+Celery application of the background workers (see docker/entrypoint-queue.sh), configured by the CELERY_ settings.
+"""
+import os
+
+from celery import Celery
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'src.config.local')
+
+app = Celery('src')
+app.config_from_object('django.conf:settings', namespace='CELERY')
+app.autodiscover_tasks()
@@ -41,6 +41,8 @@ INSTALLED_APPS = (
 
 # https://docs.djangoproject.com/en/2.0/topics/http/middleware/
 MIDDLEWARE = (
+    'src.common.metrics.MetricsMiddleware',
+    'src.common.db.router.ReplicaMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'corsheaders.middleware.CorsMiddleware',
@@ -49,6 +51,7 @@ MIDDLEWARE = (
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'src.common.profiling.ProfilingMiddleware',
 )
 
 SECRET_KEY = os.getenv('DJANGO_SECRET_KEY', '#p7&kxb7y^yq8ahfw5%$xh=f8=&1y*5+a5($8w_f7kw!-qig(j')
@@ -64,15 +67,80 @@ CORS_ORIGIN_ALLOW_ALL = True
 # Database configuration
 DATABASES = {
     'default': {
-        'ENGINE': 'django.db.backends.postgresql',
+        'ENGINE': 'src.common.db',
         'HOST': os.getenv('DB_HOST'),
         'PORT': os.getenv('DB_PORT'),
         'NAME': os.getenv('DB_NAME'),
         'USER': os.getenv('DB_USER'),
         'PASSWORD': os.getenv('DB_PASSWORD'),
+        # Idle connections kept open per process (0 disables pooling), tests use fresh connections
+        'POOL_SIZE': 0 if TESTING else int(os.getenv('DB_POOL_SIZE', 10)),
+        # Run the data view queries as server-side prepared statements
+        'PREPARED_STATEMENTS': os.getenv('DB_PREPARED_STATEMENTS', 'True') == 'True',
     }
 }
 
+# Read replicas of the database (comma separated host:port), the API reads its data from them, see src.common.db.router
+for number, replica in enumerate(filter(None, os.getenv('DB_REPLICAS', '').split(',')), 1):
+    host, _, port = replica.strip().partition(':')
+    DATABASES['replica{}'.format(number)] = {
+        **DATABASES['default'],
+        'HOST': host,
+        'PORT': port or DATABASES['default']['PORT'],
+        # an unreachable replica must not block requests for long
+        'OPTIONS': {'connect_timeout': int(os.getenv('DB_REPLICA_CONNECT_TIMEOUT', 2))},
+        # tests use the test database replicated from the primary
+        'TEST': {'MIRROR': 'default'},
+    }
+
+DATABASE_ROUTERS = ['src.common.db.router.ReplicaRouter']
+# Tests read from the primary, as their data is not committed
+DB_REPLICA_READS = not TESTING
+# Replicas lagging behind the primary by more seconds are not read, responses read from them are cached as long
+DB_REPLICA_MAX_LAG = float(os.getenv('DB_REPLICA_MAX_LAG', 10))
+# Seconds between two checks of the replication lag per process
+DB_REPLICA_CHECK_SECONDS = float(os.getenv('DB_REPLICA_CHECK_SECONDS', 5))
+
+# Background jobs (see src.config.celery), tests run the tasks in place
+CELERY_BROKER_URL = os.getenv('CELERY_BROKER_URL', 'redis://localhost:6379/0')
+CELERY_TASK_ALWAYS_EAGER = TESTING
+# imports take minutes, so a worker only takes the next job when it is done
+CELERY_WORKER_PREFETCH_MULTIPLIER = 1
+
+# Import jobs read their data from this folder, paths of jobs are relative to it
+IMPORT_DIR = os.getenv('IMPORT_DIR', join(ROOT_DIR, 'imports'))
+# Prometheus Pushgateway (host:port) receiving the phase timings of imports with --push-metrics, see src.api.jobs
+METRICS_PUSHGATEWAY = os.getenv('METRICS_PUSHGATEWAY', '')
+# Bearer token of the Prometheus scraper for /metrics, which is only served to staff users without it
+METRICS_TOKEN = os.getenv('METRICS_TOKEN', '')
+
+# Cache shared by all workers (e.g. redis://localhost:6379/1), a cache per process without CACHE_URL
+if os.getenv('CACHE_URL'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django_redis.cache.RedisCache',
+            'LOCATION': os.getenv('CACHE_URL'),
+            # requests fall back to the database while redis is unavailable
+            'OPTIONS': {'IGNORE_EXCEPTIONS': True},
+        }
+    }
+
+# Rendered responses of the data endpoints are cached for this many seconds (0 disables it), see src.common.cache
+RESPONSE_CACHE_TIMEOUT = 0 if TESTING else int(os.getenv('RESPONSE_CACHE_TIMEOUT', 24 * 60 * 60))
+# Concurrent requests wait this many seconds at most for a response that is being computed by another request
+RESPONSE_CACHE_COALESCE_SECONDS = float(os.getenv('RESPONSE_CACHE_COALESCE_SECONDS', 30))
+# Keep the cache generations in memory, updated through Postgres notifications of the imports in other processes
+RESPONSE_CACHE_LISTEN = not TESTING
+# Responses computed after a simulation import, {simulation}, {scenario} and {start_day} are filled in
+RESPONSE_CACHE_WARM_UP = [
+    '/api/v1/scenarios/{scenario}/',
+    '/api/v1/simulation/{simulation}/00000/?all&groups=total',
+    '/api/v1/simulation/{simulation}/{start_day}/?all&groups=total&compartments=MildInfections',
+]
+RESPONSE_CACHE_WARM_UP_WORKERS = int(os.getenv('RESPONSE_CACHE_WARM_UP_WORKERS', 4))
+# Warm-up requests not started within this many seconds are skipped
+RESPONSE_CACHE_WARM_UP_SECONDS = float(os.getenv('RESPONSE_CACHE_WARM_UP_SECONDS', 60))
+
 
 # General
 APPEND_SLASH = True
@@ -16,6 +16,7 @@ from rest_framework_simplejwt.views import (
 from drf_yasg.views import get_schema_view
 from drf_yasg import openapi
 
+from src.common.metrics import metrics_view
 from src.users.urls import users_router
 from src.api.urls import api_router, urlpatterns as api_urlpatterns
 
@@ -47,6 +48,9 @@ urlpatterns += [
     path('api/v1/token/', TokenObtainPairView.as_view(), name='token_obtain_pair'),
     path('api/v1/token/refresh/', TokenRefreshView.as_view(), name='token_refresh'),
 
+    # prometheus metrics
+    path('metrics', metrics_view, name='metrics'),
+
     # swagger docs
     url(r'^swagger(?P<format>\.json|\.yaml)$', schema_view.without_ui(cache_timeout=0), name='schema-json'),
     url(r'^swagger/$', schema_view.with_ui('swagger', cache_timeout=0), name='schema-swagger-ui'),